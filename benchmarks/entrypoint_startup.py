@@ -0,0 +1,203 @@
+"""Container startup benchmark of the entrypoint, i.e. of the user provisioning in 'entrypoint_setup.sh'.
+
+Requires a running Docker daemon. By default a small stand-in image is built from 'ubuntu:22.04' with the
+packaged entrypoint and user fragments, so the benchmark does not depend on a full turludock image. Use
+'--image' to measure an existing image instead.
+
+The benchmarks measure the wall time of 'docker run ... true' for:
+
+    * first_start: A new container that provisions the 'DOCKER_USER_*' user.
+    * restart: Restarts of a container whose user is already provisioned.
+    * baked_user: A new container of an image with the user baked in at build time (stand-in image only,
+      or '--baked-image').
+    * root: A new container without 'DOCKER_USER_*' variables, i.e. without provisioning.
+
+The results are stored as JSON, by default in 'benchmarks/results/entrypoint-<commit>.json'.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from run_benchmarks import _get_commit, _summarize
+
+STAND_IN_IMAGE = "turludock-bench/entrypoint:latest"
+STAND_IN_BAKED_IMAGE = "turludock-bench/entrypoint:baked"
+
+# A user that differs from root, so the entrypoint provisions it
+USER_BUILD_ARGS = {
+    "DOCKER_USER_NAME": "bench",
+    "DOCKER_USER_ID": "1234",
+    "DOCKER_USER_GROUP_NAME": "bench",
+    "DOCKER_USER_GROUP_ID": "1234",
+}
+
+# The parts of the image the entrypoint relies on: the rc files, oh-my-zsh, the terminator config and zsh
+_STAND_IN_BASE = """FROM ubuntu:22.04
+
+RUN mkdir -p /opt/oh-my-zsh/custom /root/.config/terminator && ln -s /opt/oh-my-zsh /root/.oh-my-zsh && \\
+    echo 'export ZSH="/opt/oh-my-zsh"' > /root/.zshrc && \\
+    ln -s /bin/bash /usr/bin/zsh && echo /usr/bin/zsh >> /etc/shells
+COPY terminator_config /root/.config/terminator/config
+
+"""
+
+
+def _docker(*args: str) -> str:
+    """Run a docker command.
+
+    Args:
+        args (str): The arguments of the command, e.g. ['run', '--rm', 'IMAGE']
+
+    Returns:
+        str: The standard output of the command
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails
+    """
+    return subprocess.run(["docker", *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def _user_env() -> List[str]:
+    """Get the 'docker run' arguments that set the 'DOCKER_USER_*' variables.
+
+    Returns:
+        List[str]: The '-e' arguments
+    """
+    return [arg for name, value in USER_BUILD_ARGS.items() for arg in ("-e", f"{name}={value}")]
+
+
+def build_stand_in_images() -> None:
+    """Build the stand-in images, one without and one with the user baked in.
+
+    The build context holds the packaged assets, see 'build_context.write_build_context()'.
+    """
+    from turludock.build_context import write_build_context
+    from turludock.generate_non_templated_files import generate_entrypoint, generate_user
+
+    dockerfile = _STAND_IN_BASE + generate_entrypoint() + generate_user()
+    for tag, build_args in ((STAND_IN_IMAGE, dict()), (STAND_IN_BAKED_IMAGE, USER_BUILD_ARGS)):
+        command = ["docker", "build", "--quiet", "--tag", tag]
+        for name, value in build_args.items():
+            command += ["--build-arg", f"{name}={value}"]
+        with subprocess.Popen([*command, "-"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL) as process:
+            write_build_context(process.stdin, dockerfile)
+            process.stdin.close()
+        if process.returncode != 0:
+            raise RuntimeError(f"Could not build the stand-in image '{tag}'")
+
+
+def _time_run(args: List[str], repeat: int) -> List[float]:
+    """Measure the wall time of 'docker run --rm' until the container exits.
+
+    Args:
+        args (List[str]): The arguments of 'docker run', i.e. the options and the image
+        repeat (int): The number of runs
+
+    Returns:
+        List[float]: The duration of every run in seconds
+    """
+    samples = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _docker("run", "--rm", *args, "true")
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_restart(image: str, repeat: int) -> List[float]:
+    """Measure the wall time of restarting a container whose user is already provisioned.
+
+    The first start provisions the user and is not measured.
+
+    Args:
+        image (str): The image to start
+        repeat (int): The number of restarts
+
+    Returns:
+        List[float]: The duration of every restart in seconds
+    """
+    container = _docker("create", *_user_env(), image, "true")
+    try:
+        _docker("start", "--attach", container)
+        samples = list()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _docker("start", "--attach", container)
+            samples.append(time.perf_counter() - start)
+    finally:
+        _docker("rm", "--force", container)
+    return samples
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks.
+
+    Args:
+        argv (Optional[List[str]], optional): The command line arguments. Defaults to None, i.e. sys.argv.
+
+    Returns:
+        int: The exit status
+    """
+    parser = argparse.ArgumentParser(description="Container startup benchmark of the turludock entrypoint")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of runs of every benchmark (default: 10)")
+    parser.add_argument("--image", type=str, default=None, help="Image to measure (default: a stand-in image)")
+    parser.add_argument(
+        "--baked-image", type=str, default=None, help="Image with the user baked in, see 'build --bake-user'"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="Path of the JSON results (default: results/entrypoint-<commit>.json)",
+    )
+    args = parser.parse_args(argv)
+
+    image, baked_image = args.image, args.baked_image
+    if image is None:
+        print("Building the stand-in images...", flush=True)
+        build_stand_in_images()
+        image, baked_image = STAND_IN_IMAGE, STAND_IN_BAKED_IMAGE
+
+    results = {
+        "commit": _get_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "docker": _docker("version", "--format", "{{.Server.Version}}"),
+        "image": image,
+        "repeat": args.repeat,
+        "benchmarks": dict(),
+    }
+    benchmarks: Dict[str, Callable[[], List[float]]] = {
+        "first_start": lambda: _time_run([*_user_env(), image], args.repeat),
+        "restart": lambda: bench_restart(image, args.repeat),
+        "root": lambda: _time_run([image], args.repeat),
+    }
+    if baked_image is not None:
+        benchmarks["baked_user"] = lambda: _time_run([baked_image], args.repeat)
+    for name, bench in benchmarks.items():
+        print(f"Running {name}...", flush=True)
+        results["benchmarks"][name] = _summarize(bench())
+
+    for name, summary in results["benchmarks"].items():
+        print(f"  {name:<24} median {summary['median'] * 1000:9.1f} ms  min {summary['min'] * 1000:9.1f} ms")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"entrypoint-{results['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to '{output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
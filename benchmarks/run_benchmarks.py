@@ -0,0 +1,479 @@
+"""Offline benchmarks of the Dockerfile generation and the 'which' command.
+
+All remote version lookups are served by local stand-ins, so the results do not depend on the network:
+
+    * An HTTP server answers the GitHub tags API and serves a canned 'llvm.sh'
+      (see 'TURLUDOCK_GITHUB_API_URL' and 'TURLUDOCK_LLVM_SCRIPT_URL').
+    * Local bare git repositories answer 'git ls-remote' and the shallow clones of the source cache.
+      GitHub URLs are redirected to them with git's 'url.<base>.insteadOf'.
+
+The benchmarks measure:
+
+    * generate_cli: End-to-end latency of 'turludock generate' for every packaged preset, with cold lookups.
+    * generate_dockerfile: In-process throughput of checking and generating all packaged presets and a
+      synthetic configuration matrix, with warm lookups.
+    * which_*: Latency of the 'which' sub-commands.
+
+The results are stored as JSON, by default in 'benchmarks/results/<commit>.json'. Compare them with
+'--compare', e.g.:
+
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<baseline>.json
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest.mock
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# The canned tags of the stand-in repositories. The packaged presets pin 'v3.29.3' and '3.4'.
+CANNED_TAGS = {
+    "Kitware/CMake": ["v3.27.9", "v3.28.6", "v3.29.3", "v3.29.6", "v3.30.0-rc1"],
+    "tmux/tmux": ["3.2a", "3.3", "3.3a", "3.4"],
+}
+CANNED_LLVM_VERSIONS = [16, 17, 18, 19]
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers the GitHub tags API and serves 'llvm.sh'."""
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Serve a canned response."""
+        for repo, tags in CANNED_TAGS.items():
+            if self.path == f"/repos/{repo}/tags":
+                self._respond(json.dumps([{"name": tag} for tag in reversed(tags)]), "application/json")
+                return
+        if self.path == "/llvm.sh":
+            lines = [f'LLVM_VERSION_PATTERNS[{v}]="-{v}"' for v in CANNED_LLVM_VERSIONS]
+            self._respond("#!/bin/bash\n" + "\n".join(lines) + "\n", "text/plain")
+            return
+        self.send_error(404)
+
+    def _respond(self, body: str, content_type: str) -> None:
+        """Send a successful response.
+
+        Args:
+            body (str): The body of the response
+            content_type (str): The content type of the body
+        """
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Do not log the requests."""
+
+
+def _create_bare_repo(path: str, tags: List[str]) -> None:
+    """Create a bare git repository with a single commit carrying all given tags.
+
+    Args:
+        path (str): The path of the bare repository
+        tags (List[str]): The tags to create
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+
+        def git(*args: str) -> None:
+            subprocess.run(["git", "-C", work_dir, *args], check=True, stdout=subprocess.DEVNULL)
+
+        git("init", "--quiet")
+        with open(os.path.join(work_dir, "README"), "w", encoding="utf-8") as file:
+            file.write("turludock benchmark stand-in\n")
+        git("add", "README")
+        git("-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "--quiet", "-m", "stand-in")
+        for tag in tags:
+            git("tag", tag)
+        subprocess.run(["git", "clone", "--quiet", "--bare", work_dir, path], check=True)
+
+
+@contextlib.contextmanager
+def stand_ins() -> Iterator[Dict[str, str]]:
+    """Start the local stand-ins and redirect turludock to them.
+
+    The environment of this process is updated, so in-process runs and sub-processes both use the stand-ins.
+    The on-disk caches live in a temporary '$XDG_CACHE_HOME'.
+
+    Yields:
+        Dict[str, str]: The environment variables that were set
+    """
+    with tempfile.TemporaryDirectory(prefix="turludock-bench-") as temp_dir:
+        git_dir = os.path.join(temp_dir, "git")
+        for repo, tags in CANNED_TAGS.items():
+            _create_bare_repo(os.path.join(git_dir, f"{repo}.git"), tags)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        env = {
+            "TURLUDOCK_GITHUB_API_URL": base_url,
+            "TURLUDOCK_LLVM_SCRIPT_URL": f"{base_url}/llvm.sh",
+            "XDG_CACHE_HOME": os.path.join(temp_dir, "cache"),
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": f"url.file://{git_dir}/.insteadOf",
+            "GIT_CONFIG_VALUE_0": "https://github.com/",
+            "GIT_TERMINAL_PROMPT": "0",
+        }
+        previous_env = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            yield env
+        finally:
+            for key, value in previous_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            server.shutdown()
+            server.server_close()
+
+
+def _summarize(samples: List[float], **extra: Any) -> Dict[str, Any]:
+    """Summarize timing samples.
+
+    Args:
+        samples (List[float]): The measured durations in seconds
+        extra (Any): Additional values to store with the summary
+
+    Returns:
+        Dict[str, Any]: The median, minimum and maximum duration and the number of runs
+    """
+    summary = {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": len(samples),
+    }
+    summary.update(extra)
+    return summary
+
+
+def _time_command(args: List[str], repeat: int) -> List[float]:
+    """Measure the wall time of a turludock command.
+
+    Args:
+        args (List[str]): The arguments of the command, e.g. ['which', 'ros']
+        repeat (int): The number of runs
+
+    Returns:
+        List[float]: The duration of every run in seconds
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails
+    """
+    samples = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "turludock", *args],
+            cwd=REPO_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def get_synthetic_configs() -> List[Dict[str, Any]]:
+    """Create a configuration matrix over all ROS versions, GPU drivers, CUDA/cuDNN versions and packages.
+
+    Returns:
+        List[Dict[str, Any]]: The synthetic configurations
+    """
+    import turludock.constants as constants
+    from turludock.cuda_matrix import get_cuda_matrix
+    from turludock.helper_functions import get_ubuntu_version
+
+    package_sets = [
+        [{"cmake": "v3.29.3"}, {"tmux": "3.4"}, {"llvm": 18}, "meld"],
+        ["cmake", "tmux", "llvm", "vscode", "conan", "cpplint"],
+        [],
+    ]
+
+    configs = list()
+    for ros_version in constants.ROS_VERSION_MAP:
+        ubuntu_version = get_ubuntu_version(ros_version)["flat"]
+        gpu_configs = [{"gpu_driver": "mesa"}, {"gpu_driver": "nvidia"}]
+        cuda_matrix = get_cuda_matrix()
+        for cuda_version in cuda_matrix.get_supported_cuda_versions(ubuntu_version):
+            gpu_configs.append({"gpu_driver": "nvidia", "cuda_version": cuda_version})
+            for cudnn_version in cuda_matrix.get_compatible_cudnn_versions(cuda_version, ubuntu_version):
+                gpu_configs.append(
+                    {"gpu_driver": "nvidia", "cuda_version": cuda_version, "cudnn_version": cudnn_version}
+                )
+
+        for gpu_config, packages, strategy in itertools.product(
+            gpu_configs, package_sets, constants.CMAKE_INSTALL_STRATEGIES
+        ):
+            config = {"ros_version": ros_version, **gpu_config, "cmake_install_strategy": strategy}
+            if packages:
+                config["extra_packages"] = packages
+            config["filename"] = f"synthetic_{len(configs)}.yaml"
+            configs.append(config)
+    return configs
+
+
+def bench_generate_cli(repeat: int) -> Dict[str, Any]:
+    """Measure the end-to-end latency of 'turludock generate' for all packaged presets.
+
+    '--cache-ttl 0' makes every run query the stand-ins, like a first run on a new host.
+
+    Args:
+        repeat (int): The number of runs per preset
+
+    Returns:
+        Dict[str, Any]: The summary over all runs and the median of every preset
+    """
+    import turludock.default_image_config as default_image_config
+
+    samples = list()
+    per_preset = dict()
+    with tempfile.TemporaryDirectory() as out_dir:
+        for config_name in default_image_config.list_configuration_names():
+            preset_samples = _time_command(["generate", "-e", config_name, out_dir, "--cache-ttl", "0"], repeat)
+            per_preset[config_name] = statistics.median(preset_samples)
+            samples.extend(preset_samples)
+    return _summarize(samples, per_preset=per_preset)
+
+
+def _count_comments(dockerfile: str) -> Counter:
+    """Count the comment lines of a Dockerfile and the orphaned ones, i.e. those not followed by an instruction.
+
+    Args:
+        dockerfile (str): The Dockerfile or the concatenated fragments
+
+    Returns:
+        Counter: The number of occurrences of every comment line and of every orphaned comment line
+    """
+    counts: Counter = Counter()
+    comments: List[str] = list()
+    for line in [line.strip() for line in dockerfile.splitlines()] + [""]:
+        if line.startswith("#"):
+            comments.append(line)
+            continue
+        counts.update(comments)
+        # Comments followed by an empty line or the end of the Dockerfile describe no instruction
+        if not line:
+            counts.update(("orphaned", comment) for comment in comments)
+        comments = list()
+    return counts
+
+
+def check_comments(config: Dict[str, Any]) -> None:
+    """Check that generating a Dockerfile keeps every comment of its fragments at most once and orphans none.
+
+    The optimization passes merge and remove instructions, which must hand over their comments exactly once,
+    see 'dockerfile_ir._remove()'. The comments that describe aggregated apt installs are new, but must not be
+    duplicated or orphaned either, see 'dockerfile_ir.aggregate_apt_installs()'.
+
+    Args:
+        config (Dict[str, Any]): The configuration
+
+    Raises:
+        AssertionError: If a comment is duplicated or orphaned
+    """
+    import turludock.dockerfile_ir as dockerfile_ir
+    from turludock.generate_dockerfile import generate_dockerfile
+
+    fragments = list()
+    parse_fragment = dockerfile_ir.parse_fragment
+
+    def recording_parse_fragment(fragment_text: str, fragment: str) -> List[dockerfile_ir.Instruction]:
+        fragments.append(fragment_text)
+        return parse_fragment(fragment_text, fragment)
+
+    with unittest.mock.patch.object(dockerfile_ir, "parse_fragment", recording_parse_fragment):
+        dockerfile = generate_dockerfile(config)
+    added = _count_comments(dockerfile) - _count_comments("".join(fragments))
+    for comment, count in list(added.items()):
+        if isinstance(comment, str) and comment.startswith(("# Set up ", "# Install the apt packages of ")):
+            added[comment] = count - 1
+    added = +added
+    if added:
+        raise AssertionError(f"Duplicated or orphaned comments in '{config['filename']}': {list(added)}")
+
+
+def bench_generate_dockerfile(repeat: int) -> Dict[str, Any]:
+    """Measure the in-process throughput of checking and generating Dockerfiles.
+
+    Covers all packaged presets and the synthetic configuration matrix. The lookups are warmed up first,
+    so only the generation itself is measured. The warm-up pass also checks the comments of every generated
+    Dockerfile, see 'check_comments()'.
+
+    Args:
+        repeat (int): The number of passes over all configurations
+
+    Returns:
+        Dict[str, Any]: The summary of the passes, the number of configurations and the configurations per second
+    """
+    from loguru import logger
+
+    import turludock.default_image_config as default_image_config
+    from turludock.config_parser import check_dockerfile_config
+    from turludock.generate_dockerfile import generate_dockerfile
+
+    # generate_dockerfile() prints the configuration and logs, which is not part of the measurement
+    logger.remove()
+    configs = [default_image_config.get_yaml_config(name) for name in default_image_config.list_configuration_names()]
+    configs += get_synthetic_configs()
+
+    def run_pass() -> None:
+        for config in configs:
+            check_dockerfile_config(config)
+            generate_dockerfile(config)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for config in configs:
+            check_dockerfile_config(config)
+            check_comments(config)
+        samples = list()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_pass()
+            samples.append(time.perf_counter() - start)
+    return _summarize(samples, configs=len(configs), configs_per_second=len(configs) / statistics.median(samples))
+
+
+def bench_which(repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Measure the latency of the 'which' sub-commands.
+
+    Args:
+        repeat (int): The number of runs per sub-command
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The summary of every sub-command
+    """
+    commands = {
+        "which_ros": ["which", "ros"],
+        "which_cuda": ["which", "cuda", "humble"],
+        "which_presets": ["which", "presets"],
+        "which_presets_validate": ["which", "presets", "--validate"],
+    }
+    return {name: _summarize(_time_command(args, repeat)) for name, args in commands.items()}
+
+
+def _get_commit() -> str:
+    """Get the short hash of the current commit, with suffix '-dirty' for uncommitted changes.
+
+    Returns:
+        str: The commit, or 'unknown' outside of a git repository
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "-C", REPO_DIR, "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "-dirty" if status.strip() else commit
+
+
+def compare_results(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the change of the median of every benchmark against a baseline.
+
+    Args:
+        results (Dict[str, Any]): The current results
+        baseline (Dict[str, Any]): The baseline results
+    """
+    print(f"\nCompared to {baseline['commit']}:")
+    for name, summary in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            print(f"  {name:<24} {summary['median'] * 1000:9.1f} ms  (new)")
+            continue
+        base_median = baseline["benchmarks"][name]["median"]
+        change = (summary["median"] - base_median) / base_median * 100
+        print(f"  {name:<24} {base_median * 1000:9.1f} ms -> {summary['median'] * 1000:9.1f} ms  ({change:+.1f}%)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks.
+
+    Args:
+        argv (Optional[List[str]], optional): The command line arguments. Defaults to None, i.e. sys.argv.
+
+    Returns:
+        int: The exit status
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmarks of turludock")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of every benchmark (default: 5)")
+    parser.add_argument(
+        "--only",
+        choices=["generate_cli", "generate_dockerfile", "which"],
+        action="append",
+        help="Only run the given benchmark. Can be repeated.",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="Path of the JSON results (default: results/<commit>.json)"
+    )
+    parser.add_argument("--compare", type=str, metavar="BASELINE", default=None, help="JSON results to compare to")
+    args = parser.parse_args(argv)
+
+    benchmarks: Dict[str, Callable[[int], Dict[str, Any]]] = {
+        "generate_cli": bench_generate_cli,
+        "generate_dockerfile": bench_generate_dockerfile,
+        "which": bench_which,
+    }
+    selected = args.only or list(benchmarks)
+
+    results = {
+        "commit": _get_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "benchmarks": dict(),
+    }
+    with stand_ins():
+        for name in selected:
+            print(f"Running {name}...", flush=True)
+            summary = benchmarks[name](args.repeat)
+            # 'which' measures several sub-commands
+            if name == "which":
+                results["benchmarks"].update(summary)
+            else:
+                results["benchmarks"][name] = summary
+
+    for name, summary in results["benchmarks"].items():
+        print(f"  {name:<24} median {summary['median'] * 1000:9.1f} ms  min {summary['min'] * 1000:9.1f} ms")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"{results['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to '{output}'")
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            compare_results(results, json.load(file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Startup budget of the turludock CLI, a regression guard for the lazy imports of the sub-commands.
+
+Every checked command runs with 'python -X importtime'. The check fails if
+
+    * the median import time of a command exceeds its budget, or
+    * a command imports one of the heavy modules that only 'build', 'generate' and 'lock' need.
+
+The budgets leave headroom for slower machines. A failure usually means that a module-level import of a
+heavy dependency slipped into a module that every command loads, see the note in 'turludock/__main__.py'.
+
+    python benchmarks/startup_budget.py
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from run_benchmarks import REPO_DIR
+
+# The checked commands and their budget of the import time in milliseconds
+STARTUP_BUDGETS_MS = {
+    "--version": 250.0,
+    "which ros": 250.0,
+}
+
+# Modules that the checked commands must not import
+HEAVY_MODULES = ["docker", "requests", "yaml"]
+
+
+def measure_imports(args: List[str]) -> Tuple[float, List[str]]:
+    """Run a turludock command with 'python -X importtime'.
+
+    Args:
+        args (List[str]): The arguments of the command, e.g. ['which', 'ros']
+
+    Returns:
+        Tuple[float, List[str]]: The total import time in milliseconds and the imported modules
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "turludock", *args],
+        cwd=REPO_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stderr
+
+    # Lines look like 'import time:       107 |        107 | turludock', the nesting is indented
+    total_us = 0
+    modules = list()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, module = line.split(":", 1)[1].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        total_us += int(self_us)
+        modules.append(module.strip())
+    return total_us / 1000, modules
+
+
+def check_startup(repeat: int, budgets: Dict[str, float]) -> bool:
+    """Check the import time and the imported modules of every command against its budget.
+
+    Args:
+        repeat (int): The number of runs per command
+        budgets (Dict[str, float]): The budget in milliseconds of each command
+
+    Returns:
+        bool: True if all commands are within their budget
+    """
+    ok = True
+    for command, budget_ms in budgets.items():
+        samples = list()
+        heavy_modules = set()
+        for _ in range(repeat):
+            import_ms, modules = measure_imports(command.split())
+            samples.append(import_ms)
+            heavy_modules.update(module for module in modules if module.split(".")[0] in HEAVY_MODULES)
+        median_ms = statistics.median(samples)
+        status = "ok"
+        if median_ms > budget_ms:
+            status = "OVER BUDGET"
+            ok = False
+        if heavy_modules:
+            status = f"imports {', '.join(sorted(heavy_modules))}"
+            ok = False
+        print(f"  {command:<16} import time {median_ms:7.1f} ms  budget {budget_ms:7.1f} ms  {status}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the startup budget check.
+
+    Args:
+        argv (Optional[List[str]], optional): The command line arguments. Defaults to None, i.e. sys.argv.
+
+    Returns:
+        int: The exit status, 1 if a command exceeds its budget
+    """
+    parser = argparse.ArgumentParser(description="Startup budget of the turludock CLI")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of every command (default: 5)")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Scale all budgets, e.g. 2 for slow CI machines (default: 1)",
+    )
+    args = parser.parse_args(argv)
+
+    budgets = {command: budget_ms * args.scale for command, budget_ms in STARTUP_BUDGETS_MS.items()}
+    print("Checking the startup budget...", flush=True)
+    if not check_startup(args.repeat, budgets):
+        print("\nStartup budget exceeded.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
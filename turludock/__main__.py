@@ -1,12 +1,13 @@
+import os
 import sys
 
 from loguru import logger
 
-import turludock.generate_dockerfile_build_folder as generate_dockerfile_build_folder
-from turludock.command_line_arguments_parser import parse_command_line_args
-from turludock.docker_build import build_custom_image, build_pre_configured_image
+from turludock.command_line_arguments_parser import is_multi_build, parse_command_line_args
 from turludock.logger import configure_logger
-from turludock.which_command import list_cuda_support, list_pre_configs, list_supported_ros_versions
+
+# Note: The modules of the sub-commands are imported where they are used, so that e.g. 'turludock which ros'
+# does not pay for importing docker, requests or yaml. Keep it that way, the CLI is called from shell completion.
 
 
 def main() -> int:
@@ -25,46 +26,138 @@ def main() -> int:
     if not parse_ok_:
         sys.exit(1)
 
-    # Enable debug mode
-    if args.debug:
-        configure_logger(True)
+    # Enable debug mode. Keep stdout clean if the build context is streamed to it.
+    to_stdout = args.command == "generate" and args.tar == "-"
+    if args.debug or to_stdout:
+        configure_logger(args.debug, to_stdout)
+
+    # Configure cache of remote version lookups
+    if args.command in ("build", "generate", "lock"):
+        from turludock.helper_functions import configure_remote_cache
+
+        configure_remote_cache(args.cache_ttl, args.offline)
 
     # which
     if args.command == "which":
+        from turludock.which_command import list_cuda_support, list_pre_configs, list_supported_ros_versions
+
         if args.which == "presets":
-            list_pre_configs()
+            if not list_pre_configs(args.validate):
+                return 1
         elif args.which == "ros":
             list_supported_ros_versions()
         elif args.which == "cuda":
             list_cuda_support(args.ros_codename)
         return 0
+    # stats
+    if args.command == "stats":
+        from turludock.stats_command import print_build_stats
+
+        print_build_stats(args.last, args.top)
+        return 0
     # build
     if args.command == "build":
+        from turludock.default_image_config import expand_configuration_names, list_configuration_names
+        from turludock.docker_build import build_custom_image, build_pre_configured_image, build_pre_configured_images
+        from turludock.helper_functions import get_cache_directory
+
         # Build from pre-configuration
         try:
+            # Build multiple images from pre-configurations
+            if is_multi_build(args):
+                if args.all:
+                    config_names = list_configuration_names()
+                else:
+                    config_names = expand_configuration_names(args.e)
+                build_args = {
+                    "tag": None,
+                    "no_cache": args.no_cache,
+                    "verbose": False,
+                    "lockfile": None,
+                    "builder": args.builder,
+                    "legacy_layer_order": args.legacy_layer_order,
+                    "source_cache": args.source_cache,
+                    "compress_context": args.compress_context,
+                    "bake_user": args.bake_user,
+                }
+                log_dir = args.log_dir or os.path.join(get_cache_directory(), "build_logs")
+                if not build_pre_configured_images(config_names, build_args, args.jobs, log_dir):
+                    return 1
             # Build image from pre-configuration
-            if args.e:
-                build_args = {"tag": args.tag, "no_cache": args.no_cache, "verbose": args.verbose}
-                build_pre_configured_image(args.e, build_args)
+            elif args.e:
+                build_args = {
+                    "tag": args.tag,
+                    "no_cache": args.no_cache,
+                    "verbose": args.verbose,
+                    "lockfile": args.lockfile,
+                    "builder": args.builder,
+                    "legacy_layer_order": args.legacy_layer_order,
+                    "source_cache": args.source_cache,
+                    "compress_context": args.compress_context,
+                    "bake_user": args.bake_user,
+                }
+                build_pre_configured_image(args.e[0], build_args)
             # Build custom-image using user's .yaml config file
             elif args.c:
-                build_args = {"tag": args.tag, "no_cache": args.no_cache, "verbose": args.verbose}
+                build_args = {
+                    "tag": args.tag,
+                    "no_cache": args.no_cache,
+                    "verbose": args.verbose,
+                    "lockfile": args.lockfile,
+                    "builder": args.builder,
+                    "legacy_layer_order": args.legacy_layer_order,
+                    "source_cache": args.source_cache,
+                    "compress_context": args.compress_context,
+                    "bake_user": args.bake_user,
+                }
                 build_custom_image(args.c, build_args)
         except Exception:
             logger.error("Error running 'build' command. Exit.")
             return 1
     # generate
     if args.command == "generate":
+        import turludock.generate_dockerfile_build_folder as generate_dockerfile_build_folder
+
         try:
             # Generate from pre-configuration
             if args.e:
-                generate_dockerfile_build_folder.generate_from_pre_config(args.e, args.path)
+                generate_dockerfile_build_folder.generate_from_pre_config(
+                    args.e,
+                    args.path,
+                    args.lockfile,
+                    args.buildkit,
+                    args.legacy_layer_order,
+                    args.source_cache,
+                    args.tar,
+                )
             # Generate using user's .yaml config file
             elif args.c:
-                generate_dockerfile_build_folder.generate_from_user_config(args.c, args.path)
+                generate_dockerfile_build_folder.generate_from_user_config(
+                    args.c,
+                    args.path,
+                    args.lockfile,
+                    args.buildkit,
+                    args.legacy_layer_order,
+                    args.source_cache,
+                    args.tar,
+                )
         except Exception:
             logger.error("Error running 'generate' command. Exit.")
             return 1
+    # lock
+    if args.command == "lock":
+        from turludock.lockfile import lock_pre_config, lock_user_config
+
+        try:
+            # Lock pre-configuration
+            if args.e:
+                lock_pre_config(args.e, args.output)
+            # Lock user's .yaml config file
+            elif args.c:
+                lock_user_config(args.c, args.output)
+        except Exception:
+            logger.error("Error running 'lock' command. Exit.")
+            return 1
 
 
 if __name__ == "__main__":
@@ -1,36 +1,44 @@
 #! /bin/bash
 
+# The user provisioned last, as 'name:user-id:group:group-id'. It lets a restarted container, or an image with
+# the user baked in at build time, skip the provisioning.
+PROVISIONED_USER_FILE="/etc/turludock/provisioned_user"
+# The lines this script adds to the rc files are kept between these markers, so they are replaced instead of
+# appended again on every start
+RC_BLOCK_BEGIN="# >>> turludock entrypoint >>>"
+RC_BLOCK_END="# <<< turludock entrypoint <<<"
+
 # Functions
 # TOOD: Check if we can use: getent passwd $USER to extract all variables
 # TODO: Check for valid inputs, cause now it will go through even with bad inputs
 check_envs () {
     DOCKER_CUSTOM_USER_OK=true;
-    if [ -z ${DOCKER_USER_NAME+x} ]; then 
+    if [ -z ${DOCKER_USER_NAME+x} ]; then
         DOCKER_CUSTOM_USER_OK=false;
         return;
     fi
 
-    if [ -z ${DOCKER_USER_ID+x} ]; then 
+    if [ -z ${DOCKER_USER_ID+x} ]; then
         DOCKER_CUSTOM_USER_OK=false;
         return;
     else
-        if ! [ -z "${DOCKER_USER_ID##[0-9]*}" ]; then 
+        if ! [ -z "${DOCKER_USER_ID##[0-9]*}" ]; then
             echo -e "\033[1;33mWarning: User-ID should be a number. Falling back to defaults.\033[0m"
             DOCKER_CUSTOM_USER_OK=false;
             return;
         fi
     fi
 
-    if [ -z ${DOCKER_USER_GROUP_NAME+x} ]; then 
+    if [ -z ${DOCKER_USER_GROUP_NAME+x} ]; then
         DOCKER_CUSTOM_USER_OK=false;
         return;
     fi
 
-    if [ -z ${DOCKER_USER_GROUP_ID+x} ]; then 
+    if [ -z ${DOCKER_USER_GROUP_ID+x} ]; then
         DOCKER_CUSTOM_USER_OK=false;
         return;
     else
-        if ! [ -z "${DOCKER_USER_GROUP_ID##[0-9]*}" ]; then 
+        if ! [ -z "${DOCKER_USER_GROUP_ID##[0-9]*}" ]; then
             echo -e "\033[1;33mWarning: Group-ID should be a number. Falling back to defaults.\033[0m"
             DOCKER_CUSTOM_USER_OK=false;
             return;
@@ -38,6 +46,30 @@ check_envs () {
     fi
 }
 
+## Use the provisioned user if none of the DOCKER_USER* variables is set, e.g. for baked-in users
+load_provisioned_user () {
+    if [ -n "${DOCKER_USER_NAME}${DOCKER_USER_ID}${DOCKER_USER_GROUP_NAME}${DOCKER_USER_GROUP_ID}" ]; then
+        return;
+    fi
+    if [ -f "$PROVISIONED_USER_FILE" ]; then
+        IFS=: read -r DOCKER_USER_NAME DOCKER_USER_ID DOCKER_USER_GROUP_NAME DOCKER_USER_GROUP_ID < "$PROVISIONED_USER_FILE"
+        export DOCKER_USER_NAME DOCKER_USER_ID DOCKER_USER_GROUP_NAME DOCKER_USER_GROUP_ID
+    fi
+}
+
+## Check if the user has been provisioned already with the same ids
+is_provisioned () {
+    [ -f "$PROVISIONED_USER_FILE" ] && \
+        [ "$(cat $PROVISIONED_USER_FILE)" = "$1:$2:$3:$4" ] && \
+        getent passwd $1 > /dev/null
+}
+
+## Replace the block of this script in an rc file with the lines read from stdin
+write_rc_block () {
+    sed -i "/^$RC_BLOCK_BEGIN\$/,/^$RC_BLOCK_END\$/d" $1
+    (echo "$RC_BLOCK_BEGIN" && cat && echo "$RC_BLOCK_END") >> $1
+}
+
 setup_env_user () {
     USER=$1
     USER_ID=$2
@@ -45,23 +77,26 @@ setup_env_user () {
     GROUP_ID=$4
 
     ## Create user
-    useradd -m $USER
+    if ! getent passwd $USER > /dev/null; then
+        useradd -m $USER
+    fi
 
-    ## Copy zsh/sh configs
+    ## Copy zsh/sh configs without the block of root
     cp /root/.profile /home/$USER/
     cp /root/.bashrc /home/$USER/
     cp /root/.zshrc /home/$USER/
+    sed -i "/^$RC_BLOCK_BEGIN\$/,/^$RC_BLOCK_END\$/d" /home/$USER/.bashrc /home/$USER/.zshrc
 
     ## Copy terminator configs
     mkdir -p /home/$USER/.config/terminator
     cp /root/.config/terminator/config /home/$USER/.config/terminator/config
 
-    ## Copy oh-my-zsh
-    cp -rf /root/.oh-my-zsh /home/$USER/
-    rm -rf /home/$USER/.oh-my-zsh/custom/pure.zsh-theme /home/$USER/.oh-my-zsh/custom/async.zsh
-    ln -s /home/$USER/.oh-my-zsh/custom/pure/pure.zsh /home/$USER/.oh-my-zsh/custom/
-    ln -s /home/$USER/.oh-my-zsh/custom/pure/async.zsh /home/$USER/.oh-my-zsh/custom/
-    sed -i -e 's@ZSH=\"/root@ZSH=\"/home/$USER@g' /home/$USER/.zshrc
+    ## Share the oh-my-zsh installation in /opt read-only instead of copying it, only its cache is per user.
+    ## The copied .zshrc already points ZSH to /opt/oh-my-zsh.
+    rm -rf /home/$USER/.oh-my-zsh
+    ln -sfn /opt/oh-my-zsh /home/$USER/.oh-my-zsh
+    mkdir -p /home/$USER/.cache/oh-my-zsh
+    sed -i "1i export ZSH_CACHE_DIR=\"\$HOME/.cache/oh-my-zsh\"" /home/$USER/.zshrc
 
     ## Copy SSH keys & fix owner
     if [ -d "/root/.ssh" ]; then
@@ -70,51 +105,43 @@ setup_env_user () {
     fi
 
     ## Copy .local - this happens especially if you use 'pip install --user'
+    LOCAL_BIN_PATH=""
     if [ -d "/root/.local" ]; then
         cp -rf /root/.local /home/$USER/
         # Add $HOME/.local/bin to PATH
         if [ -d "/home/$USER/.local/bin" ]; then
-            echo 'PATH="$HOME/.local/bin:$PATH"' >> /root/.bashrc
-            echo 'PATH="$HOME/.local/bin:$PATH"' >> /root/.zshrc
-            echo 'PATH="$HOME/.local/bin:$PATH"' >> /home/$USER/.bashrc
-            echo 'PATH="$HOME/.local/bin:$PATH"' >> /home/$USER/.zshrc
+            LOCAL_BIN_PATH='PATH="$HOME/.local/bin:$PATH"'
         fi
     fi
+    echo "$LOCAL_BIN_PATH" | write_rc_block /home/$USER/.bashrc
+    echo "$LOCAL_BIN_PATH" | write_rc_block /home/$USER/.zshrc
 
     ## Fix owner
     chown $USER_ID:$GROUP_ID /home/$USER
     chown -R $USER_ID:$GROUP_ID /home/$USER/.config
-    chown -R $USER_ID:$GROUP_ID /home/$USER/.local
+    chown -R $USER_ID:$GROUP_ID /home/$USER/.cache
+    if [ -d "/home/$USER/.local" ]; then
+        chown -R $USER_ID:$GROUP_ID /home/$USER/.local
+    fi
     chown $USER_ID:$GROUP_ID /home/$USER/.profile
     chown $USER_ID:$GROUP_ID /home/$USER/.bashrc
     chown $USER_ID:$GROUP_ID /home/$USER/.zshrc
-    chown -R $USER_ID:$GROUP_ID /home/$USER/.oh-my-zsh
-
-    ## This is a trick to fix permissions for the XDG_RUNTIME_DIR used by wayland
-    if [ -d "$XDG_RUNTIME_DIR" ]; then
-        chown -R $USER_ID:$GROUP_ID $XDG_RUNTIME_DIR
-        chmod -R 0700 $XDG_RUNTIME_DIR
-    fi
-
-    echo "if [ -d \"\$XDG_RUNTIME_DIR\" ]; then" >> /root/.bashrc
-    echo "    chown -R $USER_ID:$GROUP_ID \$XDG_RUNTIME_DIR" >> /root/.bashrc
-    echo "fi" >> /root/.bashrc
-
-    echo "if [ -d \"\$XDG_RUNTIME_DIR\" ]; then" >> /root/.zshrc
-    echo "    chown -R $USER_ID:$GROUP_ID \$XDG_RUNTIME_DIR" >> /root/.zshrc
-    echo "fi" >> /root/.zshrc
-
-
-    ## This a trick to keep the evnironmental variables of root which is important!
-    echo "if ! [ \"$DOCKER_USER_NAME\" = \"$(id -un)\" ]; then" >> /root/.bashrc
-    echo "    cd /home/$DOCKER_USER_NAME" >> /root/.bashrc
-    echo "    su $DOCKER_USER_NAME" >> /root/.bashrc
-    echo "fi" >> /root/.bashrc
-
-    echo "if ! [ \"$DOCKER_USER_NAME\" = \"$(id -un)\" ]; then" >> /root/.zshrc
-    echo "    cd /home/$DOCKER_USER_NAME" >> /root/.zshrc
-    echo "    su $DOCKER_USER_NAME" >> /root/.zshrc
-    echo "fi" >> /root/.zshrc
+    chown -h $USER_ID:$GROUP_ID /home/$USER/.oh-my-zsh
+
+    ## This is a trick to fix permissions for the XDG_RUNTIME_DIR used by wayland and
+    ## to keep the evnironmental variables of root which is important!
+    for RC_FILE in /root/.bashrc /root/.zshrc; do
+        write_rc_block $RC_FILE <<EOF
+if [ -d "\$XDG_RUNTIME_DIR" ]; then
+    chown -R $USER_ID:$GROUP_ID \$XDG_RUNTIME_DIR
+fi
+if ! [ "$USER" = "\$(id -un)" ]; then
+    cd /home/$USER
+    su $USER
+fi
+$LOCAL_BIN_PATH
+EOF
+    done
 
     ## Setup Password-file
     PASSWDCONTENTS=$(grep -v "^${USER}:" /etc/passwd)
@@ -122,21 +149,48 @@ setup_env_user () {
 
     (echo "${PASSWDCONTENTS}" && echo "${USER}:x:$USER_ID:$GROUP_ID::/home/$USER:/bin/bash") > /etc/passwd
     (echo "${GROUPCONTENTS}" && echo "${GROUP}:x:${GROUP_ID}:") > /etc/group
-    (if test -f /etc/sudoers ; then echo "${USER}  ALL=(ALL)   NOPASSWD: ALL" >> /etc/sudoers ; fi)
+    if test -f /etc/sudoers && ! grep -q "^${USER}  ALL=" /etc/sudoers; then
+        echo "${USER}  ALL=(ALL)   NOPASSWD: ALL" >> /etc/sudoers
+    fi
+
+    ## Remember the user, so the next start can skip the provisioning
+    mkdir -p $(dirname $PROVISIONED_USER_FILE)
+    echo "$USER:$USER_ID:$GROUP:$GROUP_ID" > $PROVISIONED_USER_FILE
+}
+
+## Fix the permissions of the XDG_RUNTIME_DIR, which is mounted anew on every start
+fix_runtime_dir () {
+    if [ -d "$XDG_RUNTIME_DIR" ]; then
+        chown -R $1:$2 $XDG_RUNTIME_DIR
+        chmod -R 0700 $XDG_RUNTIME_DIR
+    fi
 }
 
 
 # ---Main---
 
+## '--provision-only' sets up the user and exits, e.g. to bake the user into the image at build time
+PROVISION_ONLY=false
+if [ "$1" == "--provision-only" ]; then
+    PROVISION_ONLY=true
+    shift
+fi
+
 # Create new user
 ## Check Inputs
+load_provisioned_user
 check_envs
 
 ## Determine user & Setup Environment
 if [ $DOCKER_CUSTOM_USER_OK == true ]; then
     echo "  -->DOCKER_USER Input is set to '$DOCKER_USER_NAME:$DOCKER_USER_ID:$DOCKER_USER_GROUP_NAME:$DOCKER_USER_GROUP_ID'";
-    echo -e "\033[0;32mSetting up environment for user=$DOCKER_USER_NAME\033[0m"
-    setup_env_user $DOCKER_USER_NAME $DOCKER_USER_ID $DOCKER_USER_GROUP_NAME $DOCKER_USER_GROUP_ID
+    if is_provisioned $DOCKER_USER_NAME $DOCKER_USER_ID $DOCKER_USER_GROUP_NAME $DOCKER_USER_GROUP_ID; then
+        echo -e "\033[0;32mEnvironment for user=$DOCKER_USER_NAME is already set up\033[0m"
+    else
+        echo -e "\033[0;32mSetting up environment for user=$DOCKER_USER_NAME\033[0m"
+        setup_env_user $DOCKER_USER_NAME $DOCKER_USER_ID $DOCKER_USER_GROUP_NAME $DOCKER_USER_GROUP_ID
+    fi
+    fix_runtime_dir $DOCKER_USER_ID $DOCKER_USER_GROUP_ID
 else
     echo "  -->DOCKER_USER* variables not set. You need to set all four! Using 'root'.";
     echo -e "\033[0;32mSetting up environment for user=root\033[0m"
@@ -144,7 +198,13 @@ else
 fi
 
 # Change shell to zsh
-chsh -s /usr/bin/zsh $DOCKER_USER_NAME
+if ! [ "$(getent passwd $DOCKER_USER_NAME | cut -d: -f7)" = "/usr/bin/zsh" ]; then
+    chsh -s /usr/bin/zsh $DOCKER_USER_NAME
+fi
+
+if [ $PROVISION_ONLY == true ]; then
+    exit 0
+fi
 
 # Run CMD from Docker
 "$@"
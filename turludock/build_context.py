@@ -0,0 +1,92 @@
+import importlib.resources
+import io
+import os
+import tarfile
+import time
+
+from loguru import logger
+
+import turludock.constants as constants
+from turludock.source_cache import SOURCE_SNAPSHOT_FOLDER, get_source_snapshot_paths
+
+
+def _add_bytes(tar: tarfile.TarFile, arcname: str, data: bytes, mode: int, mtime: int) -> None:
+    """Add a file to the build context from memory.
+
+    Args:
+        tar (tarfile.TarFile): The build context
+        arcname (str): The path of the file in the build context
+        data (bytes): The content of the file
+        mode (int): The permission bits of the file
+        mtime (int): The modification time of the file
+    """
+    tarinfo = tarfile.TarInfo(arcname)
+    tarinfo.size = len(data)
+    tarinfo.mode = mode
+    tarinfo.mtime = mtime
+    tarinfo.uname = tarinfo.gname = "root"
+    tar.addfile(tarinfo, io.BytesIO(data))
+
+
+def _reset_owner(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+    """Do not leak the owner of host files into the build context, like 'docker build' does.
+
+    Args:
+        tarinfo (tarfile.TarInfo): The entry of the file
+
+    Returns:
+        tarfile.TarInfo: The entry owned by root
+    """
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = "root"
+    return tarinfo
+
+
+def write_build_context(fileobj: io.IOBase, dockerfile: str, compress: bool = False) -> None:
+    """Write the build context of a generated Dockerfile as tar stream.
+
+    The build context holds the Dockerfile, its assets (see 'constants.DOCKERFILE_ASSETS') and the source
+    snapshots it adds (see 'source_cache.get_source_snapshot_paths()'). The assets are read directly from
+    the package, so nothing is written to disk.
+
+    Args:
+        fileobj (io.IOBase): The binary stream to write the tar archive to
+        dockerfile (str): The generated Dockerfile
+        compress (bool, optional): Whether to gzip the tar archive. Defaults to False.
+
+    Raises:
+        RuntimeError: If a source snapshot is not in the host-side cache
+    """
+    mtime = int(time.time())
+    # Stream mode, so the archive can also be written to pipes like stdout
+    with tarfile.open(fileobj=fileobj, mode="w|gz" if compress else "w|") as tar:
+        _add_bytes(tar, "Dockerfile", dockerfile.encode("utf-8"), 0o644, mtime)
+
+        # Keep the permissions of the assets, e.g. the entrypoint must stay executable
+        assets = importlib.resources.files("turludock.assets.dockerfile_assets")
+        for asset in constants.DOCKERFILE_ASSETS:
+            with importlib.resources.as_file(assets / asset) as asset_path:
+                with open(asset_path, "rb") as file:
+                    data = file.read()
+                _add_bytes(tar, asset, data, os.stat(asset_path).st_mode & 0o777, mtime)
+
+        for filename, snapshot_path in get_source_snapshot_paths(dockerfile).items():
+            tar.add(snapshot_path, arcname=f"{SOURCE_SNAPSHOT_FOLDER}/{filename}", filter=_reset_owner)
+
+
+def create_build_context(dockerfile: str, compress: bool = False) -> io.BytesIO:
+    """Assemble the build context of a generated Dockerfile in memory, see 'write_build_context()'.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+        compress (bool, optional): Whether to gzip the tar archive, e.g. for remote Docker daemons.
+            Defaults to False.
+
+    Returns:
+        io.BytesIO: The tar archive of the build context, positioned at its start
+    """
+    build_context = io.BytesIO()
+    write_build_context(build_context, dockerfile, compress)
+    logger.debug(f"Created build context of {build_context.tell()} bytes (compressed: {compress})")
+    build_context.seek(0)
+    return build_context
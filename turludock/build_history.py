@@ -0,0 +1,277 @@
+import contextlib
+import math
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+import turludock.constants as constants
+from turludock.helper_functions import get_cache_directory
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_name TEXT NOT NULL,
+    config_hash TEXT,
+    build_profile TEXT,
+    tag TEXT,
+    builder TEXT,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    status TEXT NOT NULL,
+    image_size INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS build_steps (
+    build_id INTEGER NOT NULL REFERENCES builds(id),
+    position INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    instruction_key TEXT NOT NULL,
+    instruction TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    cached INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS build_steps_build_id ON build_steps(build_id);
+"""
+
+# Columns added to the 'builds' table after its first release, with their types
+_ADDED_BUILD_COLUMNS = {"build_profile": "TEXT"}
+
+# The expected duration of a step is the mean of its last uncached runs
+_EXPECTED_STEP_RUNS = 3
+
+# The databases whose schema this process has already created and migrated, see '_connect()'
+_migrated_databases: Set[str] = set()
+_migrate_lock = threading.Lock()
+
+
+def get_build_history_path() -> str:
+    """Get the path of the SQLite database that stores the build history.
+
+    Returns:
+        str: The path to the build history database
+    """
+    return os.path.join(get_cache_directory(), "build_history.sqlite")
+
+
+def _migrate(connection: sqlite3.Connection) -> None:
+    """Create the schema of the build history and migrate databases created by older versions.
+
+    Other processes may migrate the same database concurrently, so a column they added in the meantime is
+    not an error.
+
+    Args:
+        connection (sqlite3.Connection): The connection to the database
+
+    Raises:
+        sqlite3.OperationalError: If the schema cannot be created or migrated
+    """
+    connection.executescript(_SCHEMA)
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(builds)")}
+    for column, column_type in _ADDED_BUILD_COLUMNS.items():
+        if column in columns:
+            continue
+        try:
+            connection.execute(f"ALTER TABLE builds ADD COLUMN {column} {column_type}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):
+                raise
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the build history database, creating it if needed.
+
+    The schema is created and migrated once per process, not on every connection of the concurrent builds.
+
+    Returns:
+        sqlite3.Connection: The connection to the database
+    """
+    database_path = get_build_history_path()
+    os.makedirs(os.path.dirname(database_path), exist_ok=True)
+    # Concurrent builds write to the same database, so wait for the lock instead of failing
+    connection = sqlite3.connect(database_path, timeout=30)
+    with _migrate_lock:
+        if database_path not in _migrated_databases:
+            _migrate(connection)
+            _migrated_databases.add(database_path)
+    return connection
+
+
+def record_build(build: Dict[str, Any], step_timings: List[dict]) -> None:
+    """Append a build and the timings of its steps to the build history.
+
+    Failing to record a build is not fatal.
+
+    Args:
+        build (Dict[str, Any]): The build record with the keys 'config_name', 'config_hash', 'build_profile', 'tag',
+            'builder', 'start_time', 'end_time', 'status' ('success' or 'failed'), 'image_size' and 'error'
+        step_timings (List[dict]): The step timings, see 'BuildProgress.step_timings'
+    """
+    try:
+        with contextlib.closing(_connect()) as connection, connection:
+            cursor = connection.execute(
+                "INSERT INTO builds (config_name, config_hash, build_profile, tag, builder, start_time, end_time, "
+                + "status, image_size, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    build["config_name"],
+                    build.get("config_hash"),
+                    build.get("build_profile"),
+                    build.get("tag"),
+                    build.get("builder"),
+                    build["start_time"],
+                    build["end_time"],
+                    build["status"],
+                    build.get("image_size"),
+                    build.get("error"),
+                ),
+            )
+            connection.executemany(
+                "INSERT INTO build_steps (build_id, position, step, instruction_key, instruction, seconds, cached) "
+                + "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        cursor.lastrowid,
+                        position,
+                        step["step"],
+                        step["key"],
+                        step["instruction"],
+                        step["seconds"],
+                        int(step["cached"]),
+                    )
+                    for position, step in enumerate(step_timings)
+                ],
+            )
+        logger.debug(f"Recorded build of '{build['config_name']}' in '{get_build_history_path()}'")
+    except sqlite3.Error as e:
+        logger.warning(f"Could not record build in the build history: {e}")
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Get the percentile of a list of values using the nearest-rank method.
+
+    Args:
+        values (List[float]): The values. Must not be empty.
+        percent (float): The percentile, e.g. 95
+
+    Returns:
+        float: The percentile of the values
+    """
+    sorted_values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def get_successful_builds(last_n: Optional[int] = None) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Get the durations and image sizes of the successful builds per configuration and build profile.
+
+    Args:
+        last_n (Optional[int], optional): Only consider the last N builds of each configuration and build profile.
+            Defaults to None, i.e. all builds.
+
+    Returns:
+        Dict[Tuple[str, str], List[Dict[str, Any]]]: The builds with the keys 'duration' (in seconds) and
+            'image_size' of each configuration name and build profile, newest first
+    """
+    with contextlib.closing(_connect()) as connection:
+        rows = connection.execute(
+            "SELECT config_name, COALESCE(build_profile, ?), end_time - start_time, image_size FROM builds "
+            + "WHERE status = 'success' ORDER BY config_name, start_time DESC",
+            (constants.DEFAULT_BUILD_PROFILE,),
+        ).fetchall()
+
+    builds: Dict[Tuple[str, str], List[Dict[str, Any]]] = dict()
+    for config_name, build_profile, duration, image_size in rows:
+        config_builds = builds.setdefault((config_name, build_profile), list())
+        if last_n is None or len(config_builds) < last_n:
+            config_builds.append({"duration": duration, "image_size": image_size})
+    return builds
+
+
+def get_expected_step_durations(keys: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Get the expected duration of build steps, i.e. the mean of their last uncached runs in successful builds.
+
+    The build progress weights every step by it, see 'build_progress.BuildProgress'. Failing to read the
+    build history is not fatal.
+
+    Args:
+        keys (Optional[Iterable[str]], optional): The instruction keys of the steps, see
+            'build_progress.get_instruction_key()'. Defaults to None, i.e. all steps.
+
+    Returns:
+        Dict[str, float]: The expected duration in seconds of every step that has been built before
+    """
+    parameters: List[Any] = list()
+    condition = ""
+    if keys is not None:
+        parameters = list(set(keys))
+        condition = f" AND instruction_key IN ({', '.join('?' * len(parameters))})"
+    # Number the uncached runs of every step from the newest one
+    query = (
+        "SELECT instruction_key, AVG(seconds) FROM ("
+        + "SELECT instruction_key, seconds, ROW_NUMBER() OVER "
+        + "(PARTITION BY instruction_key ORDER BY builds.start_time DESC, position DESC) AS run "
+        + "FROM build_steps JOIN builds ON builds.id = build_steps.build_id WHERE cached = 0 "
+        + f"AND status = 'success'{condition}"
+        + ") WHERE run <= ? GROUP BY instruction_key"
+    )
+    try:
+        with contextlib.closing(_connect()) as connection:
+            rows = connection.execute(query, (*parameters, _EXPECTED_STEP_RUNS)).fetchall()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read the step durations from the build history: {e}")
+        return dict()
+    return dict(rows)
+
+
+def get_slowest_steps(last_n: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """Get the slowest uncached steps of the last builds.
+
+    Args:
+        last_n (Optional[int], optional): Only consider the last N builds. Defaults to None, i.e. all builds.
+        limit (int, optional): The maximum number of steps to return. Defaults to 10.
+
+    Returns:
+        List[Dict[str, Any]]: The slowest steps with the keys 'instruction', 'runs', 'mean_seconds',
+            'max_seconds' and 'cache_hit_rate', slowest mean first
+    """
+    with contextlib.closing(_connect()) as connection:
+        rows = connection.execute(
+            "SELECT MIN(instruction), SUM(1 - cached), AVG(CASE WHEN cached = 0 THEN seconds END), "
+            + "MAX(CASE WHEN cached = 0 THEN seconds END), AVG(cached) "
+            + "FROM build_steps WHERE build_id IN (SELECT id FROM builds ORDER BY start_time DESC LIMIT ?) "
+            + "GROUP BY instruction_key HAVING SUM(1 - cached) > 0 ORDER BY 3 DESC LIMIT ?",
+            (-1 if last_n is None else last_n, limit),
+        ).fetchall()
+    return [
+        {
+            "instruction": instruction,
+            "runs": runs,
+            "mean_seconds": mean_seconds,
+            "max_seconds": max_seconds,
+            "cache_hit_rate": cache_hit_rate,
+        }
+        for instruction, runs, mean_seconds, max_seconds, cache_hit_rate in rows
+    ]
+
+
+def get_recent_builds(last_n: int) -> List[Dict[str, Any]]:
+    """Get the last builds of all configurations.
+
+    Args:
+        last_n (int): The number of builds to return
+
+    Returns:
+        List[Dict[str, Any]]: The builds with the keys 'config_name', 'tag', 'start_time', 'duration', 'status',
+            'image_size' and 'cache_hit_rate', newest first
+    """
+    with contextlib.closing(_connect()) as connection:
+        rows = connection.execute(
+            "SELECT config_name, tag, start_time, end_time - start_time, status, image_size, "
+            + "(SELECT AVG(cached) FROM build_steps WHERE build_id = builds.id) "
+            + "FROM builds ORDER BY start_time DESC LIMIT ?",
+            (last_n,),
+        ).fetchall()
+    keys = ("config_name", "tag", "start_time", "duration", "status", "image_size", "cache_hit_rate")
+    return [dict(zip(keys, row)) for row in rows]
@@ -1,36 +1,182 @@
+import hashlib
 import re
-from typing import Optional, Tuple
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
 
-from rich.progress import BarColumn, Progress, TextColumn, TimeElapsedColumn
+from rich.console import Console
+from rich.progress import BarColumn, Progress, ProgressColumn, TextColumn, TimeElapsedColumn
+from rich.table import Table
+from rich.text import Text
+
+from turludock.build_history import get_expected_step_durations
+
+# Assumed duration of a step that has never been built before
+DEFAULT_STEP_SECONDS = 5.0
+
+# A running step never fills more than this share of its expected duration, so the bar never stalls at 100%
+_MAX_RUNNING_STEP_SHARE = 0.95
+
+# The instructions BuildKit reports as steps. The others, e.g. ENV or LABEL, only change the image config.
+_BUILDKIT_STEP_KEYWORDS = {"FROM", "RUN", "COPY", "ADD", "WORKDIR"}
+
+
+def get_instruction_key(instruction: str) -> str:
+    """Get the key of a Dockerfile instruction, under which its build duration is recorded.
+
+    Line continuations and whitespace are normalized, so the instruction of the Dockerfile and the one
+    reported by the docker builders map to the same key.
+
+    Args:
+        instruction (str): The Dockerfile instruction, e.g. 'RUN apt-get update'
+
+    Returns:
+        str: The key of the instruction
+    """
+    normalized = " ".join(instruction.replace("\\\n", " ").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def get_dockerfile_instructions(dockerfile: str) -> List[str]:
+    """Get the instructions of a Dockerfile, without comments and with joined line continuations.
+
+    Args:
+        dockerfile (str): The Dockerfile
+
+    Returns:
+        List[str]: The instructions in order
+    """
+    instructions = list()
+    current = ""
+    for line in dockerfile.splitlines():
+        if line.strip().startswith("#") or (not current and not line.strip()):
+            continue
+        current += line.rstrip() + "\n"
+        if not line.rstrip().endswith("\\"):
+            instructions.append(current.rstrip("\n"))
+            current = ""
+    if current:
+        instructions.append(current.rstrip("\n"))
+    return instructions
+
+
+def _format_seconds(seconds: float) -> str:
+    """Format a duration like the rich time columns, e.g. '0:01:05'.
+
+    Args:
+        seconds (float): The duration in seconds
+
+    Returns:
+        str: The formatted duration
+    """
+    return str(timedelta(seconds=int(seconds)))
+
+
+class _EtaColumn(ProgressColumn):
+    """Renders the estimated remaining build time, based on the expected duration of the remaining steps."""
+
+    def __init__(self, build_progress: "BuildProgress") -> None:
+        super().__init__()
+        self.build_progress = build_progress
+
+    def render(self, task) -> Text:
+        """Render the ETA of the build."""
+        return Text(f"ETA {_format_seconds(self.build_progress.get_remaining_seconds())}", style="progress.remaining")
 
 
 class BuildProgress:
-    """A class used to track progress of a docker build process."""
+    """A class used to track progress of a docker build process.
+
+    Every step is weighted by its expected duration, i.e. by the duration of the same instruction in previous
+    builds as recorded in the build history (see 'build_history.get_expected_step_durations()'), so long steps
+    like the ROS installation move the bar accordingly.
+    The wall time of every step is recorded and printed as a table when the build finishes.
+
+    Args:
+        dockerfile (Optional[str], optional): The Dockerfile being built. It is used to determine the expected
+            duration of the whole build upfront. Defaults to None, i.e. the total is inferred from the steps.
+        display (bool, optional): Whether to show the progress bar and the timing table. If False, the steps
+            are only timed, e.g. for builds that write their output to a log file. Defaults to True.
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, dockerfile: Optional[str] = None, display: bool = True) -> None:
         """Initializes a BuildProgress object.
 
         The object is used to track progress of a docker build process.
 
         The Progress object is configured to show the description of the task, a progress bar,
-        the percentage completed and the time elapsed.
+        the percentage completed, the time elapsed and the estimated remaining time.
 
-        The object has three attributes:
-            - total_tasks: The total number of tasks
+        The object has the following attributes:
+            - total_tasks: The expected duration of the whole build in seconds
             - is_initialized: Whether the progress bar is initialized or not
             - progress: The Progress object
             - task: The Task object representing the current task. This is set when the progress bar
                       is initialized.
+            - step_timings: The timing of every finished step, with keys 'step', 'key', 'instruction',
+                      'seconds' and 'cached'
         """
         self.total_tasks = 0
         self.is_initialized = False
+        self.display = display
         self.progress = Progress(
             TextColumn("[bold blue]{task.description}"),
             BarColumn(),
             "[progress.percentage]{task.percentage:>3.1f}%",
             TimeElapsedColumn(),
+            _EtaColumn(self),
         )
         self.task = None
+        self.buildkit_steps = set()
+        self.buildkit_stage_totals = dict()
+        self.expected_total = None
+        self.expected_buildkit_total = None
+        if dockerfile is not None:
+            instructions = get_dockerfile_instructions(dockerfile)
+            keys = [get_instruction_key(instruction) for instruction in instructions]
+            self.step_durations = get_expected_step_durations(keys)
+            self.expected_total = sum(self.get_expected_seconds(key) for key in keys)
+            # BuildKit never reports the other instructions, so they would never finish
+            self.expected_buildkit_total = sum(
+                self.get_expected_seconds(key)
+                for instruction, key in zip(instructions, keys)
+                if instruction.split(maxsplit=1)[0].upper() in _BUILDKIT_STEP_KEYWORDS
+            )
+        else:
+            self.step_durations = get_expected_step_durations()
+        self.step_timings: List[dict] = list()
+        self.finished_seconds = 0.0
+        # The running steps by step id, with keys 'step', 'key', 'instruction', 'start' and 'cached'
+        self.running_steps: Dict[str, dict] = dict()
+        # BuildKit numbers its vertices, e.g. '#7'. Maps the vertex number to the step id.
+        self.buildkit_vertices: Dict[str, str] = dict()
+
+    def get_expected_seconds(self, key: str) -> float:
+        """Get the expected duration of a step, based on previous builds of the same instruction.
+
+        Args:
+            key (str): The instruction key, see 'get_instruction_key()'
+
+        Returns:
+            float: The expected duration in seconds
+        """
+        return self.step_durations.get(key, DEFAULT_STEP_SECONDS)
+
+    def get_remaining_seconds(self) -> float:
+        """Get the estimated remaining duration of the build.
+
+        Returns:
+            float: The estimated remaining seconds
+        """
+        if not self.is_initialized:
+            return 0.0
+        remaining = self.total_tasks - self.finished_seconds
+        now = time.monotonic()
+        for step in self.running_steps.values():
+            # A step that takes longer than expected is assumed to be almost done
+            elapsed = min(now - step["start"], _MAX_RUNNING_STEP_SHARE * self.get_expected_seconds(step["key"]))
+            remaining -= elapsed
+        return max(remaining, 0.0)
 
     def find_and_parse_extra_step(self, status_msg: str) -> Tuple[bool, Optional[int], Optional[int]]:
         """Parses the docker build output and looks for the "Step m/n" pattern.
@@ -63,36 +209,193 @@ class BuildProgress:
         else:
             return False, None, None
 
-    def _start(self, total_tasks: int) -> None:
-        """Initializes the progress bar based on the total steps the build command has.
+    def find_and_parse_buildkit_step(self, status_msg: str) -> Tuple[bool, Optional[str], Optional[int], Optional[int]]:
+        """Parses the BuildKit plain progress output and looks for the "#x [stage m/n]" pattern.
+
+        BuildKit reports the steps per build stage, e.g. "#7 [builder 2/5] RUN make" or "#5 [3/21] RUN ...".
+        Stages can run in parallel, so the steps are not necessarily reported in order.
+
+        Args:
+            status_msg (str): The string to search for the pattern in.
+
+        Returns:
+            Tuple[bool, Optional[str], Optional[int], Optional[int]]: A tuple with a boolean stating if parsing
+            was successful, the stage name (empty string for the unnamed stage), the current step of the stage
+            and the total steps of the stage. If parsing was unsuccessful, the tuple is (False, None, None, None).
+        """
+        # Define the regex pattern to match "#NUMBER [STAGE NUMBER_ONE/NUMBER_TWO]"
+        pattern = r"^#\d+ \[(?:([\w.-]+) )?\s*(\d+)/(\d+)\]"
+
+        match = re.search(pattern, status_msg)
+
+        if match:
+            stage = match.group(1) or ""
+            return True, stage, int(match.group(2)), int(match.group(3))
+        else:
+            return False, None, None, None
+
+    def _start(self, total_tasks: float) -> None:
+        """Initializes the progress bar based on the expected duration of the build.
 
         Args:
-            total_tasks (int): The total number of steps the build command has.
+            total_tasks (float): The expected duration of the build in seconds.
         """
         self.total_tasks = total_tasks
         self.task = self.progress.add_task("[green]|Building...", total=self.total_tasks)
-        self.progress.start()
+        if self.display:
+            self.progress.start()
         self.is_initialized = True
 
-    def finish(self) -> None:
-        """Stops the progress bar."""
+    def _start_step(self, step_id: str, instruction: str) -> None:
+        """Start timing a step.
+
+        Args:
+            step_id (str): The unique id of the step, e.g. '3/21' or 'builder 2/5'
+            instruction (str): The instruction of the step
+        """
+        self.running_steps[step_id] = {
+            "step": step_id,
+            "key": get_instruction_key(instruction),
+            "instruction": " ".join(instruction.split()),
+            "start": time.monotonic(),
+            "cached": False,
+        }
+
+    def _finish_step(self, step_id: str, seconds: Optional[float] = None) -> None:
+        """Stop timing a step and advance the bar by its expected duration.
+
+        Args:
+            step_id (str): The unique id of the step
+            seconds (Optional[float], optional): The duration as reported by the builder. Defaults to None,
+                i.e. the measured wall time is used.
+        """
+        step = self.running_steps.pop(step_id, None)
+        if step is None:
+            return
+        if seconds is None:
+            seconds = time.monotonic() - step["start"]
+        self.step_timings.append(
+            {
+                "step": step["step"],
+                "key": step["key"],
+                "instruction": step["instruction"],
+                "seconds": seconds,
+                "cached": step["cached"],
+            }
+        )
+        self.finished_seconds += self.get_expected_seconds(step["key"])
+
+    def _update_bar(self) -> None:
+        """Update the bar with the finished steps and the elapsed time of the running ones."""
+        self.progress.update(self.task, completed=self.total_tasks - self.get_remaining_seconds())
+
+    def finish(self, success: bool = True) -> None:
+        """Stops the progress bar and prints the per-step timing table.
+
+        The step durations are stored with the build in the build history, see 'build_history.record_build()'.
+
+        Args:
+            success (bool, optional): Whether the build succeeded. The steps of a failed build are not printed,
+                and the step that failed is not timed. Defaults to True.
+        """
+        if not success:
+            self.running_steps.clear()
+            self.progress.stop()
+            return
+
+        for step_id in list(self.running_steps):
+            self._finish_step(step_id)
+        if self.is_initialized:
+            self.progress.update(self.task, completed=self.total_tasks)
         self.progress.stop()
+        if self.display:
+            self.print_step_timings()
+
+    def print_step_timings(self) -> None:
+        """Print the wall time of every step, so it is visible which layers dominate the build."""
+        if len(self.step_timings) == 0:
+            return
+        total_seconds = sum(step["seconds"] for step in self.step_timings)
+        table = Table(title="Build steps", expand=True)
+        # Only the instruction column may shrink on narrow terminals
+        table.add_column("Step", no_wrap=True, min_width=max(len(step["step"]) for step in self.step_timings))
+        table.add_column("Time", justify="right", no_wrap=True, min_width=7)
+        table.add_column("Share", justify="right", no_wrap=True, min_width=6)
+        table.add_column("Instruction", overflow="ellipsis", no_wrap=True, ratio=1)
+        for step in self.step_timings:
+            share = step["seconds"] / total_seconds * 100 if total_seconds > 0 else 0.0
+            time_str = "cached" if step["cached"] else _format_seconds(step["seconds"])
+            table.add_row(step["step"], time_str, f"{share:.1f}%", step["instruction"])
+        print("")
+        Console().print(table)
 
     def advance(self, build_status_msg: str) -> None:
         """Advances the progress bar based on the docker build status message.
 
-        To determine the progress, the function uses regex to find the "Step m/n" pattern.
+        To determine the progress, the function uses regex to find the "Step m/n : INSTRUCTION" pattern.
+        A step ends when the next one starts. Steps answered by " ---> Using cache" are marked as cached.
 
         Args:
             build_status_msg (str): The docker build status message.
         """
         # Parse docker build status message to check progress
-        found, _, total_tasks = self.find_and_parse_extra_step(build_status_msg)
+        found, step, total_tasks = self.find_and_parse_extra_step(build_status_msg)
 
         # If status message contains progress update the bar
         if found:
             if not self.is_initialized:
-                self._start(total_tasks)
-            # Update bar
-            # print(f"Step: {step}/{total_tasks}")
-            self.progress.advance(self.task, advance=1)
+                if self.expected_total is None:
+                    self.expected_total = total_tasks * DEFAULT_STEP_SECONDS
+                self._start(self.expected_total)
+            # The previous step is done
+            for step_id in list(self.running_steps):
+                self._finish_step(step_id)
+            instruction = build_status_msg.split(" : ", 1)[1].strip()
+            self._start_step(f"{step}/{total_tasks}", instruction)
+        elif "---> Using cache" in build_status_msg:
+            for running_step in self.running_steps.values():
+                running_step["cached"] = True
+
+        if self.is_initialized:
+            self._update_bar()
+
+    def advance_buildkit(self, build_status_msg: str) -> None:
+        """Advances the progress bar based on a BuildKit plain progress line.
+
+        BuildKit numbers every step, e.g. "#7 [stage 2/5] RUN make", and reports its end with "#7 DONE 12.3s"
+        or "#7 CACHED". The header is repeated whenever the output of a step resumes, so every step is only
+        started once. Only the instructions BuildKit reports as steps count towards the total, see
+        '_BUILDKIT_STEP_KEYWORDS'. Without a Dockerfile, the total is based on the steps of all stages seen so far.
+
+        Args:
+            build_status_msg (str): A line of the BuildKit plain progress output.
+        """
+        done = re.match(r"^#(\d+) (?:DONE ([\d.]+)s|(CACHED))", build_status_msg)
+        if done is not None:
+            step_id = self.buildkit_vertices.get(done.group(1))
+            if step_id in self.running_steps:
+                if done.group(3):
+                    self.running_steps[step_id]["cached"] = True
+                self._finish_step(step_id, float(done.group(2)) if done.group(2) else 0.0)
+                self._update_bar()
+            return
+
+        found, stage, step, stage_total = self.find_and_parse_buildkit_step(build_status_msg)
+        if not found or (stage, step) in self.buildkit_steps:
+            return
+
+        self.buildkit_steps.add((stage, step))
+        self.buildkit_stage_totals[stage] = stage_total
+        total_tasks = self.expected_buildkit_total
+        if total_tasks is None:
+            total_tasks = sum(self.buildkit_stage_totals.values()) * DEFAULT_STEP_SECONDS
+        if not self.is_initialized:
+            self._start(total_tasks)
+        elif total_tasks != self.total_tasks:
+            self.total_tasks = total_tasks
+            self.progress.update(self.task, total=self.total_tasks)
+
+        step_id = f"{stage} {step}/{stage_total}".strip()
+        self.buildkit_vertices[build_status_msg[1:].split(" ", 1)[0]] = step_id
+        self._start_step(step_id, build_status_msg.split("] ", 1)[1] if "] " in build_status_msg else "")
+        self._update_bar()
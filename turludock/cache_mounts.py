@@ -0,0 +1,93 @@
+import re
+from typing import List
+
+from loguru import logger
+
+from turludock.generate_non_templated_files import generate_apt_keep_cache, generate_apt_restore_clean
+
+# BuildKit cache mounts shared by all RUN instructions that use apt. 'sharing=locked' since apt needs exclusive access.
+APT_CACHE_MOUNTS = (
+    "--mount=type=cache,target=/var/cache/apt,sharing=locked "
+    + "--mount=type=cache,target=/var/lib/apt/lists,sharing=locked"
+)
+
+# BuildKit cache mount shared by all RUN instructions that use pip
+PIP_CACHE_MOUNTS = "--mount=type=cache,target=/root/.cache/pip"
+
+# Removing the apt lists and the downloaded packages would empty the cache mounts
+_APT_CLEANUP_PATTERN = re.compile(
+    r"\s*(?:\\\n\s*)?&&\s*(?:\\\n\s*)?apt-get clean(?:\s*&&\s*apt-get clean)?\s*&&\s*rm -rf /var/lib/apt/lists/\*"
+)
+
+
+def _split_instructions(dockerfile: str) -> List[str]:
+    """Split a Dockerfile into its instructions, keeping comments, empty lines and line continuations.
+
+    Args:
+        dockerfile (str): The Dockerfile
+
+    Returns:
+        List[str]: The instructions. Joining them results in the original Dockerfile.
+    """
+    instructions = list()
+    current = ""
+    for line in dockerfile.splitlines(keepends=True):
+        current += line
+        if not line.rstrip("\n").endswith("\\"):
+            instructions.append(current)
+            current = ""
+    if current:
+        instructions.append(current)
+    return instructions
+
+
+def _add_cache_mounts_to_run(instruction: str) -> str:
+    """Add the apt/pip cache mounts to a RUN instruction, if it uses apt or pip.
+
+    Args:
+        instruction (str): The RUN instruction
+
+    Returns:
+        str: The RUN instruction with cache mounts
+    """
+    mounts = list()
+    # The llvm.sh script installs its packages with apt-get
+    if "apt-get" in instruction or "llvm.sh" in instruction:
+        mounts.append(APT_CACHE_MOUNTS)
+        instruction = _APT_CLEANUP_PATTERN.sub("", instruction)
+    if "pip install" in instruction:
+        mounts.append(PIP_CACHE_MOUNTS)
+        instruction = instruction.replace("--no-cache-dir ", "")
+    if len(mounts) == 0:
+        return instruction
+    return instruction.replace("RUN ", "RUN " + " ".join(mounts) + " ", 1)
+
+
+def add_cache_mounts(dockerfile: str) -> str:
+    """Rewrite a generated Dockerfile to use BuildKit cache mounts for apt and pip.
+
+    Every RUN instruction that uses apt or pip gets cache mounts for '/var/cache/apt', '/var/lib/apt/lists'
+    and the pip cache, and no longer deletes the apt lists. Each stage keeps the downloaded packages, so
+    every package is only downloaded once per host instead of once per layer and image. The image itself is
+    left with the default apt configuration, so its containers do not keep downloaded packages.
+
+    Requires BuildKit, i.e. 'turludock build --builder buildkit' or 'docker buildx build'.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+
+    Returns:
+        str: The Dockerfile with cache mounts
+    """
+    logger.debug("Add BuildKit cache mounts to the RUN instructions")
+    output = "# syntax=docker/dockerfile:1\n"
+    for instruction in _split_instructions(dockerfile):
+        if instruction.startswith("FROM "):
+            output += instruction + "\n" + generate_apt_keep_cache().rstrip("\n") + "\n"
+        elif instruction.startswith("RUN "):
+            output += _add_cache_mounts_to_run(instruction)
+        else:
+            output += instruction
+    # Only the last stage ends up in the image
+    output = output.rstrip("\n") + "\n\n" + generate_apt_restore_clean()
+    return output
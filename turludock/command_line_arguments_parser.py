@@ -27,6 +27,10 @@ def print_command_help(args: argparse.Namespace, parser: dict) -> None:
         parser["build"].print_help()
     elif args.command == "generate":
         parser["gen"].print_help()
+    elif args.command == "lock":
+        parser["lock"].print_help()
+    elif args.command == "stats":
+        parser["stats"].print_help()
     elif args.command == "which":
         if args.which is None:
             parser["which"].print_help()
@@ -41,6 +45,24 @@ def print_command_help(args: argparse.Namespace, parser: dict) -> None:
         parser.print_help()
 
 
+def is_multi_build(args: argparse.Namespace) -> bool:
+    """Check if the 'build' command builds multiple pre-configurations.
+
+    This is the case for '--all', for more than one '-e' value or for a '-e' glob pattern.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        bool: True if multiple pre-configurations are to be built, False otherwise.
+    """
+    if args.all:
+        return True
+    if not args.e:
+        return False
+    return len(args.e) > 1 or any(char in args.e[0] for char in "*?[")
+
+
 def check_arguments(args: argparse.Namespace) -> None:
     """Check if the command line arguments are valid.
 
@@ -52,20 +74,42 @@ def check_arguments(args: argparse.Namespace) -> None:
     Raises:
         ValueError: If the arguments are invalid.
     """
+    if args.command in ("build", "generate", "lock"):
+        if args.cache_ttl is not None and args.cache_ttl < 0:
+            raise ValueError("Argument '--cache-ttl' cannot be negative\n")
     if args.command == "build":
-        if args.e and args.c:
-            raise ValueError("Provide either argument '-c' or argument '-e'\n")
-        if not args.e and not args.c:
-            raise ValueError("Provide either argument '-c' or argument '-e'\n")
+        if sum([bool(args.e), bool(args.c), args.all]) != 1:
+            raise ValueError("Provide either argument '-c', argument '-e' or argument '--all'\n")
+        if is_multi_build(args):
+            if args.tag is not None:
+                raise ValueError("Argument '--tag' is not supported when building multiple pre-configurations\n")
+            if args.lockfile is not None:
+                raise ValueError("Argument '--lockfile' is not supported when building multiple pre-configurations\n")
+        if args.jobs < 1:
+            raise ValueError("Argument '--jobs' must be at least 1\n")
     elif args.command == "generate":
         if args.e and args.c:
             raise ValueError("Provide either argument '-c' or argument '-e'\n")
         if not args.e and not args.c:
             raise ValueError("Provide either argument '-c' or argument '-e'\n")
+        if args.tar is not None:
+            if args.path:
+                raise ValueError("Provide either argument 'path' or argument '--tar'\n")
+            return
         if not args.path:
-            raise ValueError("The following arguments are required: path\n")
+            raise ValueError("The following arguments are required: path (or --tar)\n")
         if not os.path.isdir(args.path):
             raise ValueError(f"The path '{args.path}' is not a valid directory.\n")
+    elif args.command == "lock":
+        if args.e and args.c:
+            raise ValueError("Provide either argument '-c' or argument '-e'\n")
+        if not args.e and not args.c:
+            raise ValueError("Provide either argument '-c' or argument '-e'\n")
+    elif args.command == "stats":
+        if args.last < 1:
+            raise ValueError("Argument '--last' must be at least 1\n")
+        if args.top < 1:
+            raise ValueError("Argument '--top' must be at least 1\n")
     elif args.command == "which":
         if args.which is None:
             raise ValueError("You need to provide one of the following sub-commands: presets, ros, cuda\n")
@@ -107,8 +151,29 @@ def parse_command_line_args() -> Tuple[argparse.Namespace, bool]:
     parser["build"].add_argument(
         "-e",
         type=str,
+        nargs="+",
         metavar="CONFIG_NAME",
-        help='Choose an existing pre-configuration. Check with "turludock which presets"',
+        help='Choose one or more existing pre-configurations, glob patterns like "humble_*" are supported. '
+        'Check with "turludock which presets"',
+    )
+    parser["build"].add_argument(
+        "--all", action="store_true", default=False, help="Build all existing pre-configurations"
+    )
+    parser["build"].add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Maximum number of concurrent builds when building multiple pre-configurations (default: 1)",
+    )
+    parser["build"].add_argument(
+        "--log-dir",
+        type=str,
+        metavar="DIR",
+        default=None,
+        help="Directory for the per-build logs when building multiple pre-configurations "
+        "(default: build_logs in the turludock cache directory)",
     )
     parser["build"].add_argument(
         "--tag", type=str, metavar="TAG", help='Name and optionally a tag (format: "name:tag")'
@@ -116,10 +181,64 @@ def parse_command_line_args() -> Tuple[argparse.Namespace, bool]:
     parser["build"].add_argument(
         "--no-cache", action="store_true", default=False, help="Do not use cache when building the image"
     )
+    parser["build"].add_argument(
+        "--builder",
+        type=str,
+        choices=["legacy", "buildkit"],
+        default="legacy",
+        help="The build backend: the legacy docker api builder or BuildKit via 'docker buildx' (default: legacy). "
+        "BuildKit also enables cache mounts for apt and pip",
+    )
     parser["build"].add_argument(
         "-v", "--verbose", action="store_true", default=False, help="Shows the complete docker build output"
     )
+    parser["build"].add_argument(
+        "--source-cache",
+        action="store_true",
+        default=False,
+        help="Take the sources of cmake and tmux from a host-side cache instead of cloning them in every build",
+    )
+    parser["build"].add_argument(
+        "--legacy-layer-order",
+        action="store_true",
+        default=False,
+        help="Keep the legacy order of the Dockerfile layers instead of ordering them for best cache reuse",
+    )
+    parser["build"].add_argument(
+        "--compress-context",
+        action="store_true",
+        default=False,
+        help="Gzip the build context before sending it to the Docker daemon, e.g. for remote daemons",
+    )
+    parser["build"].add_argument(
+        "--bake-user",
+        action="store_true",
+        default=False,
+        help="Set up the current host user at build time, so containers start without provisioning it. "
+        "The tag gets the suffix '-user-<name>'",
+    )
     parser["build"].add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug mode")
+    parser["build"].add_argument(
+        "--lockfile",
+        type=str,
+        metavar="LOCKFILE",
+        default=None,
+        help="Use the versions of the given lockfile (see 'turludock lock'). For '-c' the lockfile next to the "
+        "YAML_CONFIG is used if it exists",
+    )
+    parser["build"].add_argument(
+        "--offline",
+        action="store_true",
+        default=False,
+        help="Do not access the network for version lookups and use cached results instead",
+    )
+    parser["build"].add_argument(
+        "--cache-ttl",
+        type=int,
+        metavar="SECONDS",
+        default=None,
+        help="Time-to-live of cached version lookups in seconds (default: 1 day)",
+    )
 
     # Sub-command 'generate'
     parser["gen"] = subparsers.add_parser(
@@ -138,10 +257,109 @@ def parse_command_line_args() -> Tuple[argparse.Namespace, bool]:
     parser["gen"].add_argument(
         "path",
         type=str,
+        nargs="?",
         help="The directory path where the Dockerfile and its assets should be generated. "
         "Contents will be overwritten!",
     )
+    parser["gen"].add_argument(
+        "--tar",
+        type=str,
+        metavar="FILE",
+        default=None,
+        help="Write the build context as tar archive to FILE instead of a directory. Use '-' for stdout, e.g. "
+        "'turludock generate -e humble_nvidia --tar - | docker build -'. FILE ending in '.gz' or '.tgz' is gzipped",
+    )
+    parser["gen"].add_argument(
+        "--buildkit",
+        action="store_true",
+        default=False,
+        help="Generate a Dockerfile for BuildKit that uses cache mounts for apt and pip",
+    )
+    parser["gen"].add_argument(
+        "--source-cache",
+        action="store_true",
+        default=False,
+        help="Take the sources of cmake and tmux from a host-side cache instead of cloning them in every build",
+    )
+    parser["gen"].add_argument(
+        "--legacy-layer-order",
+        action="store_true",
+        default=False,
+        help="Keep the legacy order of the Dockerfile layers instead of ordering them for best cache reuse",
+    )
     parser["gen"].add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug mode")
+    parser["gen"].add_argument(
+        "--lockfile",
+        type=str,
+        metavar="LOCKFILE",
+        default=None,
+        help="Use the versions of the given lockfile (see 'turludock lock'). For '-c' the lockfile next to the "
+        "YAML_CONFIG is used if it exists",
+    )
+    parser["gen"].add_argument(
+        "--offline",
+        action="store_true",
+        default=False,
+        help="Do not access the network for version lookups and use cached results instead",
+    )
+    parser["gen"].add_argument(
+        "--cache-ttl",
+        type=int,
+        metavar="SECONDS",
+        default=None,
+        help="Time-to-live of cached version lookups in seconds (default: 1 day)",
+    )
+
+    # Sub-command 'lock'
+    parser["lock"] = subparsers.add_parser(
+        "lock", help="Resolves all 'latest' versions of a configuration once and stores them in a lockfile"
+    )
+    parser["lock"].add_argument(
+        "-c", type=str, metavar="YAML_CONFIG", help="Provide the Dockerfile configuration .yaml file"
+    )
+    parser["lock"].add_argument(
+        "-e",
+        type=str,
+        metavar="CONFIG_NAME",
+        help='Choose an existing pre-configuration. Check with "turludock which presets"',
+    )
+    parser["lock"].add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="LOCKFILE",
+        default=None,
+        help="Path of the lockfile. Defaults to YAML_CONFIG with '.lock.yaml' extension, or for '-e' to "
+        "'CONFIG_NAME.lock.yaml' in the current directory",
+    )
+    parser["lock"].add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug mode")
+    parser["lock"].add_argument(
+        "--offline",
+        action="store_true",
+        default=False,
+        help="Do not access the network for version lookups and use cached results instead",
+    )
+    parser["lock"].add_argument(
+        "--cache-ttl",
+        type=int,
+        metavar="SECONDS",
+        default=None,
+        help="Time-to-live of cached version lookups in seconds (default: 1 day)",
+    )
+
+    # Sub-command 'stats'
+    parser["stats"] = subparsers.add_parser("stats", help="Show statistics of the previous builds")
+    parser["stats"].add_argument(
+        "--last",
+        type=int,
+        metavar="N",
+        default=20,
+        help="Only consider the last N builds (per pre-configuration for the build times) (default: 20)",
+    )
+    parser["stats"].add_argument(
+        "--top", type=int, metavar="K", default=10, help="Number of slowest build steps to show (default: 10)"
+    )
+    parser["stats"].add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug mode")
 
     # Sub-command 'which'
     parser["which"] = subparsers.add_parser("which", help="List available pre-configurations for generating ROS images")
@@ -152,6 +370,12 @@ def parse_command_line_args() -> Tuple[argparse.Namespace, bool]:
     parser["wpre"] = which_parsers.add_parser(
         "presets", help="List available pre-configurations for directly generating ROS images"
     )
+    parser["wpre"].add_argument(
+        "--validate",
+        action="store_true",
+        default=False,
+        help="Also check the pre-configurations, including their package versions against the remotes",
+    )
     parser["wpre"].add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug mode")
     # Sub-command 'which ros'
     parser["wros"] = which_parsers.add_parser("ros", help="List supported ROS versions")
@@ -41,7 +41,10 @@ def check_dockerfile_config(config: Dict[str, Any]) -> None:
         * The GPU driver is supported.
         * The NVIDIA configuration is valid.
         * The ROS version is supported.
+        * The ROS variant is supported.
         * The list of extra packages is valid.
+        * The CMake install strategy is valid.
+        * The build profile is valid.
 
     Args:
         config (dict): The Dockerfile configuration.
@@ -54,8 +57,14 @@ def check_dockerfile_config(config: Dict[str, Any]) -> None:
     config_sanity.check_nvidia_config(config)
     # Check ROS version
     config_sanity.check_supported_ros_version(config)
+    # Check ROS variant
+    config_sanity.check_ros_variant(config)
     # Check the list of extra packages
     config_sanity.check_extra_packages(config)
+    # Check CMake install strategy
+    config_sanity.check_cmake_install_strategy(config)
+    # Check build profile
+    config_sanity.check_build_profile(config)
 
 
 def print_configuration(yaml_config: Dict[str, Any]) -> None:
@@ -71,6 +80,8 @@ def print_configuration(yaml_config: Dict[str, Any]) -> None:
     # ROS version
     ros_version = yaml_config["ros_version"]
     ros_version_str = f"ROS {get_ros_major_version(ros_version)} {ros_version.capitalize()}"
+    if "ros_variant" in yaml_config:
+        ros_version_str += f" ({yaml_config['ros_variant']})"
 
     # Ubuntu version
     ubuntu_version = get_ubuntu_version(ros_version)
@@ -1,9 +1,11 @@
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
 
 from loguru import logger
 
+import turludock.constants as constants
+from turludock.cuda_matrix import get_cuda_matrix
 from turludock.helper_functions import check_if_remote_tag_exists, get_llvm_supported_versions, get_ubuntu_version
-from turludock.yaml_load import load_cuda_config, load_cudnn_config
 
 
 def check_if_cmake_version_exists(version: str) -> None:
@@ -57,43 +59,82 @@ def check_if_llvm_version_exists(version: str) -> None:
         raise ValueError(f"LLVM version {version} not supported. Supported are: {supported_versions}")
 
 
-def check_against_known_list(config: Dict[str, Any], dict_key: str, supported_values: List[str]) -> None:
+def check_package_versions_exist(package_versions: List[Tuple[str, str]]) -> None:
+    """Checks concurrently if the given package versions exist in their remote repositories.
+
+    Each check blocks on a subprocess or an HTTP round trip, so all of them are run at once in a thread pool.
+    Errors are collected per package and reported together.
+
+    Args:
+        package_versions (List[Tuple[str, str]]): List of (package_name, version) tuples to check.
+            Supported package names are 'cmake', 'tmux' and 'llvm'.
+
+    Raises:
+        ValueError: If one or more of the given package versions do not exist.
+    """
+    version_checks = {
+        "cmake": check_if_cmake_version_exists,
+        "tmux": check_if_tmux_version_exists,
+        "llvm": check_if_llvm_version_exists,
+    }
+    if len(package_versions) == 0:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(package_versions)) as executor:
+        futures = [
+            (package_name, version, executor.submit(version_checks[package_name], version))
+            for package_name, version in package_versions
+        ]
+
+    errors = list()
+    for package_name, version, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(f"{package_name} {version}: {e}")
+    if errors:
+        raise ValueError("Package version check failed for: " + " | ".join(errors))
+
+
+def check_against_known_list(
+    config: Dict[str, Any], dict_key: str, supported_values: List[str], check_versions: bool = True
+) -> None:
     """Checks if a given YAML key is in a list of supported values.
 
     In case of the extra packages, besides checking if we support the package, we also check if
-    we support the version as well.
+    we support the version as well. The versions are checked concurrently once all package names are validated.
 
     Args:
         config (Dict[str, Any]): The configuration dictionary
         dict_key (str): The key in the configuration dictionary to check
         supported_values (list): The list of supported values for the given key
+        check_versions (bool, optional): Whether to check the package versions against their remotes.
+            Defaults to True.
 
     Raises:
         ValueError: If the given value is not in the supported list of values
     """
     # In case the key points to a list
     if isinstance(config[dict_key], list):
+        package_versions = list()
         # Check each item of the config-list if it is a known configuration, e.g. a supported by us "package"
         for item in config[dict_key]:
             # If item is a dictionary we assume a version has been specified
             if isinstance(item, dict):
                 if len(item.keys()) != 1:
                     raise ValueError(f"'{dict_key}: - {item}' cannot be a list. Specify only one version.")
-                if "cmake" in item.keys():
-                    package_name = "cmake"
-                    check_if_cmake_version_exists(item[package_name])
-                if "tmux" in item.keys():
-                    package_name = "tmux"
-                    check_if_tmux_version_exists(item[package_name])
-                if "llvm" in item.keys():
-                    package_name = "llvm"
-                    check_if_llvm_version_exists(item[package_name])
+                package_name = next(iter(item))
+                if package_name in ("cmake", "tmux", "llvm"):
+                    package_versions.append((package_name, item[package_name]))
             # Else no version has be specified and we just need to install "latest" available version
             else:
                 package_name = item
 
             if package_name not in supported_values:
                 raise ValueError(f"'{dict_key}: - {item}' not supported. Supported are {supported_values}")
+        # Check the remote versions all at once
+        if check_versions:
+            check_package_versions_exist(package_versions)
     # Else if it is a single value
     else:
         if config[dict_key] not in supported_values:
@@ -116,6 +157,22 @@ def check_supported_ros_version(config: Dict[str, Any]) -> None:
     check_against_known_list(config, dict_key, supported_values)
 
 
+def check_ros_variant(config: Dict[str, Any]) -> None:
+    """Checks the optional 'ros_variant' YAML configuration.
+
+    Args:
+        config (Dict[str, Any]): The configuration dictionary
+
+    Raises:
+        ValueError: If the given ROS variant is not supported
+    """
+    dict_key = "ros_variant"
+    if dict_key not in config:
+        logger.debug(f"No {dict_key} configured. Installing the full desktop.")
+        return
+    check_against_known_list(config, dict_key, constants.ROS_VARIANTS)
+
+
 def check_supported_gpu_drivers(config: Dict[str, Any]) -> None:
     """Checks if a given GPU driver is supported.
 
@@ -147,7 +204,40 @@ def check_extra_packages(config: Dict[str, Any]) -> None:
     supported_by_default = ["cmake"]
     supported_values = ["tmux", "llvm", "vscode", "conan", "meld", "cpplint"]
     supported_values += supported_by_default
-    check_against_known_list(config, dict_key, supported_values)
+    # Versions of a locked configuration have already been checked when locking
+    check_against_known_list(config, dict_key, supported_values, check_versions="lock" not in config)
+
+
+def check_cmake_install_strategy(config: Dict[str, Any]) -> None:
+    """Checks the optional 'cmake_install_strategy' YAML configuration.
+
+    Args:
+        config (Dict[str, Any]): The configuration dictionary
+
+    Raises:
+        ValueError: If the given install strategy is not supported
+    """
+    dict_key = "cmake_install_strategy"
+    if dict_key not in config:
+        logger.debug(f"No {dict_key} configured. Using '{constants.DEFAULT_CMAKE_INSTALL_STRATEGY}'.")
+        return
+    check_against_known_list(config, dict_key, constants.CMAKE_INSTALL_STRATEGIES)
+
+
+def check_build_profile(config: Dict[str, Any]) -> None:
+    """Checks the optional 'build_profile' YAML configuration.
+
+    Args:
+        config (Dict[str, Any]): The configuration dictionary
+
+    Raises:
+        ValueError: If the given build profile is not supported
+    """
+    dict_key = "build_profile"
+    if dict_key not in config:
+        logger.debug(f"No {dict_key} configured. Using '{constants.DEFAULT_BUILD_PROFILE}'.")
+        return
+    check_against_known_list(config, dict_key, constants.BUILD_PROFILES)
 
 
 def is_cuda_version_supported(cuda_version: str, ubuntu_version: str) -> bool:
@@ -160,25 +250,21 @@ def is_cuda_version_supported(cuda_version: str, ubuntu_version: str) -> bool:
     Returns:
         bool: True if CUDA version is supported for the given Ubuntu version, False otherwise
     """
-    cuda_config = load_cuda_config()
-    if cuda_version in cuda_config:
-        if ubuntu_version in cuda_config[cuda_version]:
-            logger.debug(f"Found supported cuda-{cuda_version}-{ubuntu_version}")
-            return True
+    cuda_matrix = get_cuda_matrix()
+    if cuda_matrix.get_cuda_entry(cuda_version, ubuntu_version) is not None:
+        logger.debug(f"Found supported cuda-{cuda_version}-{ubuntu_version}")
+        return True
+    elif cuda_matrix.has_cuda_version(cuda_version):
+        logger.error(f"Did not find supported ubuntu version '{ubuntu_version}' for cuda-{cuda_version}")
+        supported_cuda_versions = cuda_matrix.get_supported_cuda_versions(ubuntu_version)
+        if len(supported_cuda_versions) == 0:
+            logger.error(f"No CUDA version is supported for '{ubuntu_version}' at all!")
         else:
-            logger.error(f"Did not find supported ubuntu version '{ubuntu_version}' for cuda-{cuda_version}")
-            supported_cuda_versions = list()
-            for cuda_version in cuda_config:
-                if ubuntu_version["flat"] in cuda_config[cuda_version]:
-                    supported_cuda_versions.append(cuda_version)
-            if len(supported_cuda_versions) == 0:
-                logger.error(f"'cuda_version: {cuda_config['cuda_version']}' not supported at all!")
-            else:
-                logger.error(
-                    f"cuda_version: {cuda_config['cuda_version']}' not supported. Supported are "
-                    + f"{supported_cuda_versions} for Ubuntu {ubuntu_version['semantic']}"
-                )
-            return False
+            logger.error(
+                f"'cuda_version: {cuda_version}' not supported. Supported are "
+                + f"{supported_cuda_versions} for '{ubuntu_version}'"
+            )
+        return False
     else:
         logger.error(f"Did not find supported cuda version '{cuda_version}'")
         return False
@@ -214,23 +300,21 @@ def is_cuda_cudnn_version_combination_supported(cuda_version: str, cudnn_version
     Returns:
         bool: True if the CUDA and cuDNN version combination is supported for the given Ubuntu version, False otherwise
     """
-    cudnn_config = load_cudnn_config()
-    if cudnn_version in cudnn_config:
-        if ubuntu_version in cudnn_config[cudnn_version]:
-            if cuda_version in cudnn_config[cudnn_version][ubuntu_version]["cuda_version"]:
-                return True
-            else:
-                logger.error(
-                    f"Did not find supported cuDNN version '{cudnn_version}' "
-                    + f"for cuda-{cuda_version} and Ubuntu '{ubuntu_version}'"
-                )
-                return False
-        else:
-            logger.error(f"Did not find supported Ubuntu version '{ubuntu_version}' for cuDNN {cudnn_version}")
-            return False
-    else:
+    cuda_matrix = get_cuda_matrix()
+    if not cuda_matrix.has_cudnn_version(cudnn_version):
         logger.error(f"Did not find supported cuDNN version '{cudnn_version}'")
         return False
+    if cuda_matrix.get_cudnn_entry(cudnn_version, ubuntu_version) is None:
+        logger.error(f"Did not find supported Ubuntu version '{ubuntu_version}' for cuDNN {cudnn_version}")
+        return False
+    compatible_cudnn_versions = cuda_matrix.get_compatible_cudnn_versions(cuda_version, ubuntu_version)
+    if cudnn_version not in compatible_cudnn_versions:
+        logger.error(
+            f"Did not find supported cuDNN version '{cudnn_version}' "
+            + f"for cuda-{cuda_version} and Ubuntu '{ubuntu_version}'. Supported are {compatible_cudnn_versions}"
+        )
+        return False
+    return True
 
 
 def check_cudnn_version(config: dict):
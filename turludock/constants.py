@@ -3,3 +3,35 @@ ROS_VERSION_MAP = {"noetic": 1, "humble": 2, "iron": 2, "jazzy": 2}
 
 # ROS release dates since epoch
 ROS_VERSION_RELEASE_DATE_MAP = {"noetic": 1590264000, "humble": 1653336000, "iron": 1684872000, "jazzy": 1716494400}
+
+# Time-to-live of the on-disk cache for remote version lookups (git tags, GitHub tags, LLVM versions)
+REMOTE_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Assets that are copied next to the generated Dockerfile, see 'assets/dockerfile_assets'
+DOCKERFILE_ASSETS = ["entrypoint_setup.sh", "terminator_config"]
+
+# Docker label holding the content hash of the generated Dockerfile and its assets
+CONTENT_HASH_LABEL = "com.turlucode.content_hash"
+
+# Docker label holding the name of the user baked into the image, empty if none, see 'turludock build --bake-user'
+USER_LABEL = "com.turlucode.user"
+
+# Placeholder used in the Dockerfile until its content hash is computed
+CONTENT_HASH_PLACEHOLDER = "__TURLUDOCK_CONTENT_HASH__"
+
+# How CMake is installed, see 'cmake_install_strategy' in the .yaml configuration
+CMAKE_INSTALL_STRATEGIES = ["source", "binary"]
+DEFAULT_CMAKE_INSTALL_STRATEGY = "source"
+
+# ROS variants, i.e. the metapackage 'ros-<distro>-<variant>' that is installed, see 'ros_variant' in the .yaml
+ROS_VARIANTS = ["ros-core", "ros-base", "desktop", "desktop-full", "perception"]
+
+# How apt and dpkg are configured in the image, see 'build_profile' in the .yaml configuration
+BUILD_PROFILES = ["default", "fast"]
+DEFAULT_BUILD_PROFILE = "default"
+
+# Remotes of the version lookups. The environment variables override them, e.g. to use local stand-ins.
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_API_URL_ENV = "TURLUDOCK_GITHUB_API_URL"
+LLVM_SCRIPT_URL = "https://apt.llvm.org/llvm.sh"
+LLVM_SCRIPT_URL_ENV = "TURLUDOCK_LLVM_SCRIPT_URL"
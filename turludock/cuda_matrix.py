@@ -0,0 +1,128 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from turludock.yaml_load import load_cuda_config, load_cudnn_config
+
+
+class CudaMatrix:
+    """The supported CUDA/cuDNN versions per Ubuntu version, indexed for lookups.
+
+    Built from 'nvidia_cuda.yaml' and 'nvidia_cudnn.yaml'. Use 'get_cuda_matrix()' to get the instance that
+    is loaded once per process. The returned table entries are shared, so do not modify them.
+
+    Args:
+        cuda_config (Dict[str, Any]): The parsed 'nvidia_cuda.yaml'
+        cudnn_config (Dict[str, Any]): The parsed 'nvidia_cudnn.yaml'
+    """
+
+    def __init__(self, cuda_config: Dict[str, Any], cudnn_config: Dict[str, Any]) -> None:
+        # (cuda_version, ubuntu_version) -> CUDA table entry
+        self._cuda: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+        # (cudnn_version, ubuntu_version) -> cuDNN table entry
+        self._cudnn: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+        # ubuntu_version -> cuda_version -> compatible cudnn_versions
+        self._by_ubuntu: Dict[str, Dict[str, List[str]]] = dict()
+
+        for cuda_version, ubuntu_entries in cuda_config.items():
+            for ubuntu_version, entry in ubuntu_entries.items():
+                self._cuda[(cuda_version, ubuntu_version)] = entry
+                self._by_ubuntu.setdefault(ubuntu_version, dict())[cuda_version] = list()
+        for cudnn_version, ubuntu_entries in cudnn_config.items():
+            for ubuntu_version, entry in ubuntu_entries.items():
+                self._cudnn[(cudnn_version, ubuntu_version)] = entry
+                for cuda_version in entry["cuda_version"]:
+                    if cuda_version in self._by_ubuntu.get(ubuntu_version, dict()):
+                        self._by_ubuntu[ubuntu_version][cuda_version].append(cudnn_version)
+
+        self._cuda_versions = set(cuda_config)
+        self._cudnn_versions = set(cudnn_config)
+
+    def has_cuda_version(self, cuda_version: str) -> bool:
+        """Checks if the CUDA version is known for any Ubuntu version.
+
+        Args:
+            cuda_version (str): The CUDA version
+
+        Returns:
+            bool: True if the CUDA version is in the table, False otherwise
+        """
+        return cuda_version in self._cuda_versions
+
+    def has_cudnn_version(self, cudnn_version: str) -> bool:
+        """Checks if the cuDNN version is known for any Ubuntu version.
+
+        Args:
+            cudnn_version (str): The cuDNN version
+
+        Returns:
+            bool: True if the cuDNN version is in the table, False otherwise
+        """
+        return cudnn_version in self._cudnn_versions
+
+    def get_cuda_entry(self, cuda_version: str, ubuntu_version: str) -> Optional[Dict[str, Any]]:
+        """Get the CUDA table entry of a CUDA and Ubuntu version.
+
+        Args:
+            cuda_version (str): The CUDA version
+            ubuntu_version (str): The 'flat' Ubuntu version, e.g. 'ubuntu2204'
+
+        Returns:
+            Optional[Dict[str, Any]]: The table entry, or None if the combination is not supported
+        """
+        return self._cuda.get((cuda_version, ubuntu_version))
+
+    def get_cudnn_entry(self, cudnn_version: str, ubuntu_version: str) -> Optional[Dict[str, Any]]:
+        """Get the cuDNN table entry of a cuDNN and Ubuntu version.
+
+        Args:
+            cudnn_version (str): The cuDNN version
+            ubuntu_version (str): The 'flat' Ubuntu version, e.g. 'ubuntu2204'
+
+        Returns:
+            Optional[Dict[str, Any]]: The table entry, or None if the combination is not supported
+        """
+        return self._cudnn.get((cudnn_version, ubuntu_version))
+
+    def get_supported_cuda_versions(self, ubuntu_version: str) -> List[str]:
+        """Get the CUDA versions supported by an Ubuntu version.
+
+        Args:
+            ubuntu_version (str): The 'flat' Ubuntu version, e.g. 'ubuntu2204'
+
+        Returns:
+            List[str]: The supported CUDA versions in table order
+        """
+        return list(self._by_ubuntu.get(ubuntu_version, dict()))
+
+    def get_compatible_cudnn_versions(self, cuda_version: str, ubuntu_version: str) -> List[str]:
+        """Get the cuDNN versions compatible with a CUDA version on an Ubuntu version.
+
+        Args:
+            cuda_version (str): The CUDA version
+            ubuntu_version (str): The 'flat' Ubuntu version, e.g. 'ubuntu2204'
+
+        Returns:
+            List[str]: The compatible cuDNN versions in table order
+        """
+        return list(self._by_ubuntu.get(ubuntu_version, dict()).get(cuda_version, list()))
+
+
+_cuda_matrix: Optional[CudaMatrix] = None
+_cuda_matrix_lock = threading.Lock()
+
+
+def get_cuda_matrix() -> CudaMatrix:
+    """Get the CUDA/cuDNN matrix, loading the tables on first use.
+
+    Returns:
+        CudaMatrix: The CUDA/cuDNN matrix
+    """
+    global _cuda_matrix
+    if _cuda_matrix is None:
+        with _cuda_matrix_lock:
+            if _cuda_matrix is None:
+                _cuda_matrix = CudaMatrix(load_cuda_config(), load_cudnn_config())
+                logger.debug("Loaded CUDA/cuDNN matrix")
+    return _cuda_matrix
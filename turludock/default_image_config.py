@@ -1,9 +1,35 @@
+import copy
+import fnmatch
 import os
+from typing import Dict, List, Optional
 
 from turludock.config_parser import get_config_filename, get_config_name
 from turludock.helper_functions import list_packaged_yaml_files
 from turludock.yaml_load import load_default_image_configuration
 
+# The parsed pre-configurations by name, see 'get_preset_index()'
+_preset_index: Optional[Dict[str, dict]] = None
+
+
+def get_preset_index() -> Dict[str, dict]:
+    """Get the index of all configurations that exist as asset in our module.
+
+    The packaged YAML files are parsed once per process. Building the index is a purely local operation,
+    no configuration is checked against any remote.
+
+    Returns:
+        Dict[str, dict]: The parsed configuration of each pre-configuration name, sorted by name.
+    """
+    global _preset_index
+    if _preset_index is None:
+        yaml_config_files = list_packaged_yaml_files(os.path.join("assets", "default_image_configurations"))
+        index = dict()
+        for yaml_config_full_path in sorted(yaml_config_files, key=get_config_name):
+            yaml_filename = get_config_filename(yaml_config_full_path)
+            index[get_config_name(yaml_filename)] = load_default_image_configuration(yaml_filename)
+        _preset_index = index
+    return _preset_index
+
 
 def configuration_exists(config_name: str) -> bool:
     """Check if a configuration with the given name exists as asset in our module.
@@ -16,12 +42,7 @@ def configuration_exists(config_name: str) -> bool:
     Returns:
         bool: True if the configuration exists, False otherwise.
     """
-    yaml_config_files = list_packaged_yaml_files(os.path.join("assets", "default_image_configurations"))
-    for yaml_config in yaml_config_files:
-        valid_config_name = get_config_name(yaml_config)
-        if config_name == valid_config_name:
-            return True
-    return False
+    return config_name in get_preset_index()
 
 
 def get_yaml_config(config_name: str) -> dict:
@@ -31,20 +52,50 @@ def get_yaml_config(config_name: str) -> dict:
         config_name (str): The name of the configuration to retrieve.
 
     Returns:
-        dict: The configuration loaded from the YAML file.
+        dict: A copy of the configuration loaded from the YAML file.
 
     Raises:
         ValueError: If the provided configuration name does not exist.
     """
-    yaml_config_files = list_packaged_yaml_files(os.path.join("assets", "default_image_configurations"))
-    yaml_config = None
-    for yaml_config_full_path in yaml_config_files:
-        if config_name == get_config_name(yaml_config_full_path):
-            yaml_filename = get_config_filename(yaml_config_full_path)
-            yaml_config = load_default_image_configuration(yaml_filename)
-            return yaml_config
-    if yaml_config is None:
+    preset_index = get_preset_index()
+    if config_name not in preset_index:
         raise ValueError(
             f"Provided pre-configuration '{config_name}' doesn't exist! "
             + "List available with 'turludock which preset'"
         )
+    # The configuration is extended while generating, e.g. with a lock. Keep the index untouched.
+    return copy.deepcopy(preset_index[config_name])
+
+
+def list_configuration_names() -> List[str]:
+    """List the names of all configurations that exist as asset in our module.
+
+    Returns:
+        List[str]: The sorted names of the pre-configurations, e.g. ['humble_mesa', 'humble_nvidia', ...]
+    """
+    return list(get_preset_index())
+
+
+def expand_configuration_names(patterns: List[str]) -> List[str]:
+    """Expand a list of configuration names and glob patterns to the matching configuration names.
+
+    Args:
+        patterns (List[str]): Configuration names or glob patterns, e.g. ['noetic_mesa', 'humble_*']
+
+    Returns:
+        List[str]: The matching configuration names without duplicates, in the order of the given patterns.
+
+    Raises:
+        ValueError: If a configuration name or pattern does not match any configuration.
+    """
+    available_config_names = list_configuration_names()
+    config_names = list()
+    for pattern in patterns:
+        matches = fnmatch.filter(available_config_names, pattern)
+        if len(matches) == 0:
+            raise ValueError(
+                f"Provided pre-configuration '{pattern}' doesn't exist! "
+                + "List available with 'turludock which presets'"
+            )
+        config_names += [match for match in matches if match not in config_names]
+    return config_names
@@ -1,15 +1,27 @@
+import contextlib
 import os
-import tempfile
-from typing import Any, Dict
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, Any, Dict, List, Optional
 
 import docker
 from loguru import logger
+from termcolor import colored
 
+import turludock.constants as constants
 import turludock.default_image_config as default_image_config
+from turludock.build_context import create_build_context
+from turludock.build_history import record_build
 from turludock.build_progress import BuildProgress
-from turludock.config_parser import check_dockerfile_config
-from turludock.filesystem_operations import copy_resource, get_filename_from_path
+from turludock.config_parser import check_dockerfile_config, get_config_name, print_configuration
+from turludock.filesystem_operations import get_filename_from_path
 from turludock.generate_dockerfile import generate_dockerfile
+from turludock.generate_templated_files import get_base_image
+from turludock.helper_functions import get_content_hash, get_host_user_build_args
+from turludock.lockfile import apply_lockfile, apply_lockfile_if_present, compute_config_hash
 from turludock.yaml_load import load_yaml_file
 
 
@@ -29,6 +41,10 @@ def _generate_image_tag(yaml_config: Dict[str, Any]) -> str:
     tag_name += f"ros-{ros_version.lower()}"
     tag_name += f':{yaml_config["gpu_driver"].lower()}'
 
+    # Slim and full images of the same configuration get different tags
+    if "ros_variant" in yaml_config:
+        tag_name += f'-{yaml_config["ros_variant"]}'
+
     if "cuda_version" in yaml_config:
         tag_name += f'-cuda{yaml_config["cuda_version"]}'
     if "cudnn_version" in yaml_config:
@@ -45,58 +61,260 @@ def _generate_image_tag(yaml_config: Dict[str, Any]) -> str:
     return tag_name
 
 
-def build_image(docker_image_path: str, build_args: dict) -> None:
-    """Build a Docker image using docker api
+def _find_image_by_content_hash(client: docker.DockerClient, content_hash: str, user_name: str = "") -> Optional[Any]:
+    """Find a local image that has been built from an identical Dockerfile and assets.
 
     Args:
-        docker_image_path (str): The path to the Dockerfile to build.
-        build_args (dict): The build arguments to use.
+        client (docker.DockerClient): The docker client
+        content_hash (str): The content hash of the Dockerfile and its assets
+        user_name (str, optional): The user baked into the image. Defaults to "", i.e. no baked-in user.
+
+    Returns:
+        Optional[docker.models.images.Image]: The image carrying the content hash label, or None if not found
     """
-    try:
-        # Initialize the progress bar if needed
-        if not build_args["verbose"]:
-            build_progress = BuildProgress()
+    images = client.images.list(filters={"label": f"{constants.CONTENT_HASH_LABEL}={content_hash}"})
+    # The content hash does not cover the build args, so the baked-in user is compared separately
+    images = [image for image in images if image.labels.get(constants.USER_LABEL, "") == user_name]
+    if len(images) == 0:
+        return None
+    # Prefer the most recently created image
+    return max(images, key=lambda image: image.attrs.get("Created", ""))
+
+
+def reuse_existing_image(dockerfile: str, tag: str, user_name: str = "") -> bool:
+    """Reuse an existing image with identical configuration instead of building it again.
+
+    If an image carrying the same content hash and baked-in user exists on the local docker daemon, it is
+    tagged with the given tag (if not already) and the build can be skipped.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+        tag (str): The tag of the image to build
+        user_name (str, optional): The user baked into the image. Defaults to "", i.e. no baked-in user.
 
-        # Connect to the Docker daemon
+    Returns:
+        bool: True if an existing image has been reused, False otherwise
+    """
+    content_hash = get_content_hash(dockerfile)
+    if content_hash is None:
+        return False
+
+    try:
         client = docker.from_env()
+        image = _find_image_by_content_hash(client, content_hash, user_name)
+        if image is None:
+            logger.debug(f"No existing image found with content hash '{content_hash}'")
+            return False
+
+        # Retag the image if needed
+        if tag not in image.tags and f"{tag}:latest" not in image.tags:
+            repository, image_tag = docker.utils.parse_repository_tag(tag)
+            image.tag(repository, tag=image_tag)
+            logger.debug(f"Tagged existing image '{image.id}' as '{tag}'")
+    except docker.errors.DockerException as e:
+        logger.warning(f"Could not check for existing images. Building image. Error: {e}")
+        return False
+
+    print("")
+    logger.info(f"Image with identical configuration already exists. Skipping build: '{tag}' ({image.id})")
+    return True
 
-        # Build the Docker image
-        # Not using client.images.build so we can monitor the progress in real-time
-        # See also: https://github.com/docker/docker-py/issues/376#issue-46825714
-        response = client.api.build(
-            path=docker_image_path,
-            rm=True,  # Remove intermediate containers after a successful build
-            tag=build_args["tag"],
-            decode=True,  # The returned stream will be decoded into dicts on the fly
-            nocache=build_args["no_cache"],  # Don't use the cache
+
+def is_buildx_available() -> bool:
+    """Checks if the 'docker buildx' plugin is available, which is needed for the BuildKit backend.
+
+    Returns:
+        bool: True if 'docker buildx' is available, False otherwise
+    """
+    try:
+        subprocess.run(
+            ["docker", "buildx", "version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
         )
+        return True
+    except (OSError, subprocess.CalledProcessError):
+        return False
 
-        # Process and print build logs in real-time
+
+def _write_build_context(stdin: IO[str], build_context: IO[bytes]) -> None:
+    """Stream the build context to the stdin of 'docker buildx build -' and close it.
+
+    Args:
+        stdin (IO[str]): The stdin of the build process
+        build_context (IO[bytes]): The tar archive of the build context
+    """
+    try:
+        shutil.copyfileobj(build_context, stdin.buffer)
+        stdin.close()
+    except BrokenPipeError:
+        # The build process exited early, its output tells why
+        pass
+
+
+def build_image_buildkit(build_context: IO[bytes], build_args: dict, build_progress: BuildProgress) -> Any:
+    """Build a Docker image using BuildKit through 'docker buildx build'
+
+    BuildKit executes independent build stages in parallel and supports cache mounts. Its plain progress
+    output is parsed to advance the progress bar. The build context is streamed through stdin.
+
+    If 'build_args["log_file"]' is set, the build output is written to that file instead of the terminal.
+
+    Args:
+        build_context (IO[bytes]): The tar archive of the build context, optionally gzipped.
+        build_args (dict): The build arguments to use.
+        build_progress (BuildProgress): Tracks the progress and the step timings of the build.
+
+    Returns:
+        docker.models.images.Image: The built image
+    """
+    log_file = build_args.get("log_file")
+
+    # '--load' makes sure the image ends up in the local image store, independent of the buildx driver
+    command = ["docker", "buildx", "build", "--progress=plain", "--load", "--tag", build_args["tag"]]
+    if build_args["no_cache"]:
+        command.append("--no-cache")
+    for name, value in build_args.get("user_build_args", dict()).items():
+        command += ["--build-arg", f"{name}={value}"]
+    command.append("-")
+    logger.debug(f"Running: {' '.join(command)}")
+
+    # Process and print build logs in real-time. BuildKit writes its progress to stderr.
+    last_lines: List[str] = list()
+    with open(log_file, "w", encoding="utf-8") if log_file else contextlib.nullcontext() as log:
+        with subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+        ) as process:
+            writer = threading.Thread(target=_write_build_context, args=(process.stdin, build_context), daemon=True)
+            writer.start()
+            for line in process.stdout:
+                if log is not None:
+                    log.write(line)
+                elif build_args["verbose"]:
+                    print(line, end="", flush=True)
+                build_progress.advance_buildkit(line)
+                last_lines = (last_lines + [line.rstrip()])[-10:]
+            writer.join()
+        if process.returncode != 0:
+            raise RuntimeError("Docker buildx build error:\n" + "\n".join(last_lines))
+
+    client = docker.from_env()
+    return client.images.get(build_args["tag"])
+
+
+def _build_image_legacy(build_context: IO[bytes], build_args: dict, build_progress: BuildProgress) -> Any:
+    """Build a Docker image using the legacy builder of the docker api
+
+    If 'build_args["log_file"]' is set, the build output is written to that file instead of the terminal.
+
+    Args:
+        build_context (IO[bytes]): The tar archive of the build context, optionally gzipped.
+        build_args (dict): The build arguments to use.
+        build_progress (BuildProgress): Tracks the progress and the step timings of the build.
+
+    Returns:
+        docker.models.images.Image: The built image
+    """
+    log_file = build_args.get("log_file")
+
+    # Connect to the Docker daemon
+    client = docker.from_env()
+
+    # Build the Docker image
+    # Not using client.images.build so we can monitor the progress in real-time
+    # See also: https://github.com/docker/docker-py/issues/376#issue-46825714
+    response = client.api.build(
+        fileobj=build_context,
+        custom_context=True,  # The build context is already a tar archive
+        encoding="gzip" if build_args.get("compress_context", False) else None,
+        rm=True,  # Remove intermediate containers after a successful build
+        tag=build_args["tag"],
+        decode=True,  # The returned stream will be decoded into dicts on the fly
+        nocache=build_args["no_cache"],  # Don't use the cache
+        buildargs=build_args.get("user_build_args"),  # Bake the user into the image, see '--bake-user'
+    )
+
+    # Process and print build logs in real-time
+    with open(log_file, "w", encoding="utf-8") if log_file else contextlib.nullcontext() as log:
         try:
             for chunk in response:
                 if "stream" in chunk:
-                    if build_args["verbose"]:
+                    if log is not None:
+                        log.write(chunk["stream"])
+                    elif build_args["verbose"]:
                         print(chunk["stream"], end="", flush=True)
-                    else:
-                        build_progress.advance(chunk["stream"])
+                    build_progress.advance(chunk["stream"])
                 elif "errorDetail" in chunk:
-                    if build_args["verbose"]:
+                    if log is not None:
+                        log.write(chunk["errorDetail"]["message"])
+                    elif build_args["verbose"]:
                         print(chunk["errorDetail"]["message"], end="", flush=True)
                     raise RuntimeError(f"Docker build error: {chunk['errorDetail']['message']}")
         except Exception as e:
             logger.error(f"client.api.build Error: {e}")
             raise
 
-        if not build_args["verbose"]:
-            build_progress.finish()
+    return client.images.get(build_args["tag"])
+
+
+def build_image(dockerfile: str, build_args: dict) -> None:
+    """Build a Docker image using docker api
+
+    The build context with the Dockerfile and its assets is assembled in memory, see
+    'build_context.create_build_context()'. If 'build_args["compress_context"]' is set, it is gzipped,
+    which pays off for remote Docker daemons.
+
+    If 'build_args["builder"]' is "buildkit", the build is delegated to 'build_image_buildkit()'. Otherwise the
+    legacy builder of the docker api is used. The builder must match the one the Dockerfile has been generated
+    for, see 'build_image_from_yaml_config()'.
+
+    If 'build_args["log_file"]' is set, the build output is written to that file instead of the terminal.
+
+    Every build, successful or not, is recorded in the build history, see 'build_history.record_build()'.
+
+    Args:
+        dockerfile (str): The generated Dockerfile to build.
+        build_args (dict): The build arguments to use. 'config_name', 'config_hash' and 'build_profile' are
+            recorded in the build history if present. 'user_build_args' are passed to the Dockerfile as build
+            args, see '--bake-user'.
+    """
+    builder = build_args.get("builder", "legacy")
+
+    # The steps are always timed, the progress bar is only shown if the output is not printed or logged
+    show_progress = not build_args["verbose"] and build_args.get("log_file") is None
+    build_progress = BuildProgress(dockerfile, show_progress)
+    build_record = {
+        "config_name": build_args.get("config_name", build_args["tag"]),
+        "config_hash": build_args.get("config_hash"),
+        "build_profile": build_args.get("build_profile"),
+        "tag": build_args["tag"],
+        "builder": builder,
+        "start_time": time.time(),
+        "image_size": None,
+        "error": None,
+    }
+
+    try:
+        build_context = create_build_context(dockerfile, build_args.get("compress_context", False))
+        if builder == "buildkit":
+            image = build_image_buildkit(build_context, build_args, build_progress)
+        else:
+            image = _build_image_legacy(build_context, build_args, build_progress)
+        build_progress.finish()
+        build_record.update({"status": "success", "image_size": image.attrs.get("Size")})
 
         # Print the ID of the built image
-        image = client.images.get(build_args["tag"])
         print("")
         logger.info(f"Built image: '{build_args['tag']}' ({image.id})")
     except Exception as e:
+        build_progress.finish(False)
+        build_record.update({"status": "failed", "error": str(e)})
         logger.error(f"Could not build image. Error: {e}")
         raise
+    finally:
+        build_record["end_time"] = time.time()
+        record_build(build_record, build_progress.step_timings)
 
 
 def build_image_from_yaml_config(yaml_config: dict, build_args: dict) -> None:
@@ -109,36 +327,54 @@ def build_image_from_yaml_config(yaml_config: dict, build_args: dict) -> None:
     # Check Dockerfile .yaml configuration
     check_dockerfile_config(yaml_config)
 
-    # Generate Dockerfile based on configuration
-    dockerfile = generate_dockerfile(yaml_config)
-
+    # Fall back to the legacy builder before generating the Dockerfile, which uses the BuildKit features only if
+    # BuildKit is actually used
+    if build_args.get("builder") == "buildkit" and not is_buildx_available():
+        logger.warning("'docker buildx' is not available. Falling back to the legacy builder.")
+        build_args["builder"] = "legacy"
+
+    # Generate Dockerfile based on configuration. Concurrent builds, which log to a file, do not print the
+    # configuration, so the output of the builds does not interleave.
+    dockerfile = generate_dockerfile(
+        yaml_config,
+        build_args.get("builder") == "buildkit",
+        build_args.get("legacy_layer_order", False),
+        build_args.get("source_cache", False),
+        print_config=build_args.get("log_file") is None,
+    )
+
+    # Bake the current host user into the image
+    if build_args.get("bake_user", False):
+        build_args["user_build_args"] = get_host_user_build_args()
+        if build_args["user_build_args"]["DOCKER_USER_NAME"] == "root":
+            logger.warning("The current user is 'root', which the image already runs as. Not baking in the user.")
+            del build_args["user_build_args"]
+
+    # Images with a baked-in user get their own tag, so they do not replace the generic image
+    user_name = build_args.get("user_build_args", dict()).get("DOCKER_USER_NAME", "")
     if build_args["tag"] is None:
         build_args["tag"] = _generate_image_tag(yaml_config)
+        if user_name:
+            build_args["tag"] += f"-user-{user_name}"
 
-    # Create a temporary directory where we store the generated Dockerfile and its assets.
-    # Important: when TemporaryDirectory() goes out of scope it deletes it.
-    # So everything needs to happen within 'tempfile.TemporaryDirectory()'
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # print(f"Temporary directory created at: {temp_dir}")
-
-        # Store generated Dockerfile in tmp directory
-        dockerfile_path = os.path.join(temp_dir, "Dockerfile")
-        with open(dockerfile_path, "w", encoding="utf-8") as file:
-            file.write(dockerfile)
+    # Identify the build in the build history
+    build_args["config_name"] = get_config_name(yaml_config["filename"])
+    build_args["config_hash"] = compute_config_hash(yaml_config)
+    build_args["build_profile"] = yaml_config.get("build_profile", constants.DEFAULT_BUILD_PROFILE)
 
-        # Copy over Dockerfile assets
-        copy_resource("turludock.assets.dockerfile_assets", "entrypoint_setup.sh", temp_dir)
-        copy_resource("turludock.assets.dockerfile_assets", "terminator_config", temp_dir)
+    # Nothing to build if an image with identical configuration exists. '--no-cache' forces a rebuild.
+    if not build_args["no_cache"] and reuse_existing_image(dockerfile, build_args["tag"], user_name):
+        return
 
-        # Build image
-        build_image(temp_dir, build_args)
+    # Build image
+    build_image(dockerfile, build_args)
 
 
 def build_pre_configured_image(config_name: str, build_args: dict) -> None:
     """Build an image given a provided by us configuration, a.k.a. pre-configuration
 
     All the pre-configuration are located in 'assets/default_image_configurations' and
-    these are the ones we support basically.
+    these are the ones we support basically. A lockfile is only used if it is provided via 'build_args["lockfile"]'.
 
     Args:
         config_name (str): The name of the pre-configured image to build
@@ -146,6 +382,8 @@ def build_pre_configured_image(config_name: str, build_args: dict) -> None:
     """
     try:
         yaml_config = default_image_config.get_yaml_config(config_name)
+        if build_args.get("lockfile") is not None:
+            apply_lockfile(yaml_config, build_args["lockfile"])
         build_image_from_yaml_config(yaml_config, build_args)
     except Exception as e:
         logger.error(f"Could not build pre-configured image. {e}")
@@ -155,6 +393,8 @@ def build_pre_configured_image(config_name: str, build_args: dict) -> None:
 def build_custom_image(yaml_config_path: str, build_args: dict) -> None:
     """Build a Docker image based on a provided/custom YAML configuration
 
+    If 'build_args["lockfile"]' is not set, the lockfile next to the YAML configuration is used if it exists.
+
     Args:
         yaml_config_path (str): The path to the YAML configuration
         build_args (dict): The build arguments for the 'docker build' command
@@ -163,8 +403,124 @@ def build_custom_image(yaml_config_path: str, build_args: dict) -> None:
         # Load .yaml file
         yaml_config = load_yaml_file(yaml_config_path)
         yaml_config.update({"filename": get_filename_from_path(yaml_config_path)})
+        # Use the lockfile if provided or if one exists next to the .yaml file
+        apply_lockfile_if_present(yaml_config, yaml_config_path, build_args.get("lockfile"))
         # Build custom-image
         build_image_from_yaml_config(yaml_config, build_args)
     except Exception:
         logger.error("Could not build custom-image")
         raise
+
+
+def _order_by_base_image(config_names: List[str]) -> List[List[str]]:
+    """Group the pre-configurations by their base image.
+
+    Pre-configurations that share a base image also share their first layers. Within a group the first
+    pre-configuration is built alone, so it warms the layer cache for the rest of the group.
+
+    Args:
+        config_names (List[str]): The names of the pre-configurations
+
+    Returns:
+        List[List[str]]: The pre-configurations grouped by base image, keeping the given order
+    """
+    groups: Dict[str, List[str]] = dict()
+    for config_name in config_names:
+        yaml_config = default_image_config.get_yaml_config(config_name)
+        groups.setdefault(get_base_image(yaml_config), list()).append(config_name)
+    return list(groups.values())
+
+
+def _build_pre_configured_image_logged(config_name: str, build_args: dict) -> Dict[str, Any]:
+    """Build a pre-configured image and record the outcome.
+
+    Args:
+        config_name (str): The name of the pre-configured image to build
+        build_args (dict): The build arguments for 'docker build' command
+
+    Returns:
+        Dict[str, Any]: The build result with the keys 'config_name', 'success', 'duration', 'log_file' and 'error'
+    """
+    start_time = time.monotonic()
+    try:
+        build_pre_configured_image(config_name, build_args)
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {
+        "config_name": config_name,
+        "success": error is None,
+        "duration": time.monotonic() - start_time,
+        "log_file": build_args["log_file"],
+        "error": error,
+    }
+
+
+def _print_build_summary(results: List[Dict[str, Any]]) -> None:
+    """Print the aggregated pass/fail summary of multiple builds.
+
+    Args:
+        results (List[Dict[str, Any]]): The build results as returned by '_build_pre_configured_image_logged()'
+    """
+    print("")
+    logger.info("Build summary:")
+    for result in results:
+        if result["success"]:
+            status_str = colored("PASS", "green", attrs=["bold"])
+        else:
+            status_str = colored("FAIL", "red", attrs=["bold"])
+        minutes, seconds = divmod(int(result["duration"]), 60)
+        print(f"{status_str} {result['config_name']: <20} {minutes:>3}m{seconds:02d}s | log: {result['log_file']}")
+    num_failed = sum(1 for result in results if not result["success"])
+    print("")
+    if num_failed == 0:
+        logger.info(f"All {len(results)} builds succeeded.")
+    else:
+        logger.error(f"{num_failed} of {len(results)} builds failed.")
+
+
+def build_pre_configured_images(config_names: List[str], build_args: dict, jobs: int, log_dir: str) -> bool:
+    """Build several pre-configured images concurrently.
+
+    At most 'jobs' builds run at the same time against the docker daemon. Each build uses its own
+    temporary build context and writes its output to '<log_dir>/<config_name>.log'. Pre-configurations
+    sharing a base image are ordered so the first build warms the layer cache for the rest.
+
+    The configurations are printed upfront, the builds themselves only log single lines to the terminal.
+
+    Args:
+        config_names (List[str]): The names of the pre-configured images to build
+        build_args (dict): The build arguments for 'docker build' command. 'tag' must be None.
+        jobs (int): The maximum number of concurrent builds
+        log_dir (str): The directory where to store the per-build logs
+
+    Returns:
+        bool: True if all builds succeeded, False otherwise
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    groups = _order_by_base_image(config_names)
+    logger.info(f"Building {len(config_names)} images with up to {jobs} concurrent jobs. Logs in '{log_dir}'")
+    print("")
+    logger.info("Configurations:")
+    for config_name in config_names:
+        print_configuration(default_image_config.get_yaml_config(config_name))
+
+    def submit(executor: ThreadPoolExecutor, config_name: str) -> Any:
+        config_build_args = dict(build_args)
+        config_build_args.update({"tag": None, "log_file": os.path.join(log_dir, f"{config_name}.log")})
+        return executor.submit(_build_pre_configured_image_logged, config_name, config_build_args)
+
+    results = dict()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Start with the first build of each group; the rest of the group follows once it finished
+        pending = {submit(executor, group[0]): group[1:] for group in groups}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[result["config_name"]] = result
+                for config_name in pending.pop(future):
+                    pending[submit(executor, config_name)] = list()
+
+    _print_build_summary([results[config_name] for config_name in config_names])
+    return all(result["success"] for result in results.values())
@@ -0,0 +1,611 @@
+import re
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+# The parts of a RUN instruction that only installs apt packages, see '_parse_apt_run()'
+_APT_UPDATE = "apt-get update"
+_APT_CLEANUP = ["apt-get clean", "rm -rf /var/lib/apt/lists/*"]
+
+# RUN instructions that change the apt sources or the package states. Apt installs are not moved across them.
+_APT_STATE_PATTERN = re.compile(r"add-apt-repository|apt-key|apt-mark|dpkg -i|/etc/apt/|llvm\.sh")
+
+# Matches the comment line that names what an apt install of a fragment installs, e.g. '# Install ROS 2 (humble)'
+_INSTALL_COMMENT_PATTERN = re.compile(r"^# Install (.+)\n", re.MULTILINE)
+
+# Package lists longer than this are rendered one package per line
+_MAX_INLINE_PACKAGES_LENGTH = 60
+
+# Matches a 'key=value' pair of an ENV or LABEL instruction, the value is either double-quoted or a single word
+_KEY_VALUE_PATTERN = re.compile(r'([^\s=]+)=("(?:[^"\\]|\\.)*"|[^\s"]*)(?=\s|$)')
+
+# Matches the variables an ENV value references, e.g. '$PATH' or '${PATH}'
+_VARIABLE_PATTERN = re.compile(r"\$\{?(\w+)")
+
+
+class Instruction:
+    """A Dockerfile instruction, tagged with the fragment that created it.
+
+    Args:
+        text (str): The instruction including its line continuations and trailing newline, e.g. 'RUN make\\n'.
+            Empty for the comments at the end of a fragment.
+        fragment (str): The name of the fragment that created the instruction, e.g. 'cuda_base'
+        comments (str, optional): The comment and empty lines preceding the instruction. Defaults to "".
+    """
+
+    def __init__(self, text: str, fragment: str, comments: str = "") -> None:
+        self.text = text
+        self.fragment = fragment
+        self.comments = comments
+
+    @property
+    def text(self) -> str:
+        """The instruction including its line continuations and trailing newline."""
+        return self._text
+
+    @text.setter
+    def text(self, text: str) -> None:
+        # The passes query the keyword and the arguments often, so they are derived once per text
+        self._text = text
+        words = text.split(maxsplit=1)
+        self._keyword = words[0].upper() if words else None
+        self._arguments = " ".join(words[1].replace("\\\n", " ").split()) if len(words) > 1 else ""
+
+    @property
+    def keyword(self) -> Optional[str]:
+        """The upper-case keyword of the instruction, e.g. 'RUN', or None for trailing comments."""
+        return self._keyword
+
+    @property
+    def arguments(self) -> str:
+        """The arguments of the instruction with line continuations joined, e.g. 'apt-get update && ...'."""
+        return self._arguments
+
+    def render(self) -> str:
+        """Render the instruction and its preceding comments as Dockerfile text.
+
+        Returns:
+            str: The Dockerfile text
+        """
+        return self.comments + self.text
+
+
+def parse_fragment(fragment_text: str, fragment: str) -> List[Instruction]:
+    """Parse a rendered Dockerfile fragment into instructions.
+
+    Comment and empty lines are attached to the next instruction, so that rendering the instructions
+    again results in the original text.
+
+    Args:
+        fragment_text (str): The rendered fragment
+        fragment (str): The name of the fragment
+
+    Returns:
+        List[Instruction]: The instructions of the fragment
+    """
+    instructions = list()
+    comments = ""
+    current = ""
+    for line in fragment_text.splitlines(keepends=True):
+        if not current and (not line.strip() or line.lstrip().startswith("#")):
+            comments += line
+            continue
+        current += line
+        if not line.rstrip("\n").rstrip().endswith("\\"):
+            instructions.append(Instruction(current, fragment, comments))
+            comments = current = ""
+    if current or comments:
+        instructions.append(Instruction(current, fragment, comments))
+    return instructions
+
+
+def render(instructions: List[Instruction]) -> str:
+    """Render instructions as Dockerfile.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        str: The Dockerfile
+    """
+    return "".join(instruction.render() for instruction in instructions)
+
+
+def _remove(instructions: List[Instruction], index: int, target: Optional[Instruction] = None) -> None:
+    """Remove an instruction and hand its comments over exactly once.
+
+    The comments go to the next instruction of the same fragment, so they stay with the rest of the fragment.
+    If the fragment has no instructions left, they go to the instruction the removed one has been merged into
+    or are dropped if there is none.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        index (int): The index of the instruction to remove
+        target (Optional[Instruction], optional): The instruction the removed one has been merged into.
+            Defaults to None.
+    """
+    removed = instructions.pop(index)
+    for instruction in instructions[index:]:
+        if instruction.fragment != removed.fragment:
+            break
+        # Instructions without keyword only hold the empty lines at the end of the fragment
+        if instruction.keyword is not None:
+            instruction.comments = removed.comments + instruction.comments.lstrip("\n")
+            return
+    comments = removed.comments.strip("\n")
+    if target is not None and comments:
+        target.comments += comments + "\n"
+
+
+def _has_follow_up(instructions: List[Instruction], index: int) -> bool:
+    """Check if the fragment of an instruction has further instructions after it.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        index (int): The index of the instruction
+
+    Returns:
+        bool: True if a later instruction with keyword belongs to the same fragment
+    """
+    fragment = instructions[index].fragment
+    position = index + 1
+    for instruction in instructions[position:]:
+        if instruction.fragment != fragment:
+            return False
+        if instruction.keyword is not None:
+            return True
+    return False
+
+
+def _insert_comment(instruction: Instruction, comment: str) -> None:
+    """Insert a comment line after the empty lines that precede an instruction.
+
+    Args:
+        instruction (Instruction): The instruction
+        comment (str): The comment line including the trailing newline
+    """
+    blank_lines = len(instruction.comments) - len(instruction.comments.lstrip("\n"))
+    instruction.comments = instruction.comments[:blank_lines] + comment + instruction.comments[blank_lines:]
+
+
+def _parse_apt_run(instruction: Instruction) -> Optional[Tuple[List[str], List[str]]]:
+    """Parse a RUN instruction that only installs apt packages.
+
+    That is 'RUN apt-get update && apt-get install <options> <packages> && apt-get clean && rm -rf
+    /var/lib/apt/lists/*'.
+
+    Args:
+        instruction (Instruction): The instruction
+
+    Returns:
+        Optional[Tuple[List[str], List[str]]]: The install options and the packages, or None if the
+            instruction does something else
+    """
+    if instruction.keyword != "RUN":
+        return None
+    parts = [part.strip() for part in instruction.arguments.split("&&")]
+    if len(parts) != 4 or parts[0] != _APT_UPDATE or parts[2:] != _APT_CLEANUP:
+        return None
+    if not parts[1].startswith("apt-get install "):
+        return None
+    arguments = parts[1].split()[2:]
+    options = [argument for argument in arguments if argument.startswith("-")]
+    packages = [argument for argument in arguments if not argument.startswith("-")]
+    return options, packages
+
+
+def _get_installed_packages(instruction: Instruction) -> List[str]:
+    """Get the apt packages a RUN instruction installs.
+
+    Args:
+        instruction (Instruction): The instruction
+
+    Returns:
+        List[str]: The installed packages, including their pinned versions
+    """
+    if instruction.keyword != "RUN":
+        return list()
+    packages = list()
+    for part in instruction.arguments.split("&&"):
+        arguments = part.split()
+        if arguments[:2] == ["apt-get", "install"]:
+            packages += [argument for argument in arguments[2:] if not argument.startswith("-")]
+    return packages
+
+
+def _render_apt_run(options: List[str], packages: List[str]) -> str:
+    """Render a RUN instruction that only installs apt packages.
+
+    Args:
+        options (List[str]): The install options, e.g. ['-y', '--no-install-recommends']
+        packages (List[str]): The packages
+
+    Returns:
+        str: The RUN instruction
+    """
+    install = " ".join(["apt-get", "install"] + options)
+    if len(" ".join(packages)) <= _MAX_INLINE_PACKAGES_LENGTH:
+        install += " " + " ".join(packages)
+    else:
+        install += " \\\n" + " \\\n".join(f"    {package}" for package in packages)
+    return f"RUN {_APT_UPDATE} && {install} && \\\n    {' && '.join(_APT_CLEANUP)}\n"
+
+
+def add_apt_install_options(instructions: List[Instruction], fragments: Set[str], options: List[str]) -> None:
+    """Add install options to the RUN instructions of the given fragments that only install apt packages.
+
+    Args:
+        instructions (List[Instruction]): The instructions, changed in place
+        fragments (Set[str]): The names of the fragments, e.g. 'cmake_builder'
+        options (List[str]): The install options to add, e.g. ['--no-install-recommends']
+    """
+    for instruction in instructions:
+        apt_run = _parse_apt_run(instruction) if instruction.fragment in fragments else None
+        if apt_run is None:
+            continue
+        install_options, packages = apt_run
+        missing_options = [option for option in options if option not in install_options]
+        if missing_options:
+            instruction.text = _render_apt_run(install_options + missing_options, packages)
+
+
+def remove_redundant_cudnn_runtime(instructions: List[Instruction]) -> List[Instruction]:
+    """Remove the cuDNN runtime layer if the cuDNN devel layer is present.
+
+    The devel layer installs and holds the same cuDNN runtime package and sets the same label.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        List[Instruction]: The instructions without the redundant cuDNN runtime layer
+    """
+    if not any(instruction.fragment == "cudnn_devel" for instruction in instructions):
+        return instructions
+    return [instruction for instruction in instructions if instruction.fragment != "cudnn_runtime"]
+
+
+def drop_duplicate_apt_packages(instructions: List[Instruction]) -> List[Instruction]:
+    """Drop the apt packages that an earlier instruction of the same stage already installed.
+
+    Only packages of RUN instructions that do nothing but installing apt packages are dropped. If none of
+    their packages are left, the instruction is removed, e.g. the second 'python3-pip' install of 'conan'
+    and 'cpplint'.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        List[Instruction]: The instructions without duplicate apt packages
+    """
+    instructions = list(instructions)
+    installed: Set[str] = set()
+    index = 0
+    while index < len(instructions):
+        instruction = instructions[index]
+        if instruction.keyword == "FROM":
+            installed = set()
+        apt_run = _parse_apt_run(instruction)
+        if apt_run is not None:
+            options, packages = apt_run
+            new_packages = [package for package in dict.fromkeys(packages) if package not in installed]
+            if len(new_packages) == 0:
+                logger.debug(f"Remove apt install of '{instruction.fragment}': {packages} are already installed")
+                _remove(instructions, index)
+                continue
+            if new_packages != packages:
+                instruction.text = _render_apt_run(options, new_packages)
+        installed.update(_get_installed_packages(instruction))
+        index += 1
+    return instructions
+
+
+def merge_apt_runs(instructions: List[Instruction]) -> List[Instruction]:
+    """Merge adjacent RUN instructions that only install apt packages with the same options.
+
+    Saves a layer and an 'apt-get update' per merged instruction. The comments of the merged instructions
+    are handed over, see '_remove()'.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        List[Instruction]: The instructions with merged apt installs
+    """
+    instructions = list(instructions)
+    # The install options and packages of the previous instruction, if it only installs apt packages
+    previous_apt_run = None
+    index = 0
+    while index < len(instructions):
+        instruction = instructions[index]
+        apt_run = _parse_apt_run(instruction)
+        if apt_run is None or previous_apt_run is None or sorted(apt_run[0]) != sorted(previous_apt_run[0]):
+            previous_apt_run = apt_run
+            index += 1
+            continue
+        previous = instructions[index - 1]
+        logger.debug(f"Merge apt install of '{instruction.fragment}' into the one of '{previous.fragment}'")
+        previous_apt_run = (previous_apt_run[0], list(dict.fromkeys(previous_apt_run[1] + apt_run[1])))
+        previous.text = _render_apt_run(*previous_apt_run)
+        _remove(instructions, index, previous)
+    return instructions
+
+
+def _split_key_value_pairs(arguments: str) -> Optional[List[Tuple[str, str]]]:
+    """Split the arguments of an ENV or LABEL instruction into its 'key=value' pairs.
+
+    Args:
+        arguments (str): The arguments, e.g. 'Description="ROS 2 Humble" Vendor="TurluCode"'
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: The key and the value of each pair, values keep their quotes. None if
+            the arguments are not only 'key=value' pairs.
+    """
+    pairs = list()
+    position = 0
+    for match in _KEY_VALUE_PATTERN.finditer(arguments):
+        start = match.start()
+        if arguments[position:start].strip():
+            return None
+        pairs.append((match.group(1), match.group(2)))
+        position = match.end()
+    if arguments[position:].strip() or len(pairs) == 0:
+        return None
+    return pairs
+
+
+def _parse_env(instruction: Instruction) -> Optional[List[Tuple[str, str]]]:
+    """Parse the key-value pairs of an ENV instruction, in both the 'key=value' and the legacy 'key value' form.
+
+    Args:
+        instruction (Instruction): The ENV instruction
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: The key and the quoted value of each pair, or None if the
+            instruction cannot be parsed
+    """
+    arguments = instruction.arguments
+    if not arguments:
+        return None
+    key = arguments.split(maxsplit=1)[0]
+    # Legacy form: the value is the rest of the line
+    if "=" not in key:
+        value = arguments.split(maxsplit=1)[1] if " " in arguments else ""
+        quoted = len(value) > 1 and value.startswith('"') and value.endswith('"')
+        if not quoted and re.search(r"[\s\"'\\]", value):
+            # Double quotes keep the variables in the value expanded
+            if re.search(r"[\"'\\]", value):
+                return None
+            value = f'"{value}"'
+        return [(key, value)]
+    return _split_key_value_pairs(arguments)
+
+
+def collapse_env_instructions(instructions: List[Instruction]) -> List[Instruction]:
+    """Collapse consecutive ENV instructions into one.
+
+    The variables of one ENV instruction are all set at once, so an ENV instruction is only collapsed into
+    the previous one if it does not reference a variable that the previous one sets. Instructions that are
+    preceded by a comment stay separate.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        List[Instruction]: The instructions with collapsed ENV instructions
+    """
+    return _collapse_key_value_instructions(instructions, "ENV", _parse_env)
+
+
+def _parse_label(instruction: Instruction) -> Optional[List[Tuple[str, str]]]:
+    """Parse the key-value pairs of a LABEL instruction.
+
+    Args:
+        instruction (Instruction): The LABEL instruction
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: The key and the quoted value of each pair, or None if the
+            instruction cannot be parsed
+    """
+    return _split_key_value_pairs(instruction.arguments)
+
+
+def collapse_label_instructions(instructions: List[Instruction]) -> List[Instruction]:
+    """Collapse consecutive LABEL instructions into one.
+
+    Instructions that are preceded by a comment stay separate.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+
+    Returns:
+        List[Instruction]: The instructions with collapsed LABEL instructions
+    """
+    return _collapse_key_value_instructions(instructions, "LABEL", _parse_label)
+
+
+def _collapse_key_value_instructions(
+    instructions: List[Instruction], keyword: str, parse: Callable[[Instruction], Optional[List[Tuple[str, str]]]]
+) -> List[Instruction]:
+    """Collapse consecutive key-value instructions like ENV or LABEL into one.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        keyword (str): The keyword of the instructions to collapse, e.g. 'ENV'
+        parse (Callable[[Instruction], Optional[List[Tuple[str, str]]]]): Parses the key-value pairs of an
+            instruction or returns None if it cannot be collapsed
+
+    Returns:
+        List[Instruction]: The instructions with collapsed instructions
+    """
+    collapsed: List[Instruction] = list()
+    # The key-value pairs of the last collapsed instruction, if it has the keyword
+    group: Optional[List[Tuple[str, str]]] = None
+    for instruction in instructions:
+        pairs = parse(instruction) if instruction.keyword == keyword else None
+        if pairs is None:
+            collapsed.append(instruction)
+            group = None
+            continue
+
+        keys = {key for key, _ in group} if group is not None else set()
+        references = {name for _, value in pairs for name in _VARIABLE_PATTERN.findall(value)}
+        independent = not keys & ({key for key, _ in pairs} | references)
+        if group is not None and instruction.comments == "" and (keyword != "ENV" or independent):
+            group += pairs
+            collapsed[-1].text = f"{keyword} " + " \\\n    ".join(f"{key}={value}" for key, value in group) + "\n"
+        else:
+            collapsed.append(instruction)
+            group = pairs
+    return collapsed
+
+
+def merge_run_instructions(instructions: List[Instruction], fragments: Set[str]) -> List[Instruction]:
+    """Merge consecutive RUN instructions of the given fragments into one layer.
+
+    Used for the repository setup, which the generator splits from the installation of the packages. The
+    comments of the merged instructions are handed over, see '_remove()'.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        fragments (Set[str]): The names of the fragments whose RUN instructions are merged, e.g. 'ros_repository'
+
+    Returns:
+        List[Instruction]: The instructions with merged RUN instructions
+    """
+    instructions = list(instructions)
+    index = 0
+    while index < len(instructions):
+        instruction = instructions[index]
+        mergeable = instruction.keyword == "RUN" and instruction.fragment in fragments
+        # Empty lines at the end of a fragment do not separate its instructions from the next fragment
+        position = index
+        while (
+            position > 0
+            and instructions[position - 1].keyword is None
+            and not instructions[position - 1].comments.strip()
+        ):
+            position -= 1
+        previous = instructions[position - 1] if position > 0 else None
+        if not mergeable or previous is None or previous.keyword != "RUN" or previous.fragment not in fragments:
+            index += 1
+            continue
+        logger.debug(f"Merge RUN instruction of '{instruction.fragment}' into the one of '{previous.fragment}'")
+        # Keep the line continuations of the merged instruction
+        previous.text = f"{previous.text.rstrip()} && \\\n    {instruction.text.split(maxsplit=1)[1].rstrip()}\n"
+        _remove(instructions, index, previous)
+        del instructions[position:index]
+        index = position
+    return instructions
+
+
+def aggregate_apt_installs(instructions: List[Instruction], install_groups: Dict[str, str]) -> List[Instruction]:
+    """Aggregate the apt packages of several fragments into as few install layers as possible.
+
+    A fragment declares its apt packages with a RUN instruction that only installs them, see '_parse_apt_run()'.
+    The packages of all fragments of the same install group are installed in the first of these instructions of
+    their stage, if their install options match. The groups keep volatile fragments from being moved into
+    stable layers. Packages are never moved across an instruction that changes the apt sources or the package
+    states, e.g. 'apt-mark hold', see '_APT_STATE_PATTERN'.
+
+    An aggregated install gets a comment that lists the fragments it installs the packages of, taken from their
+    '# Install ...' comments. The remaining instructions of these fragments are commented as '# Set up ...'.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        install_groups (Dict[str, str]): The install group of each fragment name, e.g. {'ros': 'system'}.
+            The apt installs of other fragments stay where they are.
+
+    Returns:
+        List[Instruction]: The instructions with aggregated apt installs
+    """
+    instructions = list(instructions)
+    # The install instruction, its options and packages and the descriptions of the fragments it installs, of
+    # each install group and options
+    targets: Dict[Tuple[str, Tuple[str, ...]], Tuple[Instruction, List[str], List[str], List[str]]] = dict()
+    index = 0
+    while index < len(instructions):
+        instruction = instructions[index]
+        if instruction.keyword == "FROM" or _APT_STATE_PATTERN.search(instruction.arguments):
+            targets = dict()
+        apt_run = _parse_apt_run(instruction) if instruction.fragment in install_groups else None
+        if apt_run is None:
+            index += 1
+            continue
+
+        options, packages = apt_run
+        key = (install_groups[instruction.fragment], tuple(sorted(options)))
+        if key not in targets:
+            targets[key] = (instruction, options, packages, list())
+            index += 1
+            continue
+
+        target, target_options, target_packages, descriptions = targets[key]
+        logger.debug(f"Aggregate apt install of '{instruction.fragment}' into the one of '{target.fragment}'")
+        if not descriptions:
+            descriptions.append(_hand_over_install_comment(instructions, instructions.index(target)))
+        descriptions.append(_hand_over_install_comment(instructions, index))
+        header = ", ".join(descriptions[:-1]) + f" and {descriptions[-1]}"
+        target.comments = re.sub(r"^# Install the apt packages of .*\n", "", target.comments, flags=re.MULTILINE)
+        _insert_comment(target, f"# Install the apt packages of {header}\n")
+        target_packages = list(dict.fromkeys(target_packages + packages))
+        targets[key] = (target, target_options, target_packages, descriptions)
+        target.text = _render_apt_run(target_options, target_packages)
+        _remove(instructions, index, target)
+    return instructions
+
+
+def _hand_over_install_comment(instructions: List[Instruction], index: int) -> str:
+    """Take the '# Install ...' comment from an apt install that is aggregated into another one.
+
+    The comment describes the whole fragment. If the fragment has further instructions, they are commented as
+    '# Set up ...' instead, otherwise the comment is dropped.
+
+    Args:
+        instructions (List[Instruction]): The instructions
+        index (int): The index of the apt install
+
+    Returns:
+        str: What the fragment installs, e.g. 'ROS 2 (humble)', or the name of the fragment if it has no
+            '# Install ...' comment
+    """
+    instruction = instructions[index]
+    match = _INSTALL_COMMENT_PATTERN.search(instruction.comments)
+    if match is None:
+        return instruction.fragment
+    description = match.group(1).strip()
+    instruction.comments = _INSTALL_COMMENT_PATTERN.sub("", instruction.comments, count=1)
+    if _has_follow_up(instructions, index):
+        position = index + 1
+        follow_up = next(other for other in instructions[position:] if other.keyword is not None)
+        _insert_comment(follow_up, f"# Set up {description}\n")
+    return description
+
+
+# The optimization passes in the order they run, see 'optimize()'
+OPTIMIZATION_PASSES: List[Callable[[List[Instruction]], List[Instruction]]] = [
+    remove_redundant_cudnn_runtime,
+    drop_duplicate_apt_packages,
+    merge_apt_runs,
+    collapse_env_instructions,
+    collapse_label_instructions,
+]
+
+
+def optimize(instructions: List[Instruction]) -> List[Instruction]:
+    """Run the optimization passes over the instructions of a Dockerfile.
+
+    The passes reduce the number of layers and 'apt-get update' calls without changing the resulting image.
+
+    Args:
+        instructions (List[Instruction]): The instructions of the Dockerfile, including all stages
+
+    Returns:
+        List[Instruction]: The optimized instructions
+    """
+    layers_before = sum(instruction.keyword in ("RUN", "COPY", "ADD") for instruction in instructions)
+    for optimization_pass in OPTIMIZATION_PASSES:
+        instructions = optimization_pass(instructions)
+    layers_after = sum(instruction.keyword in ("RUN", "COPY", "ADD") for instruction in instructions)
+    logger.debug(f"Optimized Dockerfile from {layers_before} to {layers_after} layers")
+    return instructions
@@ -1,9 +1,16 @@
-from typing import Any, Dict, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from loguru import logger
 
+import turludock.constants as constants
+import turludock.dockerfile_ir as dockerfile_ir
+from turludock.cache_mounts import add_cache_mounts
 from turludock.config_parser import print_configuration
+from turludock.config_sanity import check_package_versions_exist
 from turludock.generate_non_templated_files import (
+    generate_apt_fast_profile,
+    generate_apt_fast_profile_restore,
     generate_cmd,
     generate_common_env_config,
     generate_conan,
@@ -13,27 +20,35 @@ from turludock.generate_non_templated_files import (
     generate_locale,
     generate_meld,
     generate_mesa,
+    generate_mesa_repository,
     generate_ohmyzsh,
     generate_terminator,
+    generate_user,
     generate_vscode,
+    generate_vscode_repository,
 )
 from turludock.generate_nvidia_templated_files import (
     generate_cuda_base,
     generate_cuda_devel,
+    generate_cuda_repository,
     generate_cuda_runtime,
     generate_cudnn_devel,
     generate_cudnn_runtime,
 )
 from turludock.generate_templated_files import (
     generate_cmake,
+    generate_cmake_builder,
     generate_extra_packages_label,
     generate_from,
     generate_header_info,
     generate_llvm,
     generate_ros,
+    generate_ros_repository,
     generate_tmux,
+    generate_tmux_builder,
 )
 from turludock.helper_functions import (
+    compute_content_hash,
     get_github_latest_version_tag,
     get_llvm_latest_version,
     get_ros_major_version,
@@ -41,6 +56,69 @@ from turludock.helper_functions import (
     is_version_greater,
     is_version_lower,
 )
+from turludock.source_cache import get_snapshot_filename, get_source_snapshots
+
+# Rank of each Dockerfile fragment in the cache-aware order, see '_order_fragments()'. Stable and expensive
+# fragments rank low, cheap and volatile ones high. Note: 'oh_my_zsh' replaces '~/.zshrc', so it must come
+# before every fragment that appends to it (ROS, tmux). The apt repositories of the system fragments are set up
+# right after the common packages, which provide the tools to add them, so that all other fragments can install
+# from them. The repository of vscode, an extra package, is set up right before the extra packages, so adding or
+# removing vscode does not invalidate the system layers. The user is baked in last, as its build args differ from
+# host to host.
+_CACHE_AWARE_FRAGMENT_RANK = {
+    "from": 0,
+    "common_env_config": 1,
+    "install_common_packages": 2,
+    "mesa_repository": 3,
+    "cuda_repository": 3,
+    "ros_repository": 3,
+    "locale": 4,
+    "terminator": 5,
+    "oh_my_zsh": 6,
+    "mesa": 7,
+    "ros": 8,
+    "cuda_base": 9,
+    "cuda_devel": 9,
+    "cuda_runtime": 9,
+    "cudnn_devel": 9,
+    "cudnn_runtime": 9,
+    "vscode_repository": 10,
+    "meld": 11,
+    "vscode": 11,
+    "conan": 11,
+    "cpplint": 11,
+    "entrypoint": 12,
+    "cmd": 12,
+    "llvm": 13,
+    "cmake": 13,
+    "tmux": 13,
+    "header_info": 14,
+    "extra_packages_label": 14,
+    "user": 15,
+}
+
+# Fragments that only set up an apt repository of the system fragments. They are merged into a single layer, see
+# '_optimize_apt()'.
+_APT_REPOSITORY_FRAGMENTS = {"mesa_repository", "cuda_repository", "ros_repository"}
+
+# Builder stages whose apt installs skip the recommended packages in the 'fast' build profile. Only their build
+# artifacts are copied into the image, so the recommended packages are never needed.
+_NO_RECOMMENDS_FRAGMENTS = {"cmake_builder", "tmux_builder"}
+
+# Install group of the fragments whose apt packages are aggregated, see '_optimize_apt()'. The packages of the
+# stable system fragments and of the extra packages are installed in separate layers, so that changing the extra
+# packages does not invalidate the system layers. CUDA pins and holds its packages, so it keeps its own layers.
+_APT_INSTALL_GROUPS = {
+    "terminator": "system",
+    "oh_my_zsh": "system",
+    "mesa": "system",
+    "ros": "system",
+    "meld": "extras",
+    "vscode": "extras",
+    "conan": "extras",
+    "cpplint": "extras",
+    "tmux": "extras",
+}
 
 
 def _get_item_from_extra_packages(extra_packages: list, package_name: str) -> Optional[Union[dict, str]]:
@@ -81,6 +159,8 @@ def _generate_description(yaml_config: Dict[str, Any]) -> str:
     """
     ros_version = yaml_config["ros_version"]
     ros_version_str = f"ROS {get_ros_major_version(ros_version)} {ros_version.capitalize()}"
+    if "ros_variant" in yaml_config:
+        ros_version_str += f" ({yaml_config['ros_variant']})"
 
     # Ubuntu version
     ubuntu_version = get_ubuntu_version(ros_version)
@@ -135,41 +215,227 @@ def _get_package_version(yaml_config: dict, package_name: str) -> str:
         return item[package_name]
 
 
-def generate_dockerfile(yaml_config: Dict[str, Any]) -> str:
+def resolve_package_versions(yaml_config: dict) -> Dict[str, str]:
+    """Resolve the versions of all packages that support a custom version, all at once.
+
+    'cmake' is always installed, while 'tmux' and 'llvm' only if they are part of the 'extra_packages'.
+    Resolving the "latest" version requires a remote lookup, so the lookups are run concurrently. The resolved
+    versions are then checked against their remotes, again concurrently, which also warms the lookup cache for
+    the templated file generators.
+
+    If the configuration is locked (see 'turludock lock'), the locked versions are returned without any
+    remote lookup.
+
+    Args:
+        yaml_config (dict): The parsed yaml config
+
+    Returns:
+        Dict[str, str]: The resolved version of each package, e.g. {"cmake": "v3.29.3", "tmux": "3.4"}
+
+    Raises:
+        ValueError: If the version of one or more packages cannot be determined
+    """
+    if "lock" in yaml_config:
+        return dict(yaml_config["lock"]["packages"])
+
+    package_names = ["cmake"]
+    if "extra_packages" in yaml_config:
+        for package_name in ("tmux", "llvm"):
+            if _get_item_from_extra_packages(yaml_config["extra_packages"], package_name) is not None:
+                package_names.append(package_name)
+
+    with ThreadPoolExecutor(max_workers=len(package_names)) as executor:
+        futures = {name: executor.submit(_get_package_version, yaml_config, name) for name in package_names}
+
+    package_versions = dict()
+    errors = list()
+    for package_name, future in futures.items():
+        try:
+            package_versions[package_name] = future.result()
+        except Exception as e:
+            errors.append(f"{package_name}: {e}")
+    if errors:
+        raise ValueError("Could not determine package version for: " + " | ".join(errors))
+    check_package_versions_exist(list(package_versions.items()))
+    return package_versions
+
+
+def _order_fragments(fragments: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Order the Dockerfile fragments so that changes invalidate as few expensive layers as possible.
+
+    Docker invalidates the cache of every layer after a changed one. So stable and costly fragments (base,
+    common packages, GPU stack, ROS) go first, while cheap and frequently changing ones (pinned packages,
+    labels) go last. Fragments of the same rank keep their original order.
+
+    Args:
+        fragments (List[Tuple[str, str]]): The (fragment_name, fragment) tuples in legacy order
+
+    Returns:
+        List[Tuple[str, str]]: The fragments in cache-aware order
+    """
+    return sorted(fragments, key=lambda fragment: _CACHE_AWARE_FRAGMENT_RANK[fragment[0]])
+
+
+def _apply_build_profile(
+    instructions: List[dockerfile_ir.Instruction], build_profile: str
+) -> List[dockerfile_ir.Instruction]:
+    """Apply the build profile of the configuration to the instructions of all stages.
+
+    The 'fast' profile configures apt and dpkg right after every FROM, see 'apt_fast_profile.txt', and installs
+    the build dependencies of the builder stages without their recommended packages. The configuration is
+    removed again at the end of the final stage, so it does not end up in the image.
+
+    Args:
+        instructions (List[dockerfile_ir.Instruction]): The instructions
+        build_profile (str): The build profile, see 'constants.BUILD_PROFILES'
+
+    Returns:
+        List[dockerfile_ir.Instruction]: The instructions with the build profile applied
+    """
+    if build_profile != "fast":
+        return instructions
+    dockerfile_ir.add_apt_install_options(instructions, _NO_RECOMMENDS_FRAGMENTS, ["--no-install-recommends"])
+    # Drop the empty lines at the end of the fragment, the FROM is followed by its own
+    profile = [
+        instruction
+        for instruction in dockerfile_ir.parse_fragment(generate_apt_fast_profile(), "build_profile")
+        if instruction.keyword is not None
+    ]
+    profiled = list()
+    for instruction in instructions:
+        profiled.append(instruction)
+        if instruction.keyword == "FROM":
+            profiled += [dockerfile_ir.Instruction(item.text, item.fragment, item.comments) for item in profile]
+    profiled += dockerfile_ir.parse_fragment(generate_apt_fast_profile_restore(), "build_profile")
+    return profiled
+
+
+def _optimize_apt(instructions: List[dockerfile_ir.Instruction]) -> List[dockerfile_ir.Instruction]:
+    """Reduce the apt layers of cache-aware ordered instructions.
+
+    The apt repositories of the system fragments are set up in one layer, the one of vscode stays in front of the
+    extra packages. The apt packages the fragments declare are installed in one layer per install group, see
+    '_APT_INSTALL_GROUPS'. This saves an 'apt-get update' and a run of the dpkg triggers per removed layer.
+
+    Args:
+        instructions (List[dockerfile_ir.Instruction]): The instructions in cache-aware order
+
+    Returns:
+        List[dockerfile_ir.Instruction]: The instructions with aggregated apt layers
+    """
+    instructions = dockerfile_ir.merge_run_instructions(instructions, _APT_REPOSITORY_FRAGMENTS)
+    return dockerfile_ir.aggregate_apt_installs(instructions, _APT_INSTALL_GROUPS)
+
+
+def _get_source_snapshot_filenames(package_versions: Dict[str, str], cmake_install_strategy: str) -> Dict[str, str]:
+    """Make sure the source snapshots of all source-built packages are in the host-side cache.
+
+    Args:
+        package_versions (Dict[str, str]): The resolved package versions, see 'resolve_package_versions()'
+        cmake_install_strategy (str): The install strategy of CMake. Only 'source' needs a snapshot.
+
+    Returns:
+        Dict[str, str]: The snapshot filename of each source-built package, e.g. {"cmake": "CMake-v3.29.3.tar.gz"}
+    """
+    sources = dict()
+    if cmake_install_strategy == "source":
+        sources["cmake"] = ("CMake", "https://github.com/Kitware/CMake.git", package_versions["cmake"])
+    if "tmux" in package_versions:
+        sources["tmux"] = ("tmux", "https://github.com/tmux/tmux.git", package_versions["tmux"])
+
+    # Download the missing snapshots concurrently
+    get_source_snapshots(list(sources.values()))
+    return {package: get_snapshot_filename(name, str(tag)) for package, (name, _, tag) in sources.items()}
+
+
+def generate_dockerfile(
+    yaml_config: Dict[str, Any],
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+    print_config: bool = True,
+) -> str:
     """Generate the actual Dockerfile from a given yaml configuration.
 
     Based on YAML configuration we populate all templates to finally generate the Dockerfile.
 
+    The Dockerfile is a multi-stage build: every source-built package is compiled in its own builder
+    stage, which BuildKit can run concurrently. The final stage only copies the installed artifacts,
+    so the build dependencies do not end up in the image.
+
+    The optional 'build_profile' of the configuration tunes apt and dpkg in all stages, see
+    '_apply_build_profile()'.
+
     Args:
         yaml_config (dict): The image configuration in yaml format.
+        buildkit (bool, optional): Whether the Dockerfile is built with BuildKit. If so, the RUN instructions
+            use cache mounts for apt and pip. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy order of the fragments instead of the
+            cache-aware one, see '_order_fragments()'. The legacy order also keeps the apt repositories and
+            installs in the layers of their fragments, see '_optimize_apt()'. Defaults to False.
+        source_cache (bool, optional): Whether the builder stages take their sources from the host-side
+            source cache instead of cloning them. The snapshots must then be copied into the build context,
+            see 'source_cache.copy_source_snapshots()'. Defaults to False.
+        print_config (bool, optional): Whether to print the configuration. Concurrent builds print the
+            configurations upfront instead, see 'docker_build.build_pre_configured_images()'. Defaults to True.
 
     Returns:
         str: The generated Dockerfile.
     """
     # Print configuration
-    print("")
-    logger.info("Configuration:")
-    print_configuration(yaml_config)
+    if print_config:
+        print("")
+        logger.info("Configuration:")
+        print_configuration(yaml_config)
+
+    # Resolve the package versions upfront, so the remote lookups run concurrently
+    package_versions = resolve_package_versions(yaml_config)
 
-    # Generate Dockerfile
-    dockerfile = ""
+    # Versions of a locked configuration have already been checked when locking
+    check_version = "lock" not in yaml_config
+
+    # Builder stages for the source-built packages
+    ubuntu_version = get_ubuntu_version(yaml_config["ros_version"])
+    cmake_install_strategy = yaml_config.get("cmake_install_strategy", constants.DEFAULT_CMAKE_INSTALL_STRATEGY)
+    snapshots = dict()
+    if source_cache:
+        snapshots = _get_source_snapshot_filenames(package_versions, cmake_install_strategy)
+    builder_stages = [
+        (
+            "cmake_builder",
+            generate_cmake_builder(
+                package_versions["cmake"], ubuntu_version["semantic"], cmake_install_strategy, snapshots.get("cmake")
+            ),
+        )
+    ]
+    if "tmux" in package_versions:
+        builder_stages.append(
+            (
+                "tmux_builder",
+                generate_tmux_builder(package_versions["tmux"], ubuntu_version["semantic"], snapshots.get("tmux")),
+            )
+        )
+
+    # Generate the fragments of the final stage. They are listed in legacy order and reordered at the end.
+    fragments = list()
 
     # Base image
-    dockerfile += generate_from(yaml_config)
+    fragments.append(("from", generate_from(yaml_config)))
 
     # Meta data
-    dockerfile += generate_header_info(_generate_description(yaml_config), yaml_config["ros_version"])
+    fragments.append(
+        ("header_info", generate_header_info(_generate_description(yaml_config), yaml_config["ros_version"]))
+    )
 
     # Common configuration for all images
-    dockerfile += generate_common_env_config()
-    dockerfile += generate_install_common_packages()
-    dockerfile += generate_locale()
-    dockerfile += generate_cmake(_get_package_version(yaml_config, "cmake"))
-    dockerfile += generate_terminator()
-    dockerfile += generate_ohmyzsh()
+    fragments.append(("common_env_config", generate_common_env_config()))
+    fragments.append(("install_common_packages", generate_install_common_packages()))
+    fragments.append(("locale", generate_locale()))
+    fragments.append(("cmake", generate_cmake(package_versions["cmake"], check_version)))
+    fragments.append(("terminator", generate_terminator()))
+    fragments.append(("oh_my_zsh", generate_ohmyzsh()))
 
     # GPU driver
-    ubuntu_version = get_ubuntu_version(yaml_config["ros_version"])
     if yaml_config["gpu_driver"] == "mesa":
         if is_version_lower(ubuntu_version["semantic"], "20.04"):
             logger.warning(
@@ -179,35 +445,46 @@ def generate_dockerfile(yaml_config: Dict[str, Any]) -> str:
                 + "software rendering. For more info check ppa:kisak/kisak-mesa"
             )
             # use mesa from default ubuntu repos
-            dockerfile += generate_mesa(False)
+            fragments.append(("mesa", generate_mesa(False)))
         elif is_version_greater(ubuntu_version["semantic"], "22.04"):
             # use mesa from default ubuntu repos - those should be the latest
-            dockerfile += generate_mesa(False)
+            fragments.append(("mesa", generate_mesa(False)))
         else:
             # use latest mesa provided by custom ppa
-            dockerfile += generate_mesa(True)
+            fragments.append(("mesa_repository", generate_mesa_repository()))
+            fragments.append(("mesa", generate_mesa(True)))
     else:
         # no need to install something for NVIDIA
         pass
 
     # Add CUDA/cuDNN
-    ubuntu_version = get_ubuntu_version(yaml_config["ros_version"])
     if "cuda_version" in yaml_config:
-        dockerfile += generate_cuda_base(yaml_config["cuda_version"], ubuntu_version["flat"])
-        dockerfile += generate_cuda_devel(yaml_config["cuda_version"], ubuntu_version["flat"])
-        dockerfile += generate_cuda_runtime(yaml_config["cuda_version"], ubuntu_version["flat"])
+        fragments.append(("cuda_repository", generate_cuda_repository(ubuntu_version["flat"])))
+        fragments.append(("cuda_base", generate_cuda_base(yaml_config["cuda_version"], ubuntu_version["flat"])))
+        fragments.append(("cuda_devel", generate_cuda_devel(yaml_config["cuda_version"], ubuntu_version["flat"])))
+        fragments.append(("cuda_runtime", generate_cuda_runtime(yaml_config["cuda_version"], ubuntu_version["flat"])))
         if "cudnn_version" in yaml_config:
-            dockerfile += generate_cudnn_devel(
-                yaml_config["cuda_version"], yaml_config["cudnn_version"], ubuntu_version["flat"]
+            fragments.append(
+                (
+                    "cudnn_devel",
+                    generate_cudnn_devel(
+                        yaml_config["cuda_version"], yaml_config["cudnn_version"], ubuntu_version["flat"]
+                    ),
+                )
             )
-            # TODO(ATA): Devel already contains what runtime has. So it redundant.
-            # But is it the case for cuDNN implementation?
-            dockerfile += generate_cudnn_runtime(
-                yaml_config["cuda_version"], yaml_config["cudnn_version"], ubuntu_version["flat"]
+            # Dropped again if the devel layer is present, see 'dockerfile_ir.remove_redundant_cudnn_runtime()'
+            fragments.append(
+                (
+                    "cudnn_runtime",
+                    generate_cudnn_runtime(
+                        yaml_config["cuda_version"], yaml_config["cudnn_version"], ubuntu_version["flat"]
+                    ),
+                )
             )
 
     # Add ROS
-    dockerfile += generate_ros(yaml_config["ros_version"])
+    fragments.append(("ros_repository", generate_ros_repository(yaml_config["ros_version"])))
+    fragments.append(("ros", generate_ros(yaml_config["ros_version"], yaml_config.get("ros_variant"))))
 
     # Add the extra-packages
     extra_packages_label_list = list()
@@ -221,27 +498,57 @@ def generate_dockerfile(yaml_config: Dict[str, Any]) -> str:
                 raise ValueError("Item in 'extra_packages' should be either a string or a dict.")
 
             if package_name == "tmux":
-                dockerfile += generate_tmux(_get_package_version(yaml_config, package_name))
+                fragments.append(
+                    (
+                        "tmux",
+                        generate_tmux(package_versions[package_name], ubuntu_version["semantic"], check_version),
+                    )
+                )
             if package_name == "llvm":
-                dockerfile += generate_llvm(_get_package_version(yaml_config, package_name))
+                fragments.append(("llvm", generate_llvm(package_versions[package_name], check_version)))
             if package_name == "meld":
-                dockerfile += generate_meld()
+                fragments.append(("meld", generate_meld()))
             if package_name == "cpplint":
-                dockerfile += generate_cpplint()
+                fragments.append(("cpplint", generate_cpplint()))
             if package_name == "conan":
-                dockerfile += generate_conan()
+                fragments.append(("conan", generate_conan()))
             if package_name == "vscode":
-                dockerfile += generate_vscode()
+                fragments.append(("vscode_repository", generate_vscode_repository()))
+                fragments.append(("vscode", generate_vscode()))
 
             extra_packages_label_list.append(package_name)
     else:
         extra_packages_label_list.append("")
         logger.debug("Warning: generate_dockerfile(): No extra packages have been configured.")
-    dockerfile += generate_extra_packages_label(extra_packages_label_list)
-
-    # Finally, add the entrypoint and cmd parts
-    dockerfile += generate_entrypoint()
-    dockerfile += generate_cmd()
+    fragments.append(("extra_packages_label", generate_extra_packages_label(extra_packages_label_list)))
+
+    # Finally, add the entrypoint, cmd and user parts
+    fragments.append(("entrypoint", generate_entrypoint()))
+    fragments.append(("cmd", generate_cmd()))
+    fragments.append(("user", generate_user()))
+
+    # Order the fragments for best layer cache reuse
+    if not legacy_layer_order:
+        fragments = _order_fragments(fragments)
+
+    # Generate Dockerfile. The fragments are parsed into instructions tagged with their fragment name, so
+    # the optimization passes can e.g. merge apt installs and drop redundant layers.
+    instructions = list()
+    for fragment_name, fragment in builder_stages + fragments:
+        instructions += dockerfile_ir.parse_fragment(fragment, fragment_name)
+    build_profile = yaml_config.get("build_profile", constants.DEFAULT_BUILD_PROFILE)
+    instructions = _apply_build_profile(instructions, build_profile)
+    if not legacy_layer_order:
+        instructions = _optimize_apt(instructions)
+    dockerfile = dockerfile_ir.render(dockerfile_ir.optimize(instructions))
+
+    # Reuse the apt/pip downloads between layers and builds
+    if buildkit:
+        dockerfile = add_cache_mounts(dockerfile)
+
+    # Stamp the content hash, so identical configurations can be detected on the docker daemon
+    content_hash = compute_content_hash(dockerfile)
+    dockerfile = dockerfile.replace(constants.CONTENT_HASH_PLACEHOLDER, content_hash)
 
     # print(dockerfile)
     return dockerfile
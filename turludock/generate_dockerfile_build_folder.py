@@ -1,26 +1,42 @@
+import contextlib
 import os
+import sys
+from typing import Optional
 
 from loguru import logger
 
+import turludock.constants as constants
 import turludock.default_image_config as default_image_config
+from turludock.build_context import write_build_context
 from turludock.config_parser import check_dockerfile_config
 from turludock.filesystem_operations import copy_resource, get_filename_from_path
 from turludock.generate_dockerfile import generate_dockerfile
+from turludock.lockfile import apply_lockfile, apply_lockfile_if_present
+from turludock.source_cache import copy_source_snapshots
 from turludock.yaml_load import load_yaml_file
 
 
-def _populate_build_folder(yaml_config: dict, dir_path: str) -> None:
+def _populate_build_folder(
+    yaml_config: dict,
+    dir_path: str,
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+) -> None:
     """Populate the provided directory with the generated Dockerfile and its assets
 
     Args:
         yaml_config (dict): The configuration dictionary
         dir_path (str): The path of the directory where to populate the files
+        buildkit (bool, optional): Whether to generate a Dockerfile that uses BuildKit features. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy layer order. Defaults to False.
+        source_cache (bool, optional): Whether to use the host-side source cache. Defaults to False.
     """
     # Check Dockerfile .yaml configuration
     check_dockerfile_config(yaml_config)
 
     # Generate Dockerfile based on configuration
-    dockerfile = generate_dockerfile(yaml_config)
+    dockerfile = generate_dockerfile(yaml_config, buildkit, legacy_layer_order, source_cache)
 
     # Store generated Dockerfile in directory
     dockerfile_path = os.path.join(dir_path, "Dockerfile")
@@ -29,8 +45,81 @@ def _populate_build_folder(yaml_config: dict, dir_path: str) -> None:
     logger.debug(f"Successfully copied generated Dockerfile in '{dir_path}'")
 
     # Copy over Dockerfile assets
-    copy_resource("turludock.assets.dockerfile_assets", "entrypoint_setup.sh", dir_path)
-    copy_resource("turludock.assets.dockerfile_assets", "terminator_config", dir_path)
+    for asset in constants.DOCKERFILE_ASSETS:
+        copy_resource("turludock.assets.dockerfile_assets", asset, dir_path)
+
+    # Copy over the source snapshots
+    copy_source_snapshots(dockerfile, dir_path)
+
+
+def _write_build_context_tar(
+    yaml_config: dict,
+    tar_path: str,
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+) -> None:
+    """Write the generated Dockerfile and its assets as tar archive, see 'build_context.write_build_context()'
+
+    Besides the archive itself nothing is written to disk. For '-' the archive is streamed to stdout, e.g.
+    'turludock generate -e humble_nvidia --tar - | docker build -', and all other output goes to stderr.
+
+    Args:
+        yaml_config (dict): The configuration dictionary
+        tar_path (str): The path of the tar archive or '-' for stdout. Paths ending in '.gz' or '.tgz' are gzipped.
+        buildkit (bool, optional): Whether to generate a Dockerfile that uses BuildKit features. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy layer order. Defaults to False.
+        source_cache (bool, optional): Whether to use the host-side source cache. Defaults to False.
+
+    Raises:
+        ValueError: If the archive would be written to a terminal
+    """
+    if tar_path == "-" and sys.stdout.isatty():
+        message = "Refusing to write the tar archive to a terminal. Redirect or pipe stdout."
+        logger.error(message)
+        raise ValueError(message)
+
+    # Check Dockerfile .yaml configuration
+    check_dockerfile_config(yaml_config)
+
+    if tar_path == "-":
+        stdout = sys.stdout.buffer
+        # The configuration is printed while generating, so keep it out of the tar stream
+        with contextlib.redirect_stdout(sys.stderr):
+            dockerfile = generate_dockerfile(yaml_config, buildkit, legacy_layer_order, source_cache)
+        write_build_context(stdout, dockerfile)
+        stdout.flush()
+    else:
+        dockerfile = generate_dockerfile(yaml_config, buildkit, legacy_layer_order, source_cache)
+        with open(tar_path, "wb") as file:
+            write_build_context(file, dockerfile, tar_path.endswith((".gz", ".tgz")))
+
+
+def _generate_build_context(
+    yaml_config: dict,
+    dir_path: Optional[str],
+    tar_path: Optional[str],
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+) -> None:
+    """Generate the build context either into a directory or as tar archive.
+
+    Args:
+        yaml_config (dict): The configuration dictionary
+        dir_path (Optional[str]): The path of the directory where to populate the files, if 'tar_path' is None
+        tar_path (Optional[str]): The path of the tar archive or '-' for stdout, see '_write_build_context_tar()'
+        buildkit (bool, optional): Whether to generate a Dockerfile that uses BuildKit features. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy layer order. Defaults to False.
+        source_cache (bool, optional): Whether to use the host-side source cache. Defaults to False.
+    """
+    if tar_path is not None:
+        _write_build_context_tar(yaml_config, tar_path, buildkit, legacy_layer_order, source_cache)
+        logger.info(f"Wrote build context to '{'stdout' if tar_path == '-' else tar_path}'")
+    else:
+        _populate_build_folder(yaml_config, dir_path, buildkit, legacy_layer_order, source_cache)
+        print("")
+        logger.info(f"Populated folder: '{dir_path}'")
 
 
 def check_if_directory_path_is_valid(path: str) -> None:
@@ -49,48 +138,83 @@ def check_if_directory_path_is_valid(path: str) -> None:
         raise ValueError(f"We do not have write access to '{path}'\n")
 
 
-def generate_from_pre_config(config_name: str, dir_path: str) -> None:
+def generate_from_pre_config(
+    config_name: str,
+    dir_path: Optional[str],
+    lockfile_path: Optional[str] = None,
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+    tar_path: Optional[str] = None,
+) -> None:
     """Populate the build folder with the Dockerfile and its assets using provided pre-configurations.
 
     See 'assets/default_image_configurations' for the list of supported pre-configurations.
 
     Args:
         config_name (str): The name of the pre-defined configuration to use.
-        dir_path (str): The path to the directory where to store the generated Dockerfile and its assets
+        dir_path (Optional[str]): The path to the directory where to store the generated Dockerfile and its assets.
+            Ignored if 'tar_path' is set.
+        lockfile_path (Optional[str]): The path to the lockfile to use, if any
+        buildkit (bool, optional): Whether to generate a Dockerfile that uses BuildKit features. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy layer order. Defaults to False.
+        source_cache (bool, optional): Whether to use the host-side source cache. Defaults to False.
+        tar_path (Optional[str], optional): Write the build context as tar archive to this path instead of
+            populating 'dir_path'. '-' streams it to stdout. Defaults to None.
 
     Raises:
         Exception: If there is a problem populating the folder.
     """
     try:
-        check_if_directory_path_is_valid(dir_path)
+        if tar_path is None:
+            check_if_directory_path_is_valid(dir_path)
         yaml_config = default_image_config.get_yaml_config(config_name)
-        _populate_build_folder(yaml_config, dir_path)
-
-        print("")
-        logger.info(f"Populated folder: '{dir_path}'")
+        if lockfile_path is not None:
+            apply_lockfile(yaml_config, lockfile_path)
+        _generate_build_context(yaml_config, dir_path, tar_path, buildkit, legacy_layer_order, source_cache)
     except Exception:
-        logger.error(f"Could not populate build folder '{dir_path}'.")
+        logger.error(
+            f"Could not populate build folder '{dir_path}'." if tar_path is None else "Could not write build context."
+        )
         raise
 
 
-def generate_from_user_config(yaml_config_path: str, dir_path: str):
+def generate_from_user_config(
+    yaml_config_path: str,
+    dir_path: Optional[str],
+    lockfile_path: Optional[str] = None,
+    buildkit: bool = False,
+    legacy_layer_order: bool = False,
+    source_cache: bool = False,
+    tar_path: Optional[str] = None,
+):
     """Populate the build folder with the Dockerfile and its assets using the custom YAML configuration.
 
+    If no lockfile is provided, the lockfile next to the YAML configuration is used if it exists.
+
     Args:
         yaml_config_path (str): The path to the custom YAML configuration.
-        dir_path (str): The path to the directory where to store the generated Dockerfile and its assets
+        dir_path (Optional[str]): The path to the directory where to store the generated Dockerfile and its assets.
+            Ignored if 'tar_path' is set.
+        lockfile_path (Optional[str]): The path to the lockfile to use, if any
+        buildkit (bool, optional): Whether to generate a Dockerfile that uses BuildKit features. Defaults to False.
+        legacy_layer_order (bool, optional): Whether to keep the legacy layer order. Defaults to False.
+        source_cache (bool, optional): Whether to use the host-side source cache. Defaults to False.
+        tar_path (Optional[str], optional): Write the build context as tar archive to this path instead of
+            populating 'dir_path'. '-' streams it to stdout. Defaults to None.
 
     Raises:
         Exception: If there is a problem populating the folder.
     """
     try:
-        check_if_directory_path_is_valid(dir_path)
+        if tar_path is None:
+            check_if_directory_path_is_valid(dir_path)
         yaml_config = load_yaml_file(yaml_config_path)
         yaml_config.update({"filename": get_filename_from_path(yaml_config_path)})
-        _populate_build_folder(yaml_config, dir_path)
-
-        print("")
-        logger.info(f"Populated folder: '{dir_path}'")
+        apply_lockfile_if_present(yaml_config, yaml_config_path, lockfile_path)
+        _generate_build_context(yaml_config, dir_path, tar_path, buildkit, legacy_layer_order, source_cache)
     except Exception:
-        logger.error(f"Could not populate build folder '{dir_path}'.")
+        logger.error(
+            f"Could not populate build folder '{dir_path}'." if tar_path is None else "Could not write build context."
+        )
         raise
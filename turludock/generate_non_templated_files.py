@@ -1,7 +1,7 @@
-import importlib.resources
-
 from loguru import logger
 
+from turludock.template_registry import get_template_text
+
 
 def get_non_templated_file(templated_file: str) -> str:
     """Generates a non-templated txt file, which basically only appending the text from the file
@@ -13,8 +13,7 @@ def get_non_templated_file(templated_file: str) -> str:
         str: The contents of the non-templated text file
     """
     logger.debug(f"Generate '{templated_file}'")
-    with importlib.resources.open_text("turludock.assets.dockerfile_templates", templated_file) as f:
-        str_output = f.read()
+    str_output = get_template_text(templated_file)
     str_output += "\n\n"
     return str_output
 
@@ -37,6 +36,15 @@ def generate_cmd() -> str:
     return get_non_templated_file("cmd.txt")
 
 
+def generate_user() -> str:
+    """Get user.txt as a string
+
+    Returns:
+        str: The user.txt as a string
+    """
+    return get_non_templated_file("user.txt")
+
+
 def generate_common_env_config() -> str:
     """Get common_env_config.txt as a string
 
@@ -100,6 +108,15 @@ def generate_vscode() -> str:
     return get_non_templated_file("vscode.txt")
 
 
+def generate_vscode_repository() -> str:
+    """Get vscode_repository.txt as a string
+
+    Returns:
+        str: The vscode_repository.txt as a string
+    """
+    return get_non_templated_file("vscode_repository.txt")
+
+
 def generate_meld() -> str:
     """Get meld.txt as a string
 
@@ -118,6 +135,42 @@ def generate_cpplint() -> str:
     return get_non_templated_file("cpplint.txt")
 
 
+def generate_apt_keep_cache() -> str:
+    """Get apt_keep_cache.txt as a string
+
+    Returns:
+        str: The apt_keep_cache.txt as a string
+    """
+    return get_non_templated_file("apt_keep_cache.txt")
+
+
+def generate_apt_restore_clean() -> str:
+    """Get apt_restore_clean.txt as a string
+
+    Returns:
+        str: The apt_restore_clean.txt as a string
+    """
+    return get_non_templated_file("apt_restore_clean.txt")
+
+
+def generate_apt_fast_profile() -> str:
+    """Get apt_fast_profile.txt as a string
+
+    Returns:
+        str: The apt_fast_profile.txt as a string
+    """
+    return get_non_templated_file("apt_fast_profile.txt")
+
+
+def generate_apt_fast_profile_restore() -> str:
+    """Get apt_fast_profile_restore.txt as a string
+
+    Returns:
+        str: The apt_fast_profile_restore.txt as a string
+    """
+    return get_non_templated_file("apt_fast_profile_restore.txt")
+
+
 def generate_mesa(use_latest: bool = True) -> str:
     """Get the mesa install command as a string
 
@@ -132,3 +185,12 @@ def generate_mesa(use_latest: bool = True) -> str:
     else:
         filename = "mesa.txt"
     return get_non_templated_file(filename)
+
+
+def generate_mesa_repository() -> str:
+    """Get the mesa_latest_repository.txt as a string, which adds the ppa of the latest mesa version
+
+    Returns:
+        str: The mesa_latest_repository.txt as a string
+    """
+    return get_non_templated_file("mesa_latest_repository.txt")
@@ -1,10 +1,30 @@
-import importlib.resources
-from string import Template
-
 from loguru import logger
 
 from turludock.config_sanity import is_cuda_cudnn_version_combination_supported, is_cuda_version_supported
-from turludock.yaml_load import load_cuda_config, load_cudnn_config
+from turludock.cuda_matrix import get_cuda_matrix
+from turludock.template_registry import render_template
+
+
+def generate_cuda_repository(ubuntu_version: str) -> str:
+    """Populate the cuda_repository.txt template file and return the generated string
+
+    Adds the CUDA apt repository of NVIDIA, from which the CUDA and cuDNN packages are installed.
+
+    Args:
+        ubuntu_version (str): Ubuntu version, e.g. 'ubuntu2204'
+
+    Returns:
+        str: dockerfile contents
+    """
+    logger.debug(f"Generate 'nvidia-cuda-repository-{ubuntu_version}'")
+
+    # Map the template variables
+    mapping = {"ubuntu_version": ubuntu_version}
+
+    # Populate the templated file
+    str_output = render_template("nvidia/cuda_repository.txt", mapping)
+    str_output += "\n\n"
+    return str_output
 
 
 def generate_cuda_base(cuda_version: str, ubuntu_version: str) -> str:
@@ -25,22 +45,18 @@ def generate_cuda_base(cuda_version: str, ubuntu_version: str) -> str:
     if not is_cuda_version_supported(cuda_version, ubuntu_version):
         raise ValueError("CUDA version not supported. Check your configuration.")
 
-    cuda_config = load_cuda_config()[cuda_version][ubuntu_version]
+    cuda_config = get_cuda_matrix().get_cuda_entry(cuda_version, ubuntu_version)
 
     # Map the template variables
     mapping = {
         "cuda_version": cuda_version,
-        "ubuntu_version": ubuntu_version,
         "nvidia_require_cuda": cuda_config["nvidia_require_cuda"],
         "cuda_cudart_version": cuda_config["cudart"],
         "cuda_compat_version": cuda_config["compat"],
     }
 
     # Populate the templated file
-    package = "turludock.assets.dockerfile_templates.nvidia"
-    with importlib.resources.open_text(package, "cuda_base.txt") as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template("nvidia/cuda_base.txt", mapping)
     str_output += "\n\n"
     return str_output
 
@@ -63,7 +79,7 @@ def generate_cuda_devel(cuda_version: str, ubuntu_version: str) -> str:
     if not is_cuda_version_supported(cuda_version, ubuntu_version):
         raise ValueError("CUDA version not supported. Check your configuration.")
 
-    cuda_config = load_cuda_config()[cuda_version][ubuntu_version]
+    cuda_config = get_cuda_matrix().get_cuda_entry(cuda_version, ubuntu_version)
 
     # Map the template variables
     mapping = {
@@ -79,10 +95,7 @@ def generate_cuda_devel(cuda_version: str, ubuntu_version: str) -> str:
     }
 
     # Populate the templated file
-    package = "turludock.assets.dockerfile_templates.nvidia"
-    with importlib.resources.open_text(package, "cuda_devel.txt") as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template("nvidia/cuda_devel.txt", mapping)
     str_output += "\n\n"
     return str_output
 
@@ -105,7 +118,7 @@ def generate_cuda_runtime(cuda_version: str, ubuntu_version: str) -> str:
     if not is_cuda_version_supported(cuda_version, ubuntu_version):
         raise ValueError("CUDA version not supported. Check your configuration.")
 
-    cuda_config = load_cuda_config()[cuda_version][ubuntu_version]
+    cuda_config = get_cuda_matrix().get_cuda_entry(cuda_version, ubuntu_version)
 
     # Map the template variables
     mapping = {
@@ -118,10 +131,7 @@ def generate_cuda_runtime(cuda_version: str, ubuntu_version: str) -> str:
     }
 
     # Populate the templated file
-    package = "turludock.assets.dockerfile_templates.nvidia"
-    with importlib.resources.open_text(package, "cuda_runtime.txt") as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template("nvidia/cuda_runtime.txt", mapping)
     str_output += "\n\n"
     return str_output
 
@@ -145,7 +155,7 @@ def generate_cudnn_devel(cuda_version: str, cudnn_version: str, ubuntu_version:
     if not is_cuda_cudnn_version_combination_supported(cuda_version, cudnn_version, ubuntu_version):
         raise ValueError("cuDNN version not supported. Check your configuration.")
 
-    cudnn_config = load_cudnn_config()[cudnn_version][ubuntu_version]
+    cudnn_config = get_cuda_matrix().get_cudnn_entry(cudnn_version, ubuntu_version)
 
     # Map the template variables
     mapping = {
@@ -156,10 +166,7 @@ def generate_cudnn_devel(cuda_version: str, cudnn_version: str, ubuntu_version:
     }
 
     # Populate the templated file
-    package = "turludock.assets.dockerfile_templates.nvidia"
-    with importlib.resources.open_text(package, "cudnn_devel.txt") as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template("nvidia/cudnn_devel.txt", mapping)
     str_output += "\n\n"
     return str_output
 
@@ -183,7 +190,7 @@ def generate_cudnn_runtime(cuda_version: str, cudnn_version: str, ubuntu_version
     if not is_cuda_cudnn_version_combination_supported(cuda_version, cudnn_version, ubuntu_version):
         raise ValueError("cuDNN version not supported. Check your configuration.")
 
-    cudnn_config = load_cudnn_config()[cudnn_version][ubuntu_version]
+    cudnn_config = get_cuda_matrix().get_cudnn_entry(cudnn_version, ubuntu_version)
 
     # Map the template variables
     mapping = {
@@ -193,9 +200,6 @@ def generate_cudnn_runtime(cuda_version: str, cudnn_version: str, ubuntu_version
     }
 
     # Populate the templated file
-    package = "turludock.assets.dockerfile_templates.nvidia"
-    with importlib.resources.open_text(package, "cudnn_runtime.txt") as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template("nvidia/cudnn_runtime.txt", mapping)
     str_output += "\n\n"
     return str_output
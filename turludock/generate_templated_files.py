@@ -1,9 +1,8 @@
-import importlib.resources
-from string import Template
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from loguru import logger
 
+import turludock.constants as constants
 from turludock.config_sanity import (
     check_if_cmake_version_exists,
     check_if_llvm_version_exists,
@@ -17,6 +16,7 @@ from turludock.helper_functions import (
     is_version_greater,
     is_version_lower,
 )
+from turludock.template_registry import render_template
 
 
 def populate_templated_file(mapping: Dict[str, str], templated_file: str) -> str:
@@ -28,10 +28,11 @@ def populate_templated_file(mapping: Dict[str, str], templated_file: str) -> str
 
     Returns:
         str: The populated templated file.
+
+    Raises:
+        ValueError: If the mapping misses placeholders of the templated file
     """
-    with importlib.resources.open_text("turludock.assets.dockerfile_templates", templated_file) as f:
-        src = Template(f.read())
-        str_output = src.substitute(mapping)
+    str_output = render_template(templated_file, mapping)
     str_output += "\n\n"
     return str_output
 
@@ -56,7 +57,7 @@ def _get_ubuntu_base_image(version: str, nvidia: bool) -> str:
         return f"ubuntu:{version}"
 
 
-def _get_base_image(yaml_config: Dict[str, Any]) -> str:
+def get_base_image(yaml_config: Dict[str, Any]) -> str:
     """Return the supported base image name.
 
     This is used in the "FROM " part of the Dockerfile. See "from.txt" template.
@@ -93,7 +94,7 @@ def generate_from(yaml_config: Dict[str, Any]) -> str:
         yaml_config (dict): The image configuration in yaml format.
     """
     # Map the template variables
-    base_image = _get_base_image(yaml_config)
+    base_image = get_base_image(yaml_config)
     mapping = {"from": base_image}
 
     # Pick template based on ubuntu version
@@ -109,6 +110,9 @@ def generate_from(yaml_config: Dict[str, Any]) -> str:
 def generate_header_info(docker_label_description: str, ros_version_short: str) -> str:
     """Generates the 'header_info.txt' templated file.
 
+    The "LABEL com.turlucode.content_hash=" field is populated with a placeholder, which is replaced
+    once the complete Dockerfile is generated. See 'generate_dockerfile()'.
+
     Args:
         docker_label_description (str): The text for the "LABEL Description =" field
         ros_version_short (str): The ROS codename used in "LABEL com.turlucode.ros.version="
@@ -129,17 +133,89 @@ def generate_header_info(docker_label_description: str, ros_version_short: str)
     mapping = {
         "docker_label_description": docker_label_description,
         "ros_version_short": ros_version_short,
+        "content_hash": constants.CONTENT_HASH_PLACEHOLDER,
     }
 
     # Populate the templated file
     return populate_templated_file(mapping, "header_info.txt")
 
 
-def generate_cmake(version: str) -> str:
+def _get_builder_base_image(ubuntu_version: str) -> str:
+    """Get the base image of the builder stages. It is used in "FROM <base_image> AS <name>-builder".
+
+    The builder stages only compile the source-built packages, so they do not need the GPU specific
+    base image. They use the plain Ubuntu image of the same version, so the binaries are compatible.
+
+    Args:
+        ubuntu_version (str): The semantic version of Ubuntu
+
+    Returns:
+        str: The Docker image name to use as the base image of the builder stages.
+    """
+    return _get_ubuntu_base_image(ubuntu_version, False)
+
+
+def generate_cmake_builder(
+    version: str, ubuntu_version: str, install_strategy: str = "source", snapshot: Optional[str] = None
+) -> str:
+    """Generates the 'cmake-builder' stage, which provides CMake under '/opt/cmake-install'.
+
+    Depending on the install strategy, the stage either compiles CMake from source ('cmake_builder.txt', or
+    'cmake_builder_snapshot.txt' if the source is taken from a snapshot of the build context) or
+    downloads the official Kitware binary release and verifies it against its published SHA-256 checksum
+    ('cmake_binary_builder.txt'). Kitware provides binaries only for x86_64 and aarch64; for any other
+    architecture use the 'source' strategy.
+
+    Args:
+        version (str): The version of CMake to be used.
+        ubuntu_version (str): The semantic version of Ubuntu, e.g. '22.04'
+        install_strategy (str, optional): Either 'source' or 'binary'. Defaults to 'source'.
+        snapshot (Optional[str], optional): The filename of the source snapshot for the 'source' strategy.
+            Defaults to None, i.e. clone.
+
+    Returns:
+        str: The populated builder stage as a string.
+
+    Raises:
+        ValueError: If the install strategy is not known
+    """
+    logger.debug(f"Generate cmake builder stage. Input: {version}, {ubuntu_version}, {install_strategy}")
+
+    if install_strategy == "source":
+        # Map the template variables
+        mapping = {
+            "from": _get_builder_base_image(ubuntu_version),
+            "cmake_version": version,
+            "num_of_cpu": get_cpu_count_for_build(),
+        }
+        # Populate the templated file
+        if snapshot is not None:
+            mapping["snapshot"] = snapshot
+            return populate_templated_file(mapping, "cmake_builder_snapshot.txt")
+        return populate_templated_file(mapping, "cmake_builder.txt")
+    elif install_strategy == "binary":
+        # Map the template variables. Releases before v3.20 use 'Linux' instead of 'linux' in the tarball name.
+        mapping = {
+            "from": _get_builder_base_image(ubuntu_version),
+            "cmake_version": version,
+            "cmake_release": version.lstrip("v"),
+            "cmake_platform": "Linux" if is_version_lower(version, "3.20") else "linux",
+        }
+        # Populate the templated file
+        return populate_templated_file(mapping, "cmake_binary_builder.txt")
+    else:
+        raise ValueError(f"generate_cmake_builder() unknown install strategy: {install_strategy}")
+
+
+def generate_cmake(version: str, check_version: bool = True) -> str:
     """Generates the 'cmake.txt' templated file.
 
+    CMake is compiled or downloaded in the 'cmake-builder' stage, see 'generate_cmake_builder()'. Here we
+    only copy the installed artifacts into the image.
+
     Args:
         version (str): The version of CMake to be used.
+        check_version (bool, optional): Whether to check the version against the remote. Defaults to True.
 
     Returns:
         str: The populated 'cmake.txt' file as a string.
@@ -147,41 +223,88 @@ def generate_cmake(version: str) -> str:
     logger.debug(f"Generate 'cmake.txt'. Input: {version}")
 
     # Check if provided version exists in remote
-    check_if_cmake_version_exists(version)
+    if check_version:
+        check_if_cmake_version_exists(version)
 
     # Map the template variables
-    mapping = {"cmake_version": version, "num_of_cpu": get_cpu_count_for_build()}
+    mapping = {"cmake_version": version}
 
     # Populate the templated file
     return populate_templated_file(mapping, "cmake.txt")
 
 
-def generate_tmux(version: str) -> str:
+def generate_tmux_builder(version: str, ubuntu_version: str, snapshot: Optional[str] = None) -> str:
+    """Generates the stage which compiles tmux from source.
+
+    The source is either cloned inside the stage ('tmux_builder.txt') or taken from a source snapshot of the
+    build context ('tmux_builder_snapshot.txt'), see 'source_cache.get_source_snapshot()'.
+
+    Args:
+        version (str): The version of tmux to be used.
+        ubuntu_version (str): The semantic version of Ubuntu, e.g. '22.04'
+        snapshot (Optional[str], optional): The filename of the source snapshot. Defaults to None, i.e. clone.
+
+    Returns:
+        str: The populated builder stage as a string.
+    """
+    logger.debug(f"Generate tmux builder stage. Input: {version}, {ubuntu_version}, {snapshot}")
+
+    # Map the template variables
+    mapping = {
+        "from": _get_builder_base_image(ubuntu_version),
+        "tmux_version": version,
+        "num_of_cpu": get_cpu_count_for_build(),
+    }
+
+    # Populate the templated file
+    if snapshot is not None:
+        mapping["snapshot"] = snapshot
+        return populate_templated_file(mapping, "tmux_builder_snapshot.txt")
+    return populate_templated_file(mapping, "tmux_builder.txt")
+
+
+def generate_tmux(version: str, ubuntu_version: str, check_version: bool = True) -> str:
     """Generates the 'tmux.txt' templated file.
 
+    tmux is compiled in the 'tmux-builder' stage, see 'generate_tmux_builder()'. Here we only install
+    its runtime libraries and copy the installed artifacts into the image.
+
     Args:
         version (str): The version of tmux to be used.
+        ubuntu_version (str): The semantic version of Ubuntu, e.g. '22.04'
+        check_version (bool, optional): Whether to check the version against the remote. Defaults to True.
 
     Returns:
         str: The populated 'tmux.txt' file as a string.
     """
-    logger.debug(f"Generate 'tmux.txt'. Input: {version}'")
+    logger.debug(f"Generate 'tmux.txt'. Input: {version}, {ubuntu_version}")
 
     # Check if provided version exists in remote
-    check_if_tmux_version_exists(version)
+    if check_version:
+        check_if_tmux_version_exists(version)
+
+    # Ubuntu 24.04 renamed the libevent runtime packages with the 64-bit time_t transition
+    if is_version_greater(ubuntu_version, "23.04"):
+        libevent_suffix = "t64"
+    else:
+        libevent_suffix = ""
 
     # Map the template variables
-    mapping = {"tmux_version": version, "num_of_cpu": get_cpu_count_for_build()}
+    mapping = {
+        "tmux_version": version,
+        "tmux_runtime_packages": f"libevent-2.1-7{libevent_suffix} libevent-core-2.1-7{libevent_suffix} libncurses6",
+    }
 
     # Populate the templated file
     return populate_templated_file(mapping, "tmux.txt")
 
 
-def generate_llvm(version: str) -> str:
+def generate_llvm(version: str, check_version: bool = True) -> str:
     """Generates the 'llvm.txt' templated file.
 
     Args:
         version (str): The version of LLVM to be used.
+        check_version (bool, optional): Whether to check the version against the remote. Defaults to True.
 
     Returns:
         str: The populated 'llvm.txt' file as a string.
@@ -189,7 +312,8 @@ def generate_llvm(version: str) -> str:
     logger.debug(f"Generate 'llvm.txt'. Input: {version}")
 
     # Check if provided version is supported
-    check_if_llvm_version_exists(version)
+    if check_version:
+        check_if_llvm_version_exists(version)
 
     # Map the template variables
     mapping = {"llvm_version": version}
@@ -198,13 +322,52 @@ def generate_llvm(version: str) -> str:
     return populate_templated_file(mapping, "llvm.txt")
 
 
-def generate_ros(ros_version_codename: str) -> str:
+def _get_ros_packages(ros_version_codename: str, ros_variant: Optional[str] = None) -> List[str]:
+    """Get the apt packages that install ROS.
+
+    Without a variant the full desktop installation is used, i.e. 'desktop-full' and some extras for ROS 1 and
+    'desktop', 'perception' and PCL for ROS 2. With a variant only its metapackage and the ROS development
+    tools are installed.
+
+    Args:
+        ros_version_codename (str): The ROS version as codename.
+        ros_variant (Optional[str], optional): The ROS variant, see 'constants.ROS_VARIANTS'. Defaults to None.
+
+    Returns:
+        List[str]: The apt packages
+    """
+    if get_ros_major_version(ros_version_codename) == 1:
+        # rosdep is initialized after the installation, see 'ros1.txt'
+        dev_tools = ["python3-rosdep", "python3-rosinstall-generator", "python3-vcstool", "build-essential"]
+        if ros_variant is not None:
+            return [f"ros-{ros_version_codename}-{ros_variant}"] + dev_tools
+        return (
+            ["libpcap-dev", "libopenblas-dev", "gstreamer1.0-tools", "libgstreamer1.0-dev"]
+            + ["libgstreamer-plugins-base1.0-dev", "libgstreamer-plugins-good1.0-dev"]
+            + [f"ros-{ros_version_codename}-desktop-full"]
+            + dev_tools
+            + [f"ros-{ros_version_codename}-socketcan-bridge", f"ros-{ros_version_codename}-geodesy"]
+        )
+
+    if ros_variant is not None:
+        return [f"ros-{ros_version_codename}-{ros_variant}", "ros-dev-tools"]
+    return [
+        f"ros-{ros_version_codename}-desktop",
+        "ros-dev-tools",
+        f"ros-{ros_version_codename}-perception",
+        "libpcl-dev",
+    ]
+
+
+def generate_ros(ros_version_codename: str, ros_variant: Optional[str] = None) -> str:
     """Generates the 'ros1.txt' or 'ros2.txt' templated file, which is responsible for installing ROS 1 or 2
 
     The selection of ROS 1 or 2 is based on the provided ROS codename.
 
     Args:
         ros_version_codename (str): The ROS version as codename.
+        ros_variant (Optional[str], optional): The ROS variant to install, e.g. 'ros-base'. Defaults to None,
+            i.e. the full desktop installation, see '_get_ros_packages()'.
 
     Returns:
         str: The populated 'ros1.txt' file as a string.
@@ -218,19 +381,42 @@ def generate_ros(ros_version_codename: str) -> str:
     else:
         template_file = "ros2.txt"
 
-    logger.debug(f"Generate '{template_file}'. Input: {ros_version_codename}")
+    logger.debug(f"Generate '{template_file}'. Input: {ros_version_codename}, {ros_variant}")
 
     # Check if provided version is supported
     if not is_ros_version_supported(ros_version_codename):
         raise ValueError("ROS version not supported. Check your configuration.")
 
     # Map the template variables
-    mapping = {"ros_version_short": ros_version_codename}
+    mapping = {
+        "ros_version_short": ros_version_codename,
+        "ros_packages": " \\\n    ".join(_get_ros_packages(ros_version_codename, ros_variant)),
+    }
 
     # Populate the templated file
     return populate_templated_file(mapping, template_file)
 
 
+def generate_ros_repository(ros_version_codename: str) -> str:
+    """Generates the 'ros1_repository.txt' or 'ros2_repository.txt' templated file, which adds the ROS apt repository
+
+    Args:
+        ros_version_codename (str): The ROS version as codename.
+
+    Returns:
+        str: The populated 'ros1_repository.txt' or 'ros2_repository.txt' file as a string.
+    """
+    if get_ros_major_version(ros_version_codename) == 1:
+        template_file = "ros1_repository.txt"
+    else:
+        template_file = "ros2_repository.txt"
+
+    logger.debug(f"Generate '{template_file}'. Input: {ros_version_codename}")
+
+    # The repository does not depend on the ROS distribution, but the template escapes its shell variables
+    return populate_templated_file(dict(), template_file)
+
+
 def generate_extra_packages_label(extra_packages_list: List[str]) -> str:
     """Generates the 'extra_packages_label.txt' templated file
 
@@ -1,15 +1,16 @@
+import hashlib
 import importlib.metadata
 import importlib.resources
+import json
 import multiprocessing
 import os
 import re
 import subprocess
-from typing import List
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
 
-import requests
-import urllib3
 from loguru import logger
-from packaging.version import InvalidVersion, Version
 
 import turludock.constants as constants
 
@@ -24,50 +25,241 @@ def get_module_name() -> str:
     return "turludock"
 
 
+_remote_cache_settings = {"ttl": constants.REMOTE_CACHE_TTL_SECONDS, "offline": False}
+
+# The results of the remote lookups of this process and a lock per remote URL, so that concurrent lookups of
+# the same URL, e.g. of parallel preset builds, fetch it only once, see 'cached_remote_lookup()'
+_remote_lookup_results: Dict[str, Any] = dict()
+_remote_lookup_locks: Dict[str, threading.Lock] = dict()
+_remote_lookup_locks_lock = threading.Lock()
+
+
+def configure_remote_cache(ttl: Optional[int] = None, offline: bool = False) -> None:
+    """Configure the on-disk cache used for remote version lookups.
+
+    Args:
+        ttl (Optional[int]): Time-to-live of a cache entry in seconds. If None, the default TTL is used.
+        offline (bool): If True, never reach the network and serve (possibly stale) cache entries instead.
+    """
+    global _remote_cache_settings
+    if ttl is None:
+        ttl = constants.REMOTE_CACHE_TTL_SECONDS
+    if ttl < 0:
+        raise ValueError(f"Cache TTL cannot be negative. You provided: {ttl}")
+    _remote_cache_settings = {"ttl": ttl, "offline": offline}
+    # Results looked up with the previous settings must not be served anymore
+    with _remote_lookup_locks_lock:
+        _remote_lookup_results.clear()
+
+
+def is_offline_mode() -> bool:
+    """Checks if remote lookups are restricted to the on-disk cache.
+
+    Returns:
+        bool: True if the offline mode is enabled, False otherwise.
+    """
+    return _remote_cache_settings["offline"]
+
+
+def get_cache_directory() -> str:
+    """Get the per-user cache directory of turludock.
+
+    Uses ``$XDG_CACHE_HOME/turludock`` and falls back to ``~/.cache/turludock``.
+
+    Returns:
+        str: The path to the cache directory.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, get_module_name())
+
+
+def _get_remote_cache_file(remote_url: str) -> str:
+    """Get the path of the cache file that stores the lookup result of a remote URL.
+
+    Args:
+        remote_url (str): The remote URL used as cache key.
+
+    Returns:
+        str: The path to the cache file.
+    """
+    key = hashlib.sha256(remote_url.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_directory(), "remote", f"{key}.json")
+
+
+def _read_remote_cache(remote_url: str) -> Optional[dict]:
+    """Read the cache entry of a remote URL.
+
+    Args:
+        remote_url (str): The remote URL used as cache key.
+
+    Returns:
+        Optional[dict]: The cache entry with keys 'url', 'timestamp' and 'value', or None if there is no
+            (valid) entry.
+    """
+    cache_file = _get_remote_cache_file(remote_url)
+    try:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get("url") != remote_url or "value" not in entry:
+        return None
+    return entry
+
+
+def _write_remote_cache(remote_url: str, value: Any) -> None:
+    """Store the lookup result of a remote URL in the cache.
+
+    Failing to write the cache is not fatal; the result is then simply not cached.
+
+    Args:
+        remote_url (str): The remote URL used as cache key.
+        value (Any): The JSON serializable lookup result.
+    """
+    cache_file = _get_remote_cache_file(remote_url)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump({"url": remote_url, "timestamp": time.time(), "value": value}, file)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.debug(f"Could not write remote cache for '{remote_url}': {e}")
+
+
+def cached_remote_lookup(remote_url: str, fetch: Callable[[], Any]) -> Any:
+    """Get the result of a remote lookup from the on-disk cache or fetch it.
+
+    A cache entry younger than the configured TTL is served directly. Otherwise the result is fetched
+    and stored. If fetching fails and a stale entry exists, the stale entry is served. In offline mode
+    the network is never reached and any existing entry is served regardless of its age.
+
+    Each remote URL is looked up once per process: concurrent lookups of the same URL wait for the first
+    one, and later lookups get its result from memory. Failed lookups are not remembered.
+
+    Args:
+        remote_url (str): The remote URL used as cache key.
+        fetch (Callable[[], Any]): Callable performing the actual lookup. Must return a JSON serializable value.
+
+    Returns:
+        Any: The (possibly cached) lookup result. It is shared between the callers and must not be modified.
+
+    Raises:
+        RuntimeError: If in offline mode and there is no cache entry for the remote URL.
+    """
+    with _remote_lookup_locks_lock:
+        lock = _remote_lookup_locks.setdefault(remote_url, threading.Lock())
+    with lock:
+        if remote_url in _remote_lookup_results:
+            return _remote_lookup_results[remote_url]
+        value = _lookup_remote_cache_or_fetch(remote_url, fetch)
+        _remote_lookup_results[remote_url] = value
+        return value
+
+
+def _lookup_remote_cache_or_fetch(remote_url: str, fetch: Callable[[], Any]) -> Any:
+    """Get the result of a remote lookup from the on-disk cache or fetch it, see 'cached_remote_lookup()'.
+
+    Args:
+        remote_url (str): The remote URL used as cache key.
+        fetch (Callable[[], Any]): Callable performing the actual lookup.
+
+    Returns:
+        Any: The (possibly cached) lookup result.
+
+    Raises:
+        RuntimeError: If in offline mode and there is no cache entry for the remote URL.
+    """
+    entry = _read_remote_cache(remote_url)
+    if is_offline_mode():
+        if entry is None:
+            raise RuntimeError(f"Offline mode: No cached result for '{remote_url}'. Run once without '--offline'.")
+        logger.debug(f"Offline mode: Using cached result for '{remote_url}'")
+        return entry["value"]
+
+    if entry is not None and time.time() - entry["timestamp"] < _remote_cache_settings["ttl"]:
+        logger.debug(f"Using cached result for '{remote_url}'")
+        return entry["value"]
+
+    try:
+        value = fetch()
+    except Exception as e:
+        if entry is None:
+            raise
+        logger.warning(f"Could not reach '{remote_url}' ({e}). Using stale cached result.")
+        return entry["value"]
+    _write_remote_cache(remote_url, value)
+    return value
+
+
+def _fetch_remote_tags(remote_url: str) -> List[str]:
+    """List the tags of a remote repository using 'git ls-remote'.
+
+    Args:
+        remote_url (str): The URL of the remote repository.
+
+    Returns:
+        List[str]: The tag names of the remote repository.
+
+    Raises:
+        subprocess.CalledProcessError: If the git command is not successful.
+    """
+    # Run the git command to list remote tags
+    result = subprocess.run(
+        ["git", "ls-remote", "--tags", remote_url],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+    # Each line looks like: "<sha>\trefs/tags/<tag_name>"
+    tags = list()
+    for line in result.stdout.splitlines():
+        _, _, ref = line.partition("\t")
+        if ref.startswith("refs/tags/"):
+            tags.append(ref.replace("refs/tags/", "", 1))
+    return tags
+
+
 def check_if_remote_tag_exists(remote_url: str, tag_name: str) -> bool:
     """Check if a specific tag exists in a remote repository.
 
+    The tags of the remote repository are cached on disk, see 'cached_remote_lookup()'.
+
     Args:
         remote_url (str): The URL of the remote repository.
         tag_name (str): The name of the tag to check.
 
     Returns:
         bool: True if the tag exists, False otherwise.
-
-    Raises:
-        Exception: If a general exception occurs while checking the tag.
     """
     try:
-        # Run the git command to list remote tags
-        result = subprocess.run(
-            ["git", "ls-remote", "--tags", remote_url],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-        )
-
-        # Check if the command was successful
-        if result.returncode != 0:
-            logger.error(f"Git command not successful: {result.stderr}")
-            return False
-
-        # Check if the tag exists in the remote repository
-        tags = result.stdout
-        if f"refs/tags/{tag_name}" in tags:
-            logger.debug(f"Tag '{tag_name}' exists in remote")
-            return True
-        else:
-            logger.error(f"Tag {tag_name} not found in remote! Check provided tag!")
-            return False
+        tags = cached_remote_lookup(remote_url, lambda: _fetch_remote_tags(remote_url))
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Git command not successful: {e.stderr}")
+        return False
     except Exception as e:
         logger.error(f"Could not check if remote-tag in remote exists: {e}")
         return False
 
+    # Check if the tag exists in the remote repository
+    # Note: the tag name might not be a string, e.g. tmux versions are parsed as float from the .yaml
+    if str(tag_name) in tags or f"{tag_name}^{{}}" in tags:
+        logger.debug(f"Tag '{tag_name}' exists in remote")
+        return True
+    else:
+        logger.error(f"Tag {tag_name} not found in remote! Check provided tag!")
+        return False
+
 
 def get_github_latest_version_tag(owner: str, repo: str) -> str:
     """Fetches the latest version tag from a GitHub repository.
 
+    The tags of the repository are cached on disk, see 'cached_remote_lookup()'. The GitHub API URL can be
+    overridden with the environment variable 'TURLUDOCK_GITHUB_API_URL'.
+
     Args:
         owner (str): The owner of the repository.
         repo (str): The name of the repository.
@@ -82,20 +274,29 @@ def get_github_latest_version_tag(owner: str, repo: str) -> str:
     logger.debug(f"Trying to get latest version-tag from github for {owner}/{repo}...")
 
     # GitHub API URL for fetching tags of the repository
-    url = f"https://api.github.com/repos/{owner}/{repo}/tags"
-    response = requests.get(url, timeout=10)
+    api_url = os.environ.get(constants.GITHUB_API_URL_ENV, constants.GITHUB_API_URL).rstrip("/")
+    url = f"{api_url}/repos/{owner}/{repo}/tags"
 
-    # Check if the request was successful
-    if response.status_code != 200:
-        raise ValueError(f"Cannot determine tag-version: Error fetching tags: {response.status_code}")
+    def fetch_tag_names() -> List[str]:
+        # Imported lazily, since they are slow to import and only needed for remote lookups
+        import requests
+
+        response = requests.get(url, timeout=10)
 
-    # Parse the JSON response to get the list of tags
-    tags = response.json()
+        # Check if the request was successful
+        if response.status_code != 200:
+            raise ValueError(f"Cannot determine tag-version: Error fetching tags: {response.status_code}")
+
+        # Parse the JSON response to get the list of tags
+        return [tag["name"] for tag in response.json()]
+
+    tag_names = cached_remote_lookup(url, fetch_tag_names)
+
+    from packaging.version import InvalidVersion, Version
 
     # Iterate over each tag to check if it follows semantic versioning
     valid_versions = []
-    for tag in tags:
-        tag_name = tag["name"]
+    for tag_name in tag_names:
         try:
             version = Version(tag_name.lstrip("v"))  # Remove 'v' prefix if present
             valid_versions.append((version, tag_name))
@@ -111,18 +312,19 @@ def get_github_latest_version_tag(owner: str, repo: str) -> str:
     return latest_version[1]
 
 
-def get_llvm_supported_versions() -> List[int]:
-    """Fetches a list of supported LLVM versions from the official LLVM APT repository.
+def _fetch_llvm_supported_versions(url: str) -> List[int]:
+    """Fetches the LLVM install script and extracts the supported LLVM versions from it.
 
-    The function fetches the content of the URL ``https://apt.llvm.org/llvm.sh`` and
-    uses a regular expression to extract the supported LLVM version numbers from the
-    content.
+    Args:
+        url (str): The URL of the LLVM install script.
 
     Returns:
         List[int]: A list of integers representing the supported LLVM version numbers
     """
-    # Get LLVM install script which contains info about the supported versions
-    url = "https://apt.llvm.org/llvm.sh"
+    # Imported lazily, since they are slow to import and only needed for remote lookups
+    import requests
+    import urllib3
+
     try:
         # fixes warning: InsecureRequestWarning: Unverified HTTPS request is being made to host 'apt.llvm.org'
         # when using verify=False in requests.get()
@@ -152,13 +354,30 @@ def get_llvm_supported_versions() -> List[int]:
 
     if len(supported_versions) == 0:
         raise ValueError(
-            "No supported llvm could be extracted from https://apt.llvm.org/llvm.sh. "
+            f"No supported llvm could be extracted from {url}. "
             "Versioning might have changed, contact developers of this tool."
         )
 
     return supported_versions
 
 
+def get_llvm_supported_versions() -> List[int]:
+    """Fetches a list of supported LLVM versions from the official LLVM APT repository.
+
+    The function fetches the content of the URL ``https://apt.llvm.org/llvm.sh`` and
+    uses a regular expression to extract the supported LLVM version numbers from the
+    content. The result is cached on disk, see 'cached_remote_lookup()'.
+
+    The URL can be overridden with the environment variable 'TURLUDOCK_LLVM_SCRIPT_URL'.
+
+    Returns:
+        List[int]: A list of integers representing the supported LLVM version numbers
+    """
+    # Get LLVM install script which contains info about the supported versions
+    url = os.environ.get(constants.LLVM_SCRIPT_URL_ENV, constants.LLVM_SCRIPT_URL)
+    return cached_remote_lookup(url, lambda: _fetch_llvm_supported_versions(url))
+
+
 def get_llvm_latest_version() -> int:
     """Fetches the latest supported LLVM version number.
 
@@ -211,6 +430,59 @@ def list_packaged_yaml_files(asset_folder: str) -> List[str]:
             raise
 
 
+def compute_content_hash(dockerfile: str) -> str:
+    """Compute the content hash of a build context, i.e. of the Dockerfile and its assets.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+
+    Returns:
+        str: The sha256 hash over the Dockerfile and the assets in 'constants.DOCKERFILE_ASSETS'
+    """
+    content_hash = hashlib.sha256(dockerfile.encode("utf-8"))
+    assets = importlib.resources.files("turludock.assets.dockerfile_assets")
+    for asset in constants.DOCKERFILE_ASSETS:
+        content_hash.update(asset.encode("utf-8"))
+        content_hash.update((assets / asset).read_bytes())
+    return content_hash.hexdigest()
+
+
+def get_content_hash(dockerfile: str) -> Optional[str]:
+    """Get the content hash that is stamped in the "LABEL com.turlucode.content_hash=" of a Dockerfile.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+
+    Returns:
+        Optional[str]: The content hash or None if the Dockerfile has no content hash label
+    """
+    # The label may be collapsed with other labels into one LABEL instruction, see 'dockerfile_ir'
+    match = re.search(rf'(?:LABEL|\s){re.escape(constants.CONTENT_HASH_LABEL)}="([0-9a-f]+)"', dockerfile)
+    if match:
+        return match.group(1)
+    return None
+
+
+def get_host_user_build_args() -> Dict[str, str]:
+    """Get the build args that bake the current host user into the image, see 'assets/dockerfile_templates/user.txt'.
+
+    Returns:
+        Dict[str, str]: The user and group names and ids as 'DOCKER_USER_*' build args
+    """
+    # POSIX only, so they are not imported at module level
+    import grp
+    import pwd
+
+    user = pwd.getpwuid(os.getuid())
+    group = grp.getgrgid(os.getgid())
+    return {
+        "DOCKER_USER_NAME": user.pw_name,
+        "DOCKER_USER_ID": str(user.pw_uid),
+        "DOCKER_USER_GROUP_NAME": group.gr_name,
+        "DOCKER_USER_GROUP_ID": str(group.gr_gid),
+    }
+
+
 def get_cpu_count_for_build() -> int:
     """Get the number of CPUs available for a build.
 
@@ -296,6 +568,8 @@ def is_version_lower(version_to_check: str, reference_version: str) -> bool:
     Returns:
         bool: True if the version is lower than the reference version, False otherwise.
     """
+    from packaging.version import Version
+
     version = Version(version_to_check)
     reference = Version(reference_version)
     return version < reference
@@ -311,6 +585,8 @@ def is_version_greater(version_to_check: str, reference_version: str) -> bool:
     Returns:
         bool: True if the version is greater than the reference version, False otherwise.
     """
+    from packaging.version import Version
+
     version = Version(version_to_check)
     reference = Version(reference_version)
     return version > reference
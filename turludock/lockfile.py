@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+import yaml
+from loguru import logger
+
+import turludock.default_image_config as default_image_config
+from turludock.config_parser import check_dockerfile_config, get_config_name
+from turludock.cuda_matrix import get_cuda_matrix
+from turludock.filesystem_operations import get_filename_from_path
+from turludock.generate_dockerfile import resolve_package_versions
+from turludock.generate_templated_files import get_base_image
+from turludock.helper_functions import get_program_version, get_ubuntu_version
+from turludock.yaml_load import load_yaml_file
+
+LOCKFILE_SUFFIX = ".lock.yaml"
+
+# Keys of the yaml configuration that are not part of the actual image configuration
+_NON_CONFIG_KEYS = ("filename", "lock")
+
+
+def get_lockfile_path(yaml_config_path: str) -> str:
+    """Get the path of the lockfile that belongs to the given YAML configuration.
+
+    The lockfile lives next to the YAML configuration, e.g. 'custom.yaml' -> 'custom.lock.yaml'.
+
+    Args:
+        yaml_config_path (str): The path to the YAML configuration
+
+    Returns:
+        str: The path to the lockfile
+    """
+    root, _ = os.path.splitext(yaml_config_path)
+    return root + LOCKFILE_SUFFIX
+
+
+def compute_config_hash(yaml_config: Dict[str, Any]) -> str:
+    """Compute a hash over the image configuration.
+
+    It is used to detect if a lockfile is outdated, i.e. if the configuration changed after locking it.
+
+    Args:
+        yaml_config (dict): The image configuration in yaml format.
+
+    Returns:
+        str: The sha256 hash of the configuration
+    """
+    config = {key: value for key, value in yaml_config.items() if key not in _NON_CONFIG_KEYS}
+    serialized = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def _get_nvidia_entries(yaml_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the entries of the CUDA/cuDNN tables that are used by the given configuration.
+
+    Args:
+        yaml_config (dict): The image configuration in yaml format.
+
+    Returns:
+        Dict[str, Any]: The CUDA and cuDNN table entries. Empty if no CUDA is configured.
+    """
+    nvidia_entries = dict()
+    ubuntu_version = get_ubuntu_version(yaml_config["ros_version"])
+    cuda_matrix = get_cuda_matrix()
+    if "cuda_version" in yaml_config:
+        nvidia_entries["cuda"] = cuda_matrix.get_cuda_entry(yaml_config["cuda_version"], ubuntu_version["flat"])
+        if "cudnn_version" in yaml_config:
+            nvidia_entries["cudnn"] = cuda_matrix.get_cudnn_entry(yaml_config["cudnn_version"], ubuntu_version["flat"])
+    return nvidia_entries
+
+
+def create_lock(yaml_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve all floating versions of the given configuration and create the lock.
+
+    Args:
+        yaml_config (dict): The image configuration in yaml format.
+
+    Returns:
+        Dict[str, Any]: The lock, i.e. the resolved package versions, the CUDA/cuDNN table entries and the
+            base image
+    """
+    # Check Dockerfile .yaml configuration
+    check_dockerfile_config(yaml_config)
+
+    package_versions = resolve_package_versions(yaml_config)
+    return {
+        "turludock_version": get_program_version(),
+        "config_hash": compute_config_hash(yaml_config),
+        "base_image": get_base_image(yaml_config),
+        "packages": {name: str(version) for name, version in package_versions.items()},
+        "nvidia": _get_nvidia_entries(yaml_config),
+    }
+
+
+def write_lockfile(lock: Dict[str, Any], lockfile_path: str) -> None:
+    """Write the lock to the given path.
+
+    Args:
+        lock (Dict[str, Any]): The lock as created by 'create_lock()'
+        lockfile_path (str): The path of the lockfile
+    """
+    with open(lockfile_path, "w", encoding="utf-8") as file:
+        file.write("# Generated by 'turludock lock'. Do not edit manually.\n")
+        yaml.safe_dump(lock, file, sort_keys=False)
+    logger.debug(f"Successfully wrote lockfile '{lockfile_path}'")
+
+
+def apply_lockfile(yaml_config: Dict[str, Any], lockfile_path: str) -> None:
+    """Load the lockfile and attach it to the given configuration.
+
+    A locked configuration is generated without any remote lookups: the package versions are taken from the
+    lockfile as they are.
+
+    Args:
+        yaml_config (dict): The image configuration in yaml format.
+        lockfile_path (str): The path of the lockfile
+
+    Raises:
+        ValueError: If the lockfile does not match the configuration or this version of turludock
+    """
+    try:
+        lock = load_yaml_file(lockfile_path)
+        if not isinstance(lock, dict) or "config_hash" not in lock or "packages" not in lock:
+            raise ValueError(f"'{lockfile_path}' is not a valid lockfile.")
+
+        if lock["config_hash"] != compute_config_hash(yaml_config):
+            raise ValueError(f"Lockfile '{lockfile_path}' is outdated. Configuration changed, re-run 'turludock lock'.")
+
+        # The tables and the base image are part of turludock itself. Make sure they did not change since locking.
+        if lock.get("nvidia", dict()) != _get_nvidia_entries(yaml_config):
+            raise ValueError(
+                f"CUDA/cuDNN entries of lockfile '{lockfile_path}' differ from the ones of turludock "
+                + f"v{get_program_version()}. Re-run 'turludock lock'."
+            )
+        if lock.get("base_image") != get_base_image(yaml_config):
+            raise ValueError(
+                f"Base image of lockfile '{lockfile_path}' differs from the one of turludock "
+                + f"v{get_program_version()}. Re-run 'turludock lock'."
+            )
+    except ValueError as e:
+        logger.error(f"Lockfile error: {e}")
+        raise
+
+    logger.info(f"Using lockfile '{lockfile_path}'")
+    yaml_config["lock"] = lock
+
+
+def apply_lockfile_if_present(yaml_config: Dict[str, Any], yaml_config_path: str, lockfile_path: Optional[str]) -> None:
+    """Attach the lockfile to a custom configuration, if one is provided or exists next to the configuration.
+
+    Args:
+        yaml_config (dict): The image configuration in yaml format.
+        yaml_config_path (str): The path to the YAML configuration
+        lockfile_path (Optional[str]): The path of an explicitly provided lockfile, or None
+    """
+    if lockfile_path is None:
+        lockfile_path = get_lockfile_path(yaml_config_path)
+        if not os.path.isfile(lockfile_path):
+            return
+    apply_lockfile(yaml_config, lockfile_path)
+
+
+def lock_pre_config(config_name: str, lockfile_path: Optional[str]) -> None:
+    """Create the lockfile for one of the provided pre-configurations.
+
+    Args:
+        config_name (str): The name of the pre-configuration
+        lockfile_path (Optional[str]): The path of the lockfile. If None, '<config_name>.lock.yaml' in the
+            current directory is used.
+    """
+    try:
+        yaml_config = default_image_config.get_yaml_config(config_name)
+        if lockfile_path is None:
+            lockfile_path = get_config_name(yaml_config["filename"]) + LOCKFILE_SUFFIX
+        write_lockfile(create_lock(yaml_config), lockfile_path)
+
+        print("")
+        logger.info(f"Locked pre-configuration '{config_name}' in '{lockfile_path}'")
+    except Exception:
+        logger.error(f"Could not lock pre-configuration '{config_name}'.")
+        raise
+
+
+def lock_user_config(yaml_config_path: str, lockfile_path: Optional[str]) -> None:
+    """Create the lockfile for a custom YAML configuration.
+
+    Args:
+        yaml_config_path (str): The path to the YAML configuration
+        lockfile_path (Optional[str]): The path of the lockfile. If None, the lockfile is stored next to the
+            YAML configuration.
+    """
+    try:
+        yaml_config = load_yaml_file(yaml_config_path)
+        yaml_config.update({"filename": get_filename_from_path(yaml_config_path)})
+        if lockfile_path is None:
+            lockfile_path = get_lockfile_path(yaml_config_path)
+        write_lockfile(create_lock(yaml_config), lockfile_path)
+
+        print("")
+        logger.info(f"Locked '{yaml_config_path}' in '{lockfile_path}'")
+    except Exception:
+        logger.error(f"Could not lock '{yaml_config_path}'.")
+        raise
@@ -5,11 +5,12 @@ from loguru import logger
 _logger_id = 0
 
 
-def configure_logger(debug: bool = False) -> None:
+def configure_logger(debug: bool = False, stderr: bool = False) -> None:
     """Configure the logger.
 
     Args:
         debug: Whether to set the logger level to DEBUG. Otherwise level is set to INFO.
+        stderr: Whether to log to stderr instead of stdout, e.g. if stdout carries data.
 
     The logger is configured to print messages in the format: <level>{message}</level>
     """
@@ -24,4 +25,6 @@ def configure_logger(debug: bool = False) -> None:
     # format="<level>{time:HH:mm:ss.SS}</level> | <level>{level: <8}</level> | <level>{message}</level>", level=level)
     # logger.level("INFO", color="<green>")
 
-    _logger_id = logger.add(sys.stdout, colorize=True, format="<level>{message}</level>", level=level)
+    _logger_id = logger.add(
+        sys.stderr if stderr else sys.stdout, colorize=True, format="<level>{message}</level>", level=level
+    )
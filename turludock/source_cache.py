@@ -0,0 +1,185 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from turludock.helper_functions import get_cache_directory, is_offline_mode
+
+# Folder of the build context that holds the source snapshots, see 'copy_source_snapshots()'
+SOURCE_SNAPSHOT_FOLDER = "sources"
+
+# Matches the snapshots that a generated Dockerfile adds from the build context
+_SNAPSHOT_PATTERN = re.compile(rf"^ADD {SOURCE_SNAPSHOT_FOLDER}/(\S+\.tar\.gz) ", re.MULTILINE)
+
+# One lock per snapshot, so concurrent builds of the same tag download it only once
+_snapshot_locks: Dict[str, threading.Lock] = dict()
+_snapshot_locks_guard = threading.Lock()
+
+
+def get_snapshot_filename(name: str, tag: str) -> str:
+    """Get the filename of the source snapshot of a given package and tag.
+
+    Args:
+        name (str): The name of the package, e.g. 'CMake'. It is also the top folder of the snapshot.
+        tag (str): The git tag of the snapshot, e.g. 'v3.29.3'
+
+    Returns:
+        str: The filename of the source snapshot, e.g. 'CMake-v3.29.3.tar.gz'
+    """
+    return f"{name}-{tag}.tar.gz"
+
+
+def _get_snapshot_lock(filename: str) -> threading.Lock:
+    """Get the lock of the given snapshot, creating it if needed.
+
+    Args:
+        filename (str): The filename of the source snapshot
+
+    Returns:
+        threading.Lock: The lock of the snapshot
+    """
+    with _snapshot_locks_guard:
+        return _snapshot_locks.setdefault(filename, threading.Lock())
+
+
+def _create_snapshot(name: str, repo_url: str, tag: str, snapshot_path: str) -> None:
+    """Create a source snapshot by a shallow clone of the given tag.
+
+    Only the tree of the tag is downloaded, not the full history. The archive is written to a temporary
+    file first and then moved into place, so other processes never see a partial snapshot.
+
+    Args:
+        name (str): The name of the package. It is used as the top folder of the snapshot.
+        repo_url (str): The URL of the git repository
+        tag (str): The git tag of the snapshot
+        snapshot_path (str): The path of the snapshot to create
+
+    Raises:
+        subprocess.CalledProcessError: If a git command is not successful.
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(snapshot_path)) as temp_dir:
+        clone_dir = os.path.join(temp_dir, name)
+        subprocess.run(
+            ["git", "clone", "--quiet", "--depth", "1", "--branch", tag, repo_url, clone_dir],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        temp_snapshot = os.path.join(temp_dir, os.path.basename(snapshot_path))
+        subprocess.run(
+            ["git", "-C", clone_dir, "archive", "--format=tar.gz", f"--prefix={name}/", "-o", temp_snapshot, "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        os.replace(temp_snapshot, snapshot_path)
+
+
+def get_source_snapshot(name: str, repo_url: str, tag: str) -> str:
+    """Get the source snapshot of the given tag from the host-side cache, downloading it if needed.
+
+    The snapshots are stored in '$XDG_CACHE_HOME/turludock/sources'. A tag never changes, so a cached
+    snapshot is never refreshed.
+
+    Args:
+        name (str): The name of the package. It is used as the top folder of the snapshot.
+        repo_url (str): The URL of the git repository
+        tag (str): The git tag of the snapshot
+
+    Returns:
+        str: The path of the cached source snapshot
+
+    Raises:
+        RuntimeError: If in offline mode and the snapshot is not cached
+        subprocess.CalledProcessError: If the snapshot could not be downloaded
+    """
+    tag = str(tag)
+    filename = get_snapshot_filename(name, tag)
+    snapshot_dir = os.path.join(get_cache_directory(), "sources")
+    snapshot_path = os.path.join(snapshot_dir, filename)
+
+    with _get_snapshot_lock(filename):
+        if os.path.isfile(snapshot_path):
+            logger.debug(f"Using cached source snapshot '{snapshot_path}'")
+            return snapshot_path
+        if is_offline_mode():
+            raise RuntimeError(f"Offline mode: No cached source snapshot '{filename}' available.")
+
+        logger.info(f"Download source snapshot '{filename}' from '{repo_url}'")
+        os.makedirs(snapshot_dir, exist_ok=True)
+        try:
+            _create_snapshot(name, repo_url, tag, snapshot_path)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Could not download source snapshot '{filename}': {e.stderr.decode('utf-8').strip()}")
+            raise
+        return snapshot_path
+
+
+def get_source_snapshots(sources: List[Tuple[str, str, str]]) -> Dict[str, str]:
+    """Get the source snapshots of several packages concurrently, see 'get_source_snapshot()'.
+
+    Args:
+        sources (List[Tuple[str, str, str]]): List of (name, repo_url, tag) tuples
+
+    Returns:
+        Dict[str, str]: The path of the cached source snapshot of each package name
+    """
+    if len(sources) == 0:
+        return dict()
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        futures = {name: executor.submit(get_source_snapshot, name, url, tag) for name, url, tag in sources}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def get_source_snapshot_paths(dockerfile: str) -> Dict[str, str]:
+    """Get the cached source snapshots that the given Dockerfile adds from its build context.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+
+    Returns:
+        Dict[str, str]: The path of the cached snapshot of each filename, e.g. {'CMake-v3.29.3.tar.gz': '/...'}
+
+    Raises:
+        RuntimeError: If a snapshot is not in the host-side cache
+    """
+    snapshot_dir = os.path.join(get_cache_directory(), "sources")
+    snapshot_paths = dict()
+    for filename in _SNAPSHOT_PATTERN.findall(dockerfile):
+        snapshot_path = os.path.join(snapshot_dir, filename)
+        if not os.path.isfile(snapshot_path):
+            raise RuntimeError(f"Source snapshot '{filename}' is not cached.")
+        snapshot_paths[filename] = snapshot_path
+    return snapshot_paths
+
+
+def copy_source_snapshots(dockerfile: str, dir_path: str) -> None:
+    """Copy the source snapshots that the given Dockerfile adds into its build context.
+
+    The snapshots are hard-linked if possible, so several build contexts on the same host share one copy.
+
+    Args:
+        dockerfile (str): The generated Dockerfile
+        dir_path (str): The path of the build context
+
+    Raises:
+        RuntimeError: If a snapshot is not in the host-side cache
+    """
+    snapshot_paths = get_source_snapshot_paths(dockerfile)
+    if len(snapshot_paths) == 0:
+        return
+    context_dir = os.path.join(dir_path, SOURCE_SNAPSHOT_FOLDER)
+    os.makedirs(context_dir, exist_ok=True)
+    for filename, snapshot_path in snapshot_paths.items():
+        target_path = os.path.join(context_dir, filename)
+        try:
+            os.link(snapshot_path, target_path)
+        except OSError:
+            shutil.copy2(snapshot_path, target_path)
+        logger.debug(f"Copied source snapshot '{filename}' into '{context_dir}'")
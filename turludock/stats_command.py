@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from loguru import logger
+from rich.console import Console
+from rich.table import Table
+
+from turludock.build_history import (
+    get_build_history_path,
+    get_recent_builds,
+    get_slowest_steps,
+    get_successful_builds,
+    percentile,
+)
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    """Format a duration, e.g. '0:01:05'.
+
+    Args:
+        seconds (Optional[float]): The duration in seconds
+
+    Returns:
+        str: The formatted duration, '-' if unknown
+    """
+    if seconds is None:
+        return "-"
+    return str(timedelta(seconds=int(seconds)))
+
+
+def _format_share(share: Optional[float]) -> str:
+    """Format a share between 0 and 1 as percentage.
+
+    Args:
+        share (Optional[float]): The share
+
+    Returns:
+        str: The formatted percentage, '-' if unknown
+    """
+    if share is None:
+        return "-"
+    return f"{share * 100:.0f}%"
+
+
+def _format_size(size: Optional[int]) -> str:
+    """Format an image size in bytes, e.g. '4.21 GB'.
+
+    Args:
+        size (Optional[int]): The size in bytes
+
+    Returns:
+        str: The formatted size, '-' if unknown
+    """
+    if size is None:
+        return "-"
+    if size >= 1e9:
+        return f"{size / 1e9:.2f} GB"
+    return f"{size / 1e6:.0f} MB"
+
+
+def print_build_stats(last_n: int, top: int) -> None:
+    """Print statistics of the previous builds as recorded in the build history.
+
+    Prints the p50/p95 build times and the median image size per configuration and build profile, the slowest
+    build steps and the most recent builds.
+
+    Args:
+        last_n (int): Only consider the last N builds. The build times are based on the last N successful
+            builds of each configuration.
+        top (int): The number of slowest build steps to print
+    """
+    recent_builds = get_recent_builds(last_n)
+    if len(recent_builds) == 0:
+        logger.info(f"No builds recorded yet in '{get_build_history_path()}'.")
+        return
+    console = Console()
+
+    # Build times per configuration
+    table = Table(title=f"Build times (last {last_n} successful builds per configuration and profile)")
+    table.add_column("Configuration")
+    table.add_column("Profile")
+    table.add_column("Builds", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("Image size (p50)", justify="right")
+    for (config_name, build_profile), builds in sorted(get_successful_builds(last_n).items()):
+        durations = [build["duration"] for build in builds]
+        image_sizes = [build["image_size"] for build in builds if build["image_size"] is not None]
+        table.add_row(
+            config_name,
+            build_profile,
+            str(len(builds)),
+            _format_duration(percentile(durations, 50)),
+            _format_duration(percentile(durations, 95)),
+            _format_size(percentile(image_sizes, 50) if image_sizes else None),
+        )
+    print("")
+    console.print(table)
+
+    # Slowest steps, cache hits are not counted in the timings
+    table = Table(title=f"Slowest build steps (last {last_n} builds)", expand=True)
+    table.add_column("Instruction", overflow="ellipsis", no_wrap=True, ratio=1)
+    table.add_column("Runs", justify="right", min_width=4)
+    table.add_column("Mean", justify="right", min_width=7)
+    table.add_column("Max", justify="right", min_width=7)
+    table.add_column("Cache hits", justify="right", min_width=10)
+    for step in get_slowest_steps(last_n, top):
+        table.add_row(
+            step["instruction"],
+            str(step["runs"]),
+            _format_duration(step["mean_seconds"]),
+            _format_duration(step["max_seconds"]),
+            _format_share(step["cache_hit_rate"]),
+        )
+    print("")
+    console.print(table)
+
+    # Most recent builds
+    table = Table(title=f"Last {last_n} builds")
+    table.add_column("Started", no_wrap=True)
+    table.add_column("Configuration")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    table.add_column("Cache hits", justify="right")
+    table.add_column("Image size", justify="right")
+    for build in recent_builds:
+        status = "[green]success" if build["status"] == "success" else "[red]" + build["status"]
+        table.add_row(
+            datetime.fromtimestamp(build["start_time"]).strftime("%Y-%m-%d %H:%M"),
+            build["config_name"],
+            status,
+            _format_duration(build["duration"]),
+            _format_share(build["cache_hit_rate"]),
+            _format_size(build["image_size"]),
+        )
+    print("")
+    console.print(table)
@@ -0,0 +1,115 @@
+import importlib.resources
+import threading
+from string import Template
+from typing import Dict, FrozenSet, Mapping, Optional
+
+from loguru import logger
+
+# Packages holding the Dockerfile templates, mapped to the prefix of their template names
+_TEMPLATE_PACKAGES = {
+    "turludock.assets.dockerfile_templates": "",
+    "turludock.assets.dockerfile_templates.nvidia": "nvidia/",
+}
+
+# The compiled templates by name, e.g. 'cmake.txt' or 'nvidia/cuda_base.txt'. Loaded once, see '_get_registry()'.
+_templates: Optional[Dict[str, Template]] = None
+_placeholders: Dict[str, FrozenSet[str]] = dict()
+_registry_lock = threading.Lock()
+
+
+def _load_templates() -> Dict[str, Template]:
+    """Load and compile all Dockerfile templates of the template packages.
+
+    Returns:
+        Dict[str, Template]: The compiled templates by name
+    """
+    templates = dict()
+    for package, prefix in _TEMPLATE_PACKAGES.items():
+        for resource in importlib.resources.files(package).iterdir():
+            if resource.is_file() and resource.name.endswith(".txt"):
+                templates[prefix + resource.name] = Template(resource.read_text(encoding="utf-8"))
+    logger.debug(f"Loaded {len(templates)} Dockerfile templates")
+    return templates
+
+
+def _get_registry() -> Dict[str, Template]:
+    """Get the compiled templates, loading them on first use.
+
+    Returns:
+        Dict[str, Template]: The compiled templates by name
+    """
+    global _templates
+    if _templates is None:
+        with _registry_lock:
+            if _templates is None:
+                _templates = _load_templates()
+    return _templates
+
+
+def get_template(name: str) -> Template:
+    """Get a compiled Dockerfile template.
+
+    Args:
+        name (str): The name of the template, e.g. 'cmake.txt' or 'nvidia/cuda_base.txt'
+
+    Returns:
+        Template: The compiled template
+
+    Raises:
+        KeyError: If the template does not exist
+    """
+    registry = _get_registry()
+    if name not in registry:
+        raise KeyError(f"Unknown Dockerfile template '{name}'")
+    return registry[name]
+
+
+def get_template_text(name: str) -> str:
+    """Get the raw text of a Dockerfile template, i.e. without substituting any placeholder.
+
+    Args:
+        name (str): The name of the template
+
+    Returns:
+        str: The text of the template
+    """
+    return get_template(name).template
+
+
+def get_placeholders(name: str) -> FrozenSet[str]:
+    """Get the placeholders of a Dockerfile template, i.e. the keys its mapping needs.
+
+    Args:
+        name (str): The name of the template
+
+    Returns:
+        FrozenSet[str]: The names of the placeholders, e.g. {'cmake_version'}
+    """
+    if name not in _placeholders:
+        template = get_template(name)
+        placeholders = set()
+        for match in template.pattern.finditer(template.template):
+            placeholder = match.group("named") or match.group("braced")
+            if placeholder is not None:
+                placeholders.add(placeholder)
+        _placeholders[name] = frozenset(placeholders)
+    return _placeholders[name]
+
+
+def render_template(name: str, mapping: Mapping[str, str]) -> str:
+    """Substitute the placeholders of a Dockerfile template.
+
+    Args:
+        name (str): The name of the template
+        mapping (Mapping[str, str]): The value of each placeholder
+
+    Returns:
+        str: The rendered template
+
+    Raises:
+        ValueError: If the mapping misses placeholders of the template
+    """
+    missing = get_placeholders(name) - mapping.keys()
+    if missing:
+        raise ValueError(f"Template '{name}' is missing values for: {sorted(missing)}")
+    return get_template(name).substitute(mapping)
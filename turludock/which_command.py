@@ -1,33 +1,42 @@
-import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 from loguru import logger
 from termcolor import colored
 
 import turludock.constants as constants
-from turludock.config_parser import check_dockerfile_config, get_config_filename, print_configuration
-from turludock.helper_functions import get_ubuntu_version, is_ros_version_supported, list_packaged_yaml_files
-from turludock.yaml_load import load_cuda_config, load_cudnn_config, load_default_image_configuration
+import turludock.default_image_config as default_image_config
+from turludock.config_parser import check_dockerfile_config, print_configuration
+from turludock.cuda_matrix import get_cuda_matrix
+from turludock.helper_functions import get_ubuntu_version, is_ros_version_supported
 
 
-def _explain_default_image_config(yaml_filename: str) -> None:
-    """Explains with one line in the terminal the current configuration
+def _validate_pre_configs(config_names: List[str]) -> Dict[str, str]:
+    """Fully validate the given pre-configurations, including the remote version checks, in parallel.
 
     Args:
-        yaml_filename (str): The name of the YAML file configuration to explain.
-    """
-    # Load yaml configuration file
-    yaml_config = load_default_image_configuration(yaml_filename)
+        config_names (List[str]): The names of the pre-configurations to validate
 
-    # Check if config is valid
-    # TODO(ATA): Do we really need this check? It is slowing down the command
-    check_dockerfile_config(yaml_config)
+    Returns:
+        Dict[str, str]: The error of each invalid pre-configuration. Empty if all are valid.
+    """
+    with ThreadPoolExecutor(max_workers=len(config_names)) as executor:
+        futures = {
+            config_name: executor.submit(check_dockerfile_config, default_image_config.get_yaml_config(config_name))
+            for config_name in config_names
+        }
 
-    # Print configuration to terminal
-    print_configuration(yaml_config)
+    errors = dict()
+    for config_name, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            errors[config_name] = str(e)
+    return errors
 
 
 def _sort_file_list_based_on_release_date(config_files: list) -> list:
-    """Short the list of config files based on their release date and then alphabetically
+    """Short the list of config files or config names based on their release date and then alphabetically
 
     Important!!! For this to work all presets need to start with "<ros_codename>_"!
     Otherwise this is not able to infer the release date and in turn sort those.
@@ -76,21 +85,43 @@ def _sort_file_list_based_on_release_date(config_files: list) -> list:
     return sorted_list
 
 
-def list_pre_configs() -> None:
-    """List in the terminal available image pre-configurations as provided by our module."""
+def list_pre_configs(validate: bool = False) -> bool:
+    """List in the terminal available image pre-configurations as provided by our module.
+
+    Listing is a purely local operation based on the preset index. The remote version checks of the
+    pre-configurations only run if requested.
+
+    Args:
+        validate (bool, optional): Whether to also fully validate the pre-configurations. Defaults to False.
+
+    Returns:
+        bool: False if a pre-configuration is invalid, True otherwise, also if they have not been validated
+    """
+    preset_index = default_image_config.get_preset_index()
+    config_names = _sort_file_list_based_on_release_date(list(preset_index))
+
+    errors = dict()
+    if validate:
+        errors = _validate_pre_configs(config_names)
+
     print("")
     logger.info("Available pre-configurations:")
-    yaml_config_files = list_packaged_yaml_files(os.path.join("assets", "default_image_configurations"))
-    sorted_yaml_config_files = _sort_file_list_based_on_release_date(yaml_config_files)
+    for config_name in config_names:
+        print_configuration(preset_index[config_name])
 
-    for yaml_config_full_path in sorted_yaml_config_files:
-        yaml_filename: str = get_config_filename(yaml_config_full_path)
-        _explain_default_image_config(yaml_filename)
+    if validate:
+        print("")
+        if errors:
+            for config_name, error in errors.items():
+                logger.error(f"Pre-configuration '{config_name}' is invalid: {error}")
+        else:
+            logger.info(f"All {len(config_names)} pre-configurations are valid.")
 
     config_name: str = "CONFIG_NAME"
     cmd_example: str = colored(f"turludock build -e {config_name}", attrs=["bold"])
     print("")
     print(f"> You can directly build a default docker image with: {cmd_example}")
+    return not errors
 
 
 def list_supported_ros_versions() -> None:
@@ -115,23 +146,19 @@ def list_cuda_support(ros_codename: str) -> None:
         if not is_ros_version_supported(ros_codename):
             return
 
-        # Load CUDA and cuDNN configs
-        cuda_config = load_cuda_config()
-        cudnn_config = load_cudnn_config()
+        # Query the CUDA/cuDNN matrix
+        cuda_matrix = get_cuda_matrix()
 
         # Find which ones we support
         found_supported = False
         ubuntu_version = get_ubuntu_version(ros_codename)
         print("")
         logger.info(f"Supported versions for Ubuntu {ubuntu_version['semantic']} ({ros_codename}):")
-        for cuda_version in cuda_config:
-            if ubuntu_version["flat"] in cuda_config[cuda_version]:
-                logger.info(f"*CUDA: {cuda_version}")
-                found_supported = True
-                for cudnn_version in cudnn_config:
-                    if ubuntu_version["flat"] in cudnn_config[cudnn_version]:
-                        if cudnn_config[cudnn_version][ubuntu_version["flat"]]:
-                            logger.info(f"*CUDA: {cuda_version} | cuDNN: {cudnn_version}")
+        for cuda_version in cuda_matrix.get_supported_cuda_versions(ubuntu_version["flat"]):
+            logger.info(f"*CUDA: {cuda_version}")
+            found_supported = True
+            for cudnn_version in cuda_matrix.get_compatible_cudnn_versions(cuda_version, ubuntu_version["flat"]):
+                logger.info(f"*CUDA: {cuda_version} | cuDNN: {cudnn_version}")
         if not found_supported:
             logger.warning(f"No supported CUDA/cuDNN version for ROS {ros_codename.capitalize()} at this point.")
     except Exception:
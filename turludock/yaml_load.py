@@ -1,7 +1,6 @@
 import importlib.resources
 from typing import Any
 
-import yaml
 from loguru import logger
 
 
@@ -15,6 +14,9 @@ def load_yaml_file(file_path: str) -> dict:
     Returns:
         dict: The parsed YAML data as a dictionary.
     """
+    # Imported lazily, since it is only needed by the sub-commands that actually read configurations
+    import yaml
+
     try:
         with open(file_path, "r", encoding="utf-8") as yaml_file:
             yaml_data = yaml.safe_load(yaml_file)
@@ -41,6 +43,8 @@ def load_packaged_yaml(package: str, yaml_file: str) -> dict[str, Any]:
     Returns:
         dict[str, Any]: The parsed YAML data as a dictionary.
     """
+    import yaml
+
     try:
         with importlib.resources.open_text(package, yaml_file) as f:
             return yaml.safe_load(f)